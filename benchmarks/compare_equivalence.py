@@ -0,0 +1,354 @@
+"""Differential equivalence and speed check of the comparison engines
+
+Generates product tables, fuzzes them (missing values, IDs stored as int,
+float and zero-padded text, duplicate IDs, reordered, new and changed rows)
+and runs every database comparison path and the file comparison on them:
+
+    sequential  DataComparator._compare_sequential (db_compare default)
+    sharded     match_sharded + _apply_match_plan (db_compare shards > 1)
+    single      match_frames + _apply_match_plan (merge_feeds)
+    in-memory   DataComparator.compare_db_frames
+    gui         logic.row_status.apply_feed (the GUI database comparison)
+    diff        find_differences (file comparison)
+
+The references are frozen copies of the original algorithms (baseline_*
+below), which must never be changed to follow the code under test. They
+know no comparison rules and match IDs by plain equality, so they are run
+on "baseline" cases: no rules and no IDs stored as text. New and updated
+products (with the columns that differ), the match count and the
+resulting database must agree with baseline_db_compare, the per-row
+outcome of the GUI path with baseline_gui_compare and the file differences
+with baseline_find_differences; timings are reported as speedups over them.
+
+Cases with comparison rules or IDs stored as text have no baseline: there
+the engines are only checked against each other (sequential as pivot).
+
+    python benchmarks/compare_equivalence.py --cases 5 --rows 1000
+    python benchmarks/compare_equivalence.py --rows 50000 --cases 1 --output results/equivalence.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.compare_rules import CompareRules  # noqa: E402
+from logic.diff_logic import DataComparator, find_differences  # noqa: E402
+from logic.product_index import ProductIndex, normalize_key  # noqa: E402
+from logic.row_status import apply_feed  # noqa: E402
+from logic.sharded_match import match_frames, match_sharded  # noqa: E402
+
+
+EXTENDED_RULES = {
+    'plain': {},
+    'tolerant': {'default': {'trim': True, 'nan_equal': True},
+                 'columns': {'价格': {'tolerance': 0.01}}, 'ignore': ['备注']}
+}
+
+
+def make_catalog(rows, rng):
+    return pd.DataFrame({
+        '名称': [f"商品{i}" for i in range(rows)],
+        '商品ID': np.arange(100000, 100000 + rows),
+        '类别': rng.choice(['食品', '日用', '家电', '服装'], rows),
+        '价格': rng.integers(100, 100000, rows) / 100,
+        '库存': rng.integers(0, 500, rows),
+        '品牌': rng.choice(['A', 'B', 'C', None], rows),
+        '备注': rng.choice(['', '促销', '新品'], rows),
+    })
+
+
+def fuzz_case(rows, rng, baseline=False):
+    """(db_df, input_df) pair exercising the awkward inputs
+
+    baseline=True keeps every ID numeric, the inputs the baseline handles.
+    """
+    db = make_catalog(rows, rng)
+    feed = db.sample(frac=rng.uniform(0.5, 1.0), random_state=int(rng.integers(1 << 31))).copy()
+
+    # Changed values, including to and from missing
+    changed = feed.sample(frac=0.1, random_state=1).index
+    feed.loc[changed, '价格'] = feed.loc[changed, '价格'] + rng.choice([0.001, 0.5, 3.0], len(changed))
+    feed.loc[changed[::3], '品牌'] = None
+    feed.loc[changed[1::4], '库存'] = np.nan
+    feed.loc[changed[2::5], '备注'] = ' 促销 '
+
+    # New products and duplicate IDs in the feed (same and different values)
+    new = make_catalog(max(rows // 20, 1), rng)
+    new['商品ID'] += rows + 1000
+    repeats = feed.sample(n=max(rows // 50, 1), random_state=2).copy()
+    repeats['价格'] = repeats['价格'] * 2
+    feed = pd.concat([feed, new, repeats, new.head(3)], ignore_index=True)
+
+    # Duplicate IDs in the DB and IDs stored in different forms
+    db = pd.concat([db, db.sample(n=max(rows // 100, 1), random_state=3)], ignore_index=True)
+    db['商品ID'] = db['商品ID'].astype(object)
+    db.loc[db.index[::7], '商品ID'] = db.loc[db.index[::7], '商品ID'].astype(float)
+    feed['商品ID'] = feed['商品ID'].astype(object)
+    if not baseline:
+        feed.loc[feed.index[::5], '商品ID'] = [f"00{v}" for v in feed.loc[feed.index[::5], '商品ID']]
+        feed.loc[feed.index[1::9], '商品ID'] = [str(float(v)) for v in feed.loc[feed.index[1::9], '商品ID']]
+    return db.reset_index(drop=True), feed.sample(frac=1, random_state=4).reset_index(drop=True)
+
+
+# Frozen copies of the original algorithms (baseline DataComparator.db_compare,
+# _find_differences and the GUI comparison loop), minus file I/O, logging and
+# report text. DataFrame.append is written as the equivalent pd.concat, and
+# the update of the matching DB rows assigns the row's values to each of them:
+# the original db_df.loc[mask] = row raises on mixed-dtype frames in pandas 1.5.
+
+def baseline_db_compare(db_df, input_df):
+    db_df = db_df.copy()
+    updates = []
+    new_items = []
+    matches = 0
+
+    for idx, row in input_df.iterrows():
+        product_id = row.iloc[1]  # Column B is product ID
+        db_row = db_df[db_df.iloc[:, 1] == product_id]
+
+        if db_row.empty:
+            # New product
+            new_items.append(row)
+            db_df = pd.concat([db_df, row.to_frame().T], ignore_index=True)
+        else:
+            # Compare product info
+            diff = baseline_compare_rows(db_row.iloc[0], row)
+            if diff:
+                updates.append({
+                    'product_id': product_id,
+                    'differences': diff,
+                    'old_data': db_row.iloc[0],
+                    'new_data': row
+                })
+                # Update database
+                mask = db_df.iloc[:, 1] == product_id
+                db_df.loc[mask, :] = [row.to_numpy()] * int(mask.sum())
+            else:
+                matches += 1
+    return db_df, new_items, updates, matches
+
+
+def baseline_compare_rows(row1, row2):
+    diffs = []
+    for col in row1.index:
+        if row1[col] != row2[col]:
+            diffs.append({
+                'column': col,
+                'old_value': row1[col],
+                'new_value': row2[col]
+            })
+    return diffs
+
+
+def baseline_find_differences(df1, df2):
+    diffs = []
+    for idx in range(len(df1)):
+        row1 = df1.iloc[idx]
+        row2 = df2.iloc[idx]
+
+        diff_cols = []
+        for col in df1.columns:
+            if row1[col] != row2[col]:
+                diff_cols.append(col)
+
+        if diff_cols:
+            diffs.append((idx + 2, tuple(diff_cols)))
+    return diffs
+
+
+def baseline_gui_compare(db_df, compare_df):
+    """(db_df, {DB row: (status, changed columns)})"""
+    db_df = db_df.copy()
+    styles = {}
+    for idx, row in compare_df.iterrows():
+        # 跳过表头行(索引0)
+        if idx == 0 and all(isinstance(val, str) for val in row.values):
+            continue
+
+        product_id = row.iloc[1]  # B列商品ID
+        match = db_df[db_df.iloc[:, 1] == product_id]  # 在数据库B列查找匹配
+
+        if match.empty:
+            new_row = row.to_frame().T
+            db_df = pd.concat([db_df, new_row], ignore_index=True)
+            styles[len(db_df) - 1] = ('new', ())
+        else:
+            match_idx = match.index[0]
+            diff_cols = []
+
+            for col in compare_df.columns:
+                if col != '比对报告' and row[col] != db_df.at[match_idx, col]:
+                    diff_cols.append(col)
+
+            if diff_cols:
+                for col in diff_cols:
+                    db_df.at[match_idx, col] = row[col]
+                styles[match_idx] = ('changed', tuple(diff_cols))
+            else:
+                styles[match_idx] = ('unchanged', ())
+    return db_df, styles
+
+
+def summarize(db_df, new_items, updates, matches):
+    """Order-independent form of a comparison result"""
+    return {
+        'new': Counter(normalize_key(row.iloc[1]) for row in new_items),
+        'updates': Counter((normalize_key(u['product_id']), tuple(sorted(d['column'] for d in u['differences'])))
+                           for u in updates),
+        'matches': matches,
+        'db': canonical_table(db_df)
+    }
+
+
+def canonical_table(df):
+    """Rows as sorted text tuples, so row order and int/float storage do not matter"""
+    def cell(v):
+        if v is None or (isinstance(v, float) and np.isnan(v)):
+            return ''
+        key = normalize_key(v)
+        return key if key is not None else ''
+    return sorted(tuple(cell(v) for v in row) for row in df.itertuples(index=False))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def db_engines(db_df, input_df, rules, shards):
+    comparator = DataComparator(CompareRules.from_dict(rules))
+    cols = list(input_df.columns)
+    return {
+        'sequential': lambda: comparator._compare_sequential(db_df.copy(), input_df, cols),
+        'sharded': lambda: comparator._apply_match_plan(
+            db_df.copy(), input_df, match_sharded(db_df, input_df, cols, rules, shards)),
+        'single': lambda: comparator._apply_match_plan(
+            db_df.copy(), input_df, match_frames(db_df, input_df, cols, rules)),
+        'in-memory': lambda: _frames_result(comparator.compare_db_frames(db_df, input_df))
+    }
+
+
+def _frames_result(result):
+    return result['db'], result['new_items'], result['updates'], result['matches']
+
+
+def gui_engine(db_df, input_df, rules):
+    compiled = CompareRules.from_dict(rules).compile(list(input_df.columns))
+    out, status, _, _ = apply_feed(db_df.copy(), input_df, compiled, ProductIndex(db_df.iloc[:, 1]))
+    styles = {row: (label, tuple(status.changed_columns(row)) if label == 'changed' else ())
+              for row, label in status.styles()}
+    return out, styles
+
+
+def summarize_gui(db_df, styles):
+    return {'db': canonical_table(db_df), 'rows': sorted(styles.items())}
+
+
+def compare_results(results, pivot, fields):
+    return [f"{name}: {field}" for name in results if name != pivot
+            for field in fields if results[name][field] != results[pivot][field]]
+
+
+def run_baseline_case(db_df, input_df, shards):
+    """Every engine against the frozen baseline algorithms (no rules, numeric IDs)"""
+    engines = {'baseline': lambda: baseline_db_compare(db_df, input_df)}
+    engines.update(db_engines(db_df, input_df, {}, shards))
+    results, times = {}, {}
+    for name, engine in engines.items():
+        times[f"db/{name}"], result = timed(engine)
+        results[name] = summarize(*result)
+    mismatches = compare_results(results, 'baseline', ('new', 'updates', 'matches', 'db'))
+
+    gui = {}
+    times['gui/baseline'], result = timed(lambda: baseline_gui_compare(db_df, input_df))
+    gui['baseline'] = summarize_gui(*result)
+    times['gui/apply_feed'], result = timed(lambda: gui_engine(db_df, input_df, {}))
+    gui['apply_feed'] = summarize_gui(*result)
+    mismatches += compare_results(gui, 'baseline', ('rows', 'db'))
+
+    other = changed_copy(db_df, np.random.default_rng(len(db_df)))
+    times['diff/baseline'], expected = timed(lambda: baseline_find_differences(db_df, other))
+    compiled = CompareRules().compile(list(db_df.columns))
+    times['diff/vectorized'], diffs = timed(lambda: find_differences(db_df, other, 'a', 'b', compiled))
+    got = [(d['row'], tuple(item['column'] for item in d['differences'])) for d in diffs]
+    if got != expected:
+        mismatches.append("find_differences")
+    return mismatches, times
+
+
+def run_extended_case(db_df, input_df, rules, shards):
+    """Engines against each other where the baseline has no counterpart"""
+    results = {name: summarize(*engine()) for name, engine in db_engines(db_df, input_df, rules, shards).items()}
+    return compare_results(results, 'sequential', ('new', 'updates', 'matches', 'db'))
+
+
+def changed_copy(db_df, rng):
+    """db_df with some prices and brands changed (same length: the baseline
+    indexes the second table by the rows of the first)"""
+    other = db_df.copy()
+    picked = rng.choice(len(other), size=max(len(other) // 10, 1), replace=False)
+    other.loc[picked, '价格'] = other.loc[picked, '价格'] + 1
+    other.loc[picked[::2], '品牌'] = None
+    return other
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the timings and failures as JSON")
+    args = parser.parse_args()
+    # DataFrame.append and object-dtype factorize deprecations would drown the output
+    warnings.simplefilter('ignore', FutureWarning)
+
+    rng = np.random.default_rng(args.seed)
+    failures = []
+    timings = defaultdict(list)
+    for case in range(args.cases):
+        db_df, input_df = fuzz_case(args.rows, rng, baseline=True)
+        mismatches, times = run_baseline_case(db_df, input_df, args.shards)
+        for name, t in times.items():
+            timings[name].append(t)
+        label = f"case {case} (baseline)"
+        failures.extend(f"{label}: {m} differs from the baseline" for m in mismatches)
+        print(f"{label}: {'OK' if not mismatches else 'MISMATCH'}")
+
+        db_df, input_df = fuzz_case(args.rows, rng)
+        for rule_name, rules in EXTENDED_RULES.items():
+            mismatches = run_extended_case(db_df, input_df, rules, args.shards)
+            label = f"case {case} ({rule_name}, all ID forms)"
+            failures.extend(f"{label}: {m} differs from sequential" for m in mismatches)
+            print(f"{label}: {'OK' if not mismatches else 'MISMATCH'}")
+
+    print(f"\n{args.cases} cases, {args.rows} rows; speedups over the baseline algorithms")
+    summary = {}
+    for group in ('db', 'gui', 'diff'):
+        ref = sum(timings[f"{group}/baseline"])
+        for key in sorted(k for k in timings if k.startswith(group + '/')):
+            total = sum(timings[key])
+            summary[key] = {'seconds': total, 'speedup': ref / total if total else None}
+            print(f"  {key:<16} {total:8.3f}s  x{ref / total:.2f}")
+    for failure in failures:
+        print(failure)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'timings': summary, 'failures': failures}, f,
+                      indent=2, ensure_ascii=False)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
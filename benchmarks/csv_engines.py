@@ -0,0 +1,92 @@
+"""Check and time the CSV readers of utils.table_reader
+
+Writes product catalogs with the awkward cells our feeds contain (ISO dates
+and times, empty cells, "None"/"NA" text, booleans, zero-padded codes) in
+UTF-8 and GB18030 with different delimiters, reads them with read_csv
+(pyarrow when installed) and checks every result, whole and projected,
+against pd.read_csv.
+
+    python benchmarks/csv_engines.py --rows 5000 50000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.table_reader import _pyarrow_csv, read_csv, sniff_csv  # noqa: E402
+
+
+def make_catalog(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '名称': [f"商品{i}" for i in range(rows)],
+        '商品ID': np.arange(100000, 100000 + rows),
+        '类别': rng.choice(['食品', '日用', '家电', '服装'], rows),
+        '价格': rng.integers(100, 100000, rows) / 100,
+        '库存': rng.choice([None, *range(50)], rows),
+        '品牌': rng.choice(['A', 'B', 'None', 'NA', None], rows),
+        '条码': [f"0{n:012d}" for n in rng.integers(0, 10 ** 12, rows)],
+        '上架日期': rng.choice(['2024-01-05', '2024-02-29', None], rows),
+        '更新时间': rng.choice(['2024-01-05 12:00:00', '2024-03-01T08:30', None], rows),
+        '时段': rng.choice(['08:00:00', '20:30:00'], rows),
+        '在售': rng.choice(['true', 'False', None], rows),
+        '备注': rng.choice(['', '促销', '新品'], rows),
+        '空列': [None] * rows,
+    })
+
+
+def differences(expected, got):
+    """Description of how two frames differ, or None"""
+    if list(expected.columns) != list(got.columns):
+        return f"columns {list(got.columns)}"
+    for col in expected.columns:
+        if expected[col].dtype != got[col].dtype:
+            return f"{col}: dtype {got[col].dtype}, expected {expected[col].dtype}"
+        if not expected[col].equals(got[col]):
+            return f"{col}: values differ"
+        # equals() treats None and NaN alike; the comparison engines do not
+        if expected[col].map(type).tolist() != got[col].map(type).tolist():
+            return f"{col}: value types differ (e.g. None for NaN)"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000, 50000])
+    args = parser.parse_args()
+    print(f"pyarrow: {'installed' if _pyarrow_csv() is not None else 'not installed (pandas only)'}")
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            df = make_catalog(rows)
+            for encoding, sep in (('utf-8', ','), ('gb18030', ';'), ('utf-8-sig', '\t')):
+                path = os.path.join(tmp, f"catalog_{rows}.csv")
+                df.to_csv(path, index=False, encoding=encoding, sep=sep)
+                detected, delimiter = sniff_csv(path)
+                for usecols in (None, ['名称', '商品ID', '上架日期', '空列']):
+                    start = time.perf_counter()
+                    expected = pd.read_csv(path, usecols=usecols, encoding=detected, sep=delimiter)
+                    pandas_time = time.perf_counter() - start
+                    start = time.perf_counter()
+                    got = read_csv(path, usecols=usecols)
+                    reader_time = time.perf_counter() - start
+                    problem = differences(expected, got)
+                    label = f"{rows} rows, {encoding}, {sep!r}, {'projected' if usecols else 'all columns'}"
+                    print(f"{label:<45} pandas {pandas_time:.3f}s  read_csv {reader_time:.3f}s  "
+                          f"{'OK' if problem is None else 'MISMATCH'}")
+                    if problem:
+                        failures.append(f"{label}: {problem}")
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
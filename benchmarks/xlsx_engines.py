@@ -0,0 +1,79 @@
+"""Benchmark the xlsx reader engines of utils.table_reader
+
+Generates product catalogs of typical sizes, reads them with every installed
+engine (whole sheet and a key + one column projection) and checks each
+result against pd.read_excel.
+
+    python benchmarks/xlsx_engines.py --rows 5000 20000 50000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.table_reader import XLSX_ENGINES, read_xlsx  # noqa: E402
+
+
+def make_catalog(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '名称': [f"商品{i}" for i in range(rows)],
+        '商品ID': np.arange(100000, 100000 + rows),
+        '类别': rng.choice(['食品', '日用', '家电', '服装'], rows),
+        '价格': rng.integers(100, 100000, rows) / 100,
+        '库存': rng.integers(0, 500, rows),
+        '品牌': rng.choice(['A', 'B', 'C', None], rows),
+        '规格': [f"{rng.integers(1, 9)}x{rng.integers(10, 99)}" for _ in range(rows)],
+        '产地': rng.choice(['上海', '广州', '杭州'], rows),
+        '条码': [f"69{n:011d}" for n in rng.integers(0, 10 ** 11, rows)],
+        '上架日期': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D'),
+        '状态': rng.choice(['在售', '下架'], rows),
+        '备注': rng.choice(['', '促销', '新品'], rows),
+    })
+
+
+def timed(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000, 20000, 50000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            path = os.path.join(tmp, f"catalog_{rows}.xlsx")
+            make_catalog(rows).to_excel(path, index=False)
+            size = os.path.getsize(path) / 1024 / 1024
+            print(f"\n{rows} rows, {size:.1f} MB")
+            for label, usecols in (('all columns', None), ('ID + 价格', ['商品ID', '价格'])):
+                ref_time, reference = timed(lambda: pd.read_excel(path, usecols=usecols), args.repeat)
+                print(f"  {label}: pd.read_excel {ref_time:.3f}s")
+                for name in XLSX_ENGINES:
+                    try:
+                        elapsed, df = timed(lambda: read_xlsx(path, usecols, engines=[name]), args.repeat)
+                    except ImportError:
+                        print(f"    {name:<10} not installed")
+                        continue
+                    same = df.equals(reference)
+                    print(f"    {name:<10} {elapsed:.3f}s  x{ref_time / elapsed:.2f}  "
+                          f"{'identical' if same else 'DIFFERENT'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from logic.product_index import ProductIndex
+
+
+class CompareRules:
+    """Per-column comparison rules
+
+    Example data/compare_rules.json:
+        {
+            "ignore": ["备注"],
+            "default": {"trim": true},
+            "columns": {
+                "价格": {"tolerance": 0.01},
+                "名称": {"casefold": true},
+                "上架日期": {"date": true}
+            },
+            "category_column": "类别",
+            "fuzzy_match": {"block_columns": ["品牌", "类别"], "threshold": 0.85}
+        }
+
+    Supported settings: tolerance (absolute), rel_tolerance, trim, casefold,
+    date and nan_equal. Without any rules cells are compared with plain !=.
+    category_column names the column the diff statistics group changes by.
+    fuzzy_match enables matching new products by name against DB products
+    missing from the feed (see logic.fuzzy_match.FuzzyMatcher for settings).
+    """
+
+    SETTINGS = ('tolerance', 'rel_tolerance', 'trim', 'casefold', 'date', 'nan_equal')
+
+    def __init__(self, ignore=None, columns=None, default=None, category_column=None, fuzzy_match=None):
+        self.ignore = list(ignore or [])
+        self.category_column = category_column
+        self.fuzzy_match = dict(fuzzy_match) if fuzzy_match is not None else None
+        self.columns = dict(columns or {})
+        self.default = dict(default or {})
+        for spec in [self.default] + list(self.columns.values()):
+            unknown = set(spec) - set(self.SETTINGS)
+            if unknown:
+                raise ValueError(f"Unknown compare rule settings: {', '.join(sorted(unknown))}")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('ignore'), data.get('columns'), data.get('default'), data.get('category_column'),
+                   data.get('fuzzy_match'))
+
+    @classmethod
+    def load(cls, path=os.path.join('data', 'compare_rules.json')):
+        """Load rules from a JSON file; a missing file means no rules"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {'ignore': self.ignore, 'columns': self.columns, 'default': self.default,
+                'category_column': self.category_column, 'fuzzy_match': self.fuzzy_match}
+
+    def compile(self, columns):
+        """Build one vectorized predicate per compared column"""
+        predicates = {}
+        for col in columns:
+            if col in self.ignore:
+                continue
+            spec = dict(self.default)
+            spec.update(self.columns.get(col, {}))
+            predicates[col] = _build_predicate(spec)
+        return CompiledRules(predicates)
+
+
+class CompiledRules:
+    """Column predicates returning a boolean 'differs' array per column"""
+
+    def __init__(self, predicates):
+        self.predicates = predicates
+        self.columns = list(predicates)
+
+    def differs(self, left, right):
+        """Cell-wise difference mask of two equally long frames, aligned by position"""
+        result = {}
+        for col, predicate in self.predicates.items():
+            a = left[col].reset_index(drop=True)
+            b = right[col].reset_index(drop=True)
+            result[col] = predicate(a, b)
+        return pd.DataFrame(result, index=right.index, columns=self.columns)
+
+    def row_differs(self, row1, row2):
+        """Columns that differ between two rows"""
+        # One-cell Series with the rows' dtypes, as the columns of row.to_frame().T would be
+        return [col for col, predicate in self.predicates.items()
+                if predicate(pd.Series([row1[col]], dtype=row1.dtype),
+                             pd.Series([row2[col]], dtype=row2.dtype))[0]]
+
+    def align_and_diff(self, db_df, input_df, index=None):
+        """Diff every input row against its first DB match by product ID (column B)
+
+        IDs are matched by their canonical form (see ProductIndex); pass a
+        prebuilt index of db_df to skip rebuilding it. Returns (matched, mask):
+        matched flags input rows whose ID exists in the DB, mask holds the
+        per-column differences for those rows.
+        """
+        matched, _, mask = self.align(db_df, input_df, index)
+        return matched, mask
+
+    def align(self, db_df, input_df, index=None):
+        """Like align_and_diff, also returning the aligned DB rows
+
+        Returns (matched, aligned, mask); aligned holds, by position, the DB
+        row matched by each input row (arbitrary for unmatched rows).
+        """
+        db_key = db_df.columns[1]
+        if index is None:
+            index = ProductIndex(db_df.iloc[:, 1])
+        keys = input_df.iloc[:, 1]
+        positions = index.lookup(keys)
+        matched = positions >= 0
+
+        cols = [c for c in self.columns if c in input_df.columns and c in db_df.columns]
+        if len(db_df):
+            aligned = db_df.iloc[np.where(matched, positions, 0)].reset_index(drop=True)
+        else:
+            aligned = db_df.reindex(range(len(input_df)))
+        aligned[db_key] = keys.to_numpy()
+        sub = CompiledRules({c: self.predicates[c] for c in cols})
+        mask = sub.differs(aligned[cols], input_df[cols])
+        mask.loc[~matched] = False
+        return pd.Series(matched, index=input_df.index), aligned, mask
+
+
+def _normalizer(spec):
+    steps = []
+    if spec.get('trim'):
+        steps.append(lambda s: s.str.strip())
+    if spec.get('casefold'):
+        steps.append(lambda s: s.str.casefold())
+    if not steps:
+        return None
+
+    def normalize(series):
+        if series.dtype != object:
+            return series
+        out = series
+        try:
+            for step in steps:
+                out = step(out)
+        except AttributeError:
+            # No strings at all (e.g. only missing values): nothing to normalize
+            return series
+        # .str methods return NaN for non-strings: keep those values unchanged
+        return out.where(out.notna(), series)
+    return normalize
+
+
+def _not_equal(a, b):
+    """Element-wise != with the semantics of comparing the cells one by one
+
+    pandas treats None as missing and so as unequal to itself; Python (and
+    numpy on object arrays) says None == None, while NaN still differs from NaN.
+    """
+    if a.dtype == object or b.dtype == object:
+        return np.asarray(a.to_numpy(dtype=object) != b.to_numpy(dtype=object), dtype=bool)
+    return (a != b).to_numpy(dtype=bool)
+
+
+def _build_predicate(spec):
+    normalize = _normalizer(spec)
+    tolerance = spec.get('tolerance')
+    rel_tolerance = spec.get('rel_tolerance')
+    date = spec.get('date')
+    nan_equal = spec.get('nan_equal', False)
+
+    def predicate(a, b):
+        if normalize is not None:
+            a, b = normalize(a), normalize(b)
+        out = _not_equal(a, b)
+
+        if tolerance is not None or rel_tolerance is not None:
+            na = pd.to_numeric(a, errors='coerce')
+            nb = pd.to_numeric(b, errors='coerce')
+            numeric = (na.notna() & nb.notna()).to_numpy()
+            limit = np.zeros(len(na))
+            if tolerance is not None:
+                limit = limit + tolerance
+            if rel_tolerance is not None:
+                limit = limit + rel_tolerance * np.maximum(na.abs().to_numpy(), nb.abs().to_numpy())
+            close = ((na - nb).abs().to_numpy() <= limit)
+            out = np.where(numeric, ~close, out)
+
+        if date:
+            fmt = date if isinstance(date, str) else None
+            da = pd.to_datetime(a, errors='coerce', format=fmt)
+            db = pd.to_datetime(b, errors='coerce', format=fmt)
+            both = (da.notna() & db.notna()).to_numpy()
+            out = np.where(both, (da != db).to_numpy(), out)
+
+        if nan_equal:
+            out = out & ~(a.isna() & b.isna()).to_numpy()
+        return out
+
+    return predicate
@@ -1,182 +1,893 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import os
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from logic.result_cache import ResultCache
+from logic.compare_rules import CompareRules
+from logic.product_index import ProductIndex, normalize_keys
+from logic.diff_stats import DiffStats, format_statistics
+from logic.quick_estimate import estimate_changes
+from logic.fuzzy_match import FuzzyMatcher
+from logic.sharded_match import match_sharded, match_frames, STATUS_NEW, STATUS_CHANGED, STATUS_UNCHANGED, STATUS_REPEATED
+from utils.table_reader import read_header, read_table, read_buffer, projection, sheet_names, read_workbook
+from utils.profiler import RunProfiler
+
+
+_db_locks = {}  # absolute DB path -> RLock
+_db_locks_guard = threading.Lock()
+
+
+def db_lock(db_file):
+    """The lock held while a DB file is read, compared and rewritten
+
+    Every writer of a DB file (db_compare, merge_feeds, the GUI comparison,
+    folder watchers, the comparison service) takes it for the whole
+    read-compare-write, so two writers never apply their changes to the same
+    old version. It is reentrant and only covers this process.
+    """
+    with _db_locks_guard:
+        return _db_locks.setdefault(os.path.abspath(db_file), threading.RLock())
+
+
+def _profiled(method):
+    """Profile the call when PRODUCTLOGGER_PROFILE is set (see utils.profiler)"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with RunProfiler.from_env(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class DataComparator:
-    def __init__(self):
+    def __init__(self, rules=None, tables=None, row_index=False):
+        # Nothing is created on disk until a report or cache entry is written
         self.report_dir = os.path.join('results', 'compare_reports')
-        os.makedirs(self.report_dir, exist_ok=True)
+        self.cache = ResultCache()
+        self.rules = rules if rules is not None else CompareRules.load()
+        self._compiled = {}
+        # Optional TablePrefetcher: parsed tables kept in memory between runs
+        self.tables = tables
+        # Build the CSV row-offset sidecar of the inputs while reading them, so
+        # their source lines can be shown right away (utils.table_reader.source_lines)
+        self.row_index = row_index
+        
+    def _read(self, file_path, usecols=None, row_index=False):
+        """read_table, served from self.tables when the file is already parsed"""
+        if self.tables is not None:
+            df = self.tables.get(file_path, usecols)
+            if df is not None:
+                return df
+        return read_table(file_path, usecols, row_index=row_index)
         
     def validate_format(self, files):
         """Validate if multiple table files have consistent format"""
         if len(files) < 2:
             return False, "At least 2 files are required for comparison"
             
-        # Get the first file's format as baseline
-        base_df = pd.read_excel(files[0]) if files[0].endswith('.xlsx') else pd.read_csv(files[0])
-        base_columns = list(base_df.columns)
-        base_shape = base_df.shape
+        # Get the first file's format as baseline (header rows only, no full parse)
+        base_columns = read_header(files[0])
         
         for file in files[1:]:
-            df = pd.read_excel(file) if file.endswith('.xlsx') else pd.read_csv(file)
-            if list(df.columns) != base_columns:
+            columns = read_header(file)
+            if columns != base_columns:
                 return False, f"File {os.path.basename(file)} has inconsistent headers"
-            if df.shape[1] != base_shape[1]:
+            if len(columns) != len(base_columns):
                 return False, f"File {os.path.basename(file)} has inconsistent column count"
                 
         return True, "Format validation passed"
 
-    def manual_compare(self, files):
-        """Manually compare multiple files"""
+    @_profiled
+    def manual_compare(self, files, use_cache=True, columns=None):
+        """Manually compare multiple files
+
+        columns limits the comparison to the key column plus the given
+        columns; only those columns are parsed.
+        """
+        options = {'columns': list(columns) if columns else None, 'rules': self.rules.to_dict()}
+        cache_key = self.cache.make_key('manual', files, options=options) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached and os.path.exists(cached):
+                return True, "Comparison completed (inputs unchanged, cached report)", cached
+            
         is_valid, msg = self.validate_format(files)
         if not is_valid:
             return False, msg, None
             
+        try:
+            usecols = projection(read_header(files[0]), columns=columns) if columns else None
+        except ValueError as e:
+            return False, str(e), None
+            
         # Execute comparison logic
         diffs = []
-        base_df = pd.read_excel(files[0]) if files[0].endswith('.xlsx') else pd.read_csv(files[0])
+        stats = DiffStats(self.rules.category_column)
+        base_df = self._read(files[0], usecols, row_index=self.row_index)
         
         for i in range(1, len(files)):
-            comp_df = pd.read_excel(files[i]) if files[i].endswith('.xlsx') else pd.read_csv(files[i])
-            diff = self._find_differences(base_df, comp_df, files[0], files[i])
+            comp_df = self._read(files[i], usecols, row_index=self.row_index)
+            diff = self._find_differences(base_df, comp_df, files[0], files[i], stats)
             diffs.extend(diff)
             
         # Generate report
-        report = self._generate_report(diffs, 'manual')
+        report = self._generate_report(diffs, 'manual', statistics=stats.result())
+        if cache_key:
+            self.cache.put(cache_key, report)
         return True, "Comparison completed", report
         
-    def db_compare(self, db_file, input_file):
-        """Compare with database file"""
-        # Validate format
-        db_df = pd.read_excel(db_file) if db_file.endswith('.xlsx') else pd.read_csv(db_file)
-        input_df = pd.read_excel(input_file) if input_file.endswith('.xlsx') else pd.read_csv(input_file)
-        
-        if list(input_df.columns) != list(db_df.columns):
-            return False, "Input file has inconsistent headers with database", None
+    @_profiled
+    def compare_workbooks(self, files, use_cache=True, columns=None, max_workers=None):
+        """Compare whole workbooks sheet by sheet, matching sheets by name
+
+        Each sheet pair is parsed and diffed in its own worker process, which
+        reads only that sheet's part of each workbook. With max_workers=1 every
+        workbook is read in a single pass instead.
+        """
+        if len(files) < 2:
+            return False, "At least 2 files are required for comparison", None
             
-        # Execute comparison
-        updates = []
-        new_items = []
-        matches = 0
+        options = {'columns': list(columns) if columns else None, 'rules': self.rules.to_dict()}
+        cache_key = self.cache.make_key('workbook', files, options=options) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached and os.path.exists(cached):
+                return True, "Workbook comparison completed (inputs unchanged, cached report)", cached
+                
+        base_sheets = sheet_names(files[0])
+        tasks = []
+        missing = []
+        for other in files[1:]:
+            other_sheets = sheet_names(other)
+            for sheet in base_sheets:
+                if sheet in other_sheets:
+                    tasks.append((files[0], other, sheet))
+                else:
+                    missing.append({'sheet': sheet, 'missing_in': os.path.basename(other)})
+            for sheet in other_sheets:
+                if sheet not in base_sheets:
+                    missing.append({'sheet': sheet, 'missing_in': os.path.basename(files[0])})
+                    
+        rules = self.rules.to_dict()
+        if max_workers == 1 or len(tasks) <= 1:
+            books = {f: read_workbook(f, columns) for f in files}
+            results = [_diff_sheet_frames(books[base][sheet], books[other][sheet],
+                                          base, other, sheet, rules)
+                       for base, other, sheet in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(_compare_sheet, base, other, sheet, columns, rules)
+                           for base, other, sheet in tasks]
+                results = [f.result() for f in futures]
+                
+        report_data = {
+            'files': [os.path.basename(f) for f in files],
+            'sheets': results,
+            'missing_sheets': missing
+        }
+        report = self._generate_report(report_data, 'workbook')
+        if cache_key:
+            self.cache.put(cache_key, report)
+        return True, "Workbook comparison completed", report
         
-        for idx, row in input_df.iterrows():
-            product_id = row[1]  # Column B is product ID
-            db_row = db_df[db_df.iloc[:,1] == product_id]
+    @_profiled
+    def db_compare(self, db_file, input_file, use_cache=True, columns=None, shards=None):
+        """Compare with database file
+
+        columns limits the comparison to the key column (B) plus the given
+        columns. Only those columns are parsed; the full tables are loaded
+        only when the database actually has to be rewritten.
+        shards > 1 matches the feed in that many worker processes, each
+        handling the product IDs of one hash partition.
+        """
+        options = {'columns': list(columns) if columns else None, 'rules': self.rules.to_dict()}
+        cache_key = self.cache.make_key('db', [input_file], db_file, options=options) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached:
+                return True, "Database comparison completed (inputs unchanged, cached result)", cached
             
-            if db_row.empty:
-                # New product
-                new_items.append(row)
-                db_df = db_df.append(row, ignore_index=True)
-            else:
-                # Compare product info
-                diff = self._compare_rows(db_row.iloc[0], row)
-                if diff:
-                    updates.append({
-                        'product_id': product_id,
-                        'differences': diff,
-                        'old_data': db_row.iloc[0],
-                        'new_data': row
-                    })
-                    # Update database
-                    db_df.loc[db_df.iloc[:,1] == product_id] = row
-                else:
-                    matches += 1
+        with db_lock(db_file):
+            # Validate format
+            header = read_header(db_file)
+            if read_header(input_file) != header:
+                return False, "Input file has inconsistent headers with database", None
+            try:
+                usecols = projection(header, columns=columns) if columns else None
+            except ValueError as e:
+                return False, str(e), None
+            
+            db_df = self._read(db_file, usecols)
+            input_df = self._read(input_file, usecols, row_index=self.row_index)
+            if usecols is not None and self._needs_write(db_df, input_df):
+                # Rows will be added or rewritten: those need every column
+                db_df = self._read(db_file)
+                input_df = self._read(input_file)
+            
+            compare_cols = list(usecols) if usecols is not None else list(input_df.columns)
+            db_df, report = self._db_diff(db_df, input_df, compare_cols, shards)
                     
-        # Save updated database
-        if db_file.endswith('.xlsx'):
-            writer = pd.ExcelWriter(db_file, engine='openpyxl')
-            db_df.to_excel(writer, index=False)
-            writer.save()
+            # Nothing new and nothing changed: skip the rewrite entirely
+            written = bool(report['new_items'] or report['updates'])
+            if written:
+                self._write_db(db_file, db_df)
+        
+        if cache_key and not written:
+            # A written result was applied: the new DB has nothing pending from
+            # this feed, so only results that left the DB unchanged are reused
+            self.cache.put(cache_key, report)
+        return True, "Database comparison completed", report
+        
+    def compare_frames(self, frames, names=None, columns=None, sinks=()):
+        """Compare tables in memory: the first one against each of the others
+
+        frames are DataFrames, file paths or binary file-like objects. Nothing
+        is read from or written to disk beyond the given inputs unless sinks
+        are passed (see logic.sinks). Returns {'differences', 'statistics',
+        'outputs'}, outputs holding what each sink returned.
+        """
+        if len(frames) < 2:
+            raise ValueError("At least 2 tables are required for comparison")
+        names = list(names) if names else [f"table{i + 1}" for i in range(len(frames))]
+        tables = [as_frame(frame) for frame in frames]
+        header = list(tables[0].columns)
+        for name, df in zip(names[1:], tables[1:]):
+            if list(df.columns) != header:
+                raise ValueError(f"Table {name} has inconsistent headers")
+        if columns:
+            usecols = projection(header, columns=columns)
+            tables = [df[usecols] for df in tables]
+
+        stats = DiffStats(self.rules.category_column)
+        compiled = self._compile(list(tables[0].columns))
+        diffs = []
+        for name, df in zip(names[1:], tables[1:]):
+            diffs.extend(find_differences(tables[0], df, names[0], name, compiled, stats))
+        result = {'differences': diffs, 'statistics': stats.result()}
+        result['outputs'] = [sink.write('manual', result) for sink in sinks]
+        return result
+
+    def compare_db_frames(self, db_df, input_df, columns=None, shards=None, sinks=()):
+        """Compare a feed with a database table in memory
+
+        db_df and input_df are DataFrames, file paths or binary file-like
+        objects. db_df is not modified: the result holds the updated database
+        as 'db', next to the entries of a db_compare report. Nothing is
+        written unless sinks are passed (e.g. DatabaseSink, ReportSink);
+        'outputs' holds what each sink returned.
+        """
+        db_df = as_frame(db_df).copy()
+        input_df = as_frame(input_df)
+        header = list(db_df.columns)
+        if list(input_df.columns) != header:
+            raise ValueError("Input table has inconsistent headers with database")
+        compare_cols = projection(header, columns=columns) if columns else header
+        db_df, result = self._db_diff(db_df, input_df, compare_cols, shards)
+        result['db'] = db_df
+        result['outputs'] = [sink.write('db', result) for sink in sinks]
+        return result
+
+    def _db_diff(self, db_df, input_df, compare_cols, shards=None):
+        """Match a feed against the DB and apply it: (updated db_df, report)
+
+        db_df is updated in place where possible; callers that need the
+        original pass a copy.
+        """
+        # Duplicate DB IDs and IDs stored in different forms (1001.0 vs "1001")
+        # are reported up front; they are matched by their canonical form
+        db_index = ProductIndex(db_df.iloc[:, 1])
+        key_issues = {
+            'duplicate_ids': {k: [p + 2 for p in v] for k, v in db_index.duplicates().items()},
+            'key_mismatches': db_index.mismatches(ProductIndex(input_df.iloc[:, 1]))
+        }
+        total = len(input_df)
+        input_df, probable = self._split_probable_matches(db_df, input_df)
+        if probable:
+            input_df = input_df.reset_index(drop=True)
+            
+        # Execute comparison
+        stats = DiffStats(self.rules.category_column)
+        if shards and shards > 1:
+            plan = match_sharded(db_df, input_df, compare_cols, self.rules.to_dict(), shards)
+            db_df, new_items, updates, matches = self._apply_match_plan(db_df, input_df, plan, stats)
         else:
-            db_df.to_csv(db_file, index=False)
+            db_df, new_items, updates, matches = self._compare_sequential(db_df, input_df, compare_cols,
+                                                                          stats=stats)
             
-        # Generate report
         report = {
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'new_items': new_items,
             'updates': updates,
             'matches': matches,
-            'total_compared': len(input_df)
+            'total_compared': total,
+            'statistics': stats.result(),
+            'probable_matches': probable
         }
+        report.update(key_issues)
+        return db_df, report
+
+    def _split_probable_matches(self, db_df, input_df):
+        """Take feed rows that are probably DB products under a new ID out of the feed
+
+        Only runs when rules.fuzzy_match is set. Feed rows whose ID is not in
+        the DB are matched by name (see FuzzyMatcher) against DB rows whose ID
+        is not in the feed. Returns (remaining feed rows, probable matches);
+        the matched rows are reported instead of being added as new.
+        """
+        if not self.rules.fuzzy_match:
+            return input_df, []
+        db_keys = normalize_keys(db_df.iloc[:, 1])
+        input_keys = normalize_keys(input_df.iloc[:, 1])
+        unmatched = np.flatnonzero((input_keys.notna() & ~input_keys.isin(db_keys)).to_numpy())
+        missing = np.flatnonzero((db_keys.notna() & ~db_keys.isin(input_keys)).to_numpy())
+        if not len(unmatched) or not len(missing):
+            return input_df, []
+
+        pairs = FuzzyMatcher.from_dict(self.rules.fuzzy_match).match(
+            input_df.iloc[unmatched], db_df.iloc[missing])
+        if not pairs:
+            return input_df, []
+        probable = []
+        keep = np.ones(len(input_df), dtype=bool)
+        for i, j, score in pairs:
+            row, old_row = input_df.iloc[unmatched[i]], db_df.iloc[missing[j]]
+            keep[unmatched[i]] = False
+            probable.append({
+                'product_id': row.iloc[1],
+                'db_product_id': old_row.iloc[1],
+                'score': score,
+                'new_data': row,
+                'old_data': old_row
+            })
+        return input_df[keep], probable
         
+    @_profiled
+    def store_compare(self, store, input_file, columns=None):
+        """Compare a feed with a shared SQLiteProductStore instead of a DB file
+
+        Only the products in the feed are read from the store, and only new
+        and changed rows are written back, so several instances can compare
+        feeds against the same store at the same time.
+        """
+        header = read_header(input_file)
+        if store.columns() != [str(c) for c in header]:
+            return False, "Input file has inconsistent headers with database", None
+        try:
+            compare_cols = projection(header, columns=columns) if columns else list(header)
+        except ValueError as e:
+            return False, str(e), None
+
+        input_df = self._read(input_file, row_index=self.row_index)
+        stats = DiffStats(self.rules.category_column)
+        new_items, changed, matches = store.apply_feed(input_df, self._compile(compare_cols), compare_cols, stats)
+        updates = [{
+            'product_id': product_id,
+            'differences': [{'column': col, 'old_value': old_row[col], 'new_value': row[col]}
+                            for col in diff_cols],
+            'old_data': old_row,
+            'new_data': row
+        } for product_id, diff_cols, old_row, row in changed]
+
+        report = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'new_items': new_items,
+            'updates': updates,
+            'matches': matches,
+            'total_compared': len(input_df),
+            'statistics': stats.result()
+        }
         return True, "Database comparison completed", report
-        
-    def _find_differences(self, df1, df2, file1, file2):
-        """Find differences between two dataframes"""
-        diffs = []
-        for idx in range(len(df1)):
-            row1 = df1.iloc[idx]
-            row2 = df2.iloc[idx]
-            
-            diff_cols = []
-            for col in df1.columns:
-                if row1[col] != row2[col]:
-                    diff_cols.append({
-                        'column': col,
-                        'file1_value': row1[col],
-                        'file2_value': row2[col]
+
+    def quick_estimate(self, db_file, input_file, columns=None, fraction=0.05, confidence=0.95):
+        """Estimate how many feed rows are new or changed without a full comparison
+
+        Compares only a hash sample of the product IDs (the same IDs on both
+        sides) and never writes the database. Both files are read projected
+        to the ID and the compared columns (all but the ignored ones when
+        columns is not given). See logic.quick_estimate.
+        """
+        header = read_header(db_file)
+        if read_header(input_file) != header:
+            return False, "Input file has inconsistent headers with database", None
+        try:
+            usecols = projection(header, columns=columns or [c for c in header if c not in self.rules.ignore])
+        except ValueError as e:
+            return False, str(e), None
+        if not 0 < fraction <= 1:
+            return False, "Sample fraction must be between 0 and 1", None
+
+        db_df = self._read(db_file, usecols)
+        input_df = self._read(input_file, usecols)
+        compare_cols = list(usecols)
+        estimate = estimate_changes(db_df, input_df, compare_cols, self.rules.to_dict(),
+                                    fraction, confidence)
+        return True, "Quick estimate completed", estimate
+
+    @_profiled
+    def merge_feeds(self, db_file, input_files, rule='last', columns=None, shards=None):
+        """Merge several feeds into the database in one pass
+
+        All feeds are read and reduced to one row per product ID: with
+        rule='last' later files win over earlier ones (last writer), with
+        rule='first' earlier files win. Within one file the last row of an ID
+        wins, as when the file is compared on its own. The merged rows are
+        matched against the DB in a single indexed pass and the DB is written
+        once. Products whose compared values differ between feeds are listed
+        as conflicts in the report.
+        """
+        if rule not in ('last', 'first'):
+            return False, f"Unknown merge rule: {rule}", None
+        if len(input_files) < 1:
+            return False, "No input files", None
+        header = read_header(db_file)
+        for path in input_files:
+            if read_header(path) != header:
+                return False, f"File {os.path.basename(path)} has inconsistent headers with database", None
+        try:
+            compare_cols = projection(header, columns=columns) if columns else list(header)
+        except ValueError as e:
+            return False, str(e), None
+
+        with db_lock(db_file):
+            db_df = self._read(db_file)
+            feeds = [self._read(path, row_index=self.row_index) for path in input_files]
+            merged, sources, conflicts = self._resolve_feeds(feeds, input_files, compare_cols, rule)
+            total = len(merged)
+            merged, probable = self._split_probable_matches(db_df, merged)
+            if probable:
+                sources = sources[merged.index.to_numpy()]
+                merged = merged.reset_index(drop=True)
+
+            db_index = ProductIndex(db_df.iloc[:, 1])
+            key_issues = {
+                'duplicate_ids': {k: [p + 2 for p in v] for k, v in db_index.duplicates().items()},
+                'key_mismatches': db_index.mismatches(ProductIndex(merged.iloc[:, 1]))
+            }
+
+            stats = DiffStats(self.rules.category_column)
+            if shards and shards > 1:
+                plan = match_sharded(db_df, merged, compare_cols, self.rules.to_dict(), shards)
+            else:
+                plan = match_frames(db_df, merged, compare_cols, self.rules.to_dict())
+            db_df, new_items, updates, matches = self._apply_match_plan(db_df, merged, plan, stats)
+            if new_items or updates:
+                self._write_db(db_file, db_df)
+
+        names = [os.path.basename(path) for path in input_files]
+        feed_summary = []
+        for i, (name, feed) in enumerate(zip(names, feeds)):
+            won = sources == i
+            feed_summary.append({
+                'file': name,
+                'rows': len(feed),
+                'merged_rows': int(won.sum()),
+                'new': int((won & (plan.status == STATUS_NEW)).sum()),
+                'updated': int((won & (plan.status == STATUS_CHANGED)).sum())
+            })
+        for update, position in zip(updates, np.flatnonzero(plan.status == STATUS_CHANGED)):
+            update['source'] = names[sources[position]]
+
+        report = {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'rule': rule,
+            'feeds': feed_summary,
+            'conflicts': conflicts,
+            'new_items': new_items,
+            'updates': updates,
+            'matches': matches,
+            'total_compared': total,
+            'statistics': stats.result(),
+            'probable_matches': probable
+        }
+        report.update(key_issues)
+        return True, f"Merged {len(input_files)} feeds into the database", report
+
+    def _resolve_feeds(self, feeds, input_files, compare_cols, rule):
+        """One row per product ID from several feeds: (merged frame, source feed per row, conflicts)"""
+        order = range(len(feeds)) if rule == 'last' else range(len(feeds) - 1, -1, -1)
+        combined = pd.concat([feeds[i] for i in order], ignore_index=True)
+        source = np.concatenate([np.full(len(feeds[i]), i, dtype=np.int64) for i in order])
+        canonical = normalize_keys(combined.iloc[:, 1])
+        # The winning row of an ID is its last occurrence in priority order
+        keep = (~canonical.duplicated(keep='last') | canonical.isna()).to_numpy()
+
+        conflicts = []
+        keys = canonical.to_numpy()
+        present = canonical.notna().to_numpy()
+        winners = pd.Series(np.flatnonzero(keep & present), index=keys[keep & present])
+        losers = np.flatnonzero(present & ~keep)
+        if len(losers):
+            winner_rows = winners.loc[keys[losers]].to_numpy()
+            # Repeats inside one feed are not conflicts between feeds
+            across = source[losers] != source[winner_rows]
+            losers, winner_rows = losers[across], winner_rows[across]
+            if len(losers):
+                compiled = self._compile(compare_cols)
+                mask = compiled.differs(combined.iloc[winner_rows].reset_index(drop=True),
+                                        combined.iloc[losers].reset_index(drop=True)).to_numpy()
+                names = [os.path.basename(path) for path in input_files]
+                for k in np.flatnonzero(mask.any(axis=1)):
+                    w, l = winner_rows[k], losers[k]
+                    conflicts.append({
+                        'product_id': combined.iat[w, 1],
+                        'winner': names[source[w]],
+                        'overridden': names[source[l]],
+                        'differences': [{'column': col, 'winner_value': combined.at[w, col],
+                                         'overridden_value': combined.at[l, col]}
+                                        for col, d in zip(compiled.columns, mask[k]) if d]
                     })
-                    
-            if diff_cols:
-                diffs.append({
-                    'row': idx+2,  # Starting from row 2
-                    'file1': os.path.basename(file1),
-                    'file2': os.path.basename(file2),
-                    'differences': diff_cols
-                })
+
+        # Merged rows keep the feeds' own order: by file, then by row
+        picked = np.flatnonzero(keep)
+        picked = picked[np.lexsort((picked, source[picked]))]
+        return combined.iloc[picked].reset_index(drop=True), source[picked], conflicts
+
+    def _write_db(self, db_file, db_df):
+        """Write the DB (see write_table), keeping the written table warm"""
+        write_table(db_file, db_df)
+        if self.tables is not None:
+            # Keep the written table warm instead of parsing the file back
+            self.tables.put(db_file, db_df.reset_index(drop=True).infer_objects())
+
+    def _compare_sequential(self, db_df, input_df, compare_cols, only=None, stats=None):
+        """Match and diff feed rows in order, updating db_df as it goes
+
+        stats (a DiffStats) is fed with the vectorized diff of the rows
+        compared in one pass and with each row compared one by one.
+        """
+        updates = []
+        new_items = []
+        matches = 0
+        
+        # Diff all rows against their DB match in one vectorized pass. IDs that
+        # repeat in the input see the DB as updated by earlier rows, so those
+        # are compared row by row
+        compiled = self._compile(compare_cols)
+        index = ProductIndex(db_df.iloc[:, 1])
+        matched, aligned, diff_mask = compiled.align(db_df, input_df, index)
+        canonical = normalize_keys(input_df.iloc[:, 1])
+        repeated = (canonical.duplicated(keep=False) & canonical.notna()).to_numpy()
+        matched = matched.to_numpy()
+        if stats is not None and only is None:
+            vectorized = matched & ~repeated
+            stats.add(aligned[vectorized], input_df[vectorized], diff_mask[vectorized])
+        col_positions = [db_df.columns.get_loc(c) for c in compare_cols]
+        diff_cols = list(diff_mask.columns)
+        differs = diff_mask.to_numpy(dtype=bool)
+        unchanged = matched & ~repeated & ~differs.any(axis=1)
+        
+        # The other rows only touch the DB rows of their own ID: their values are
+        # written in one go at the end, and new rows appended in one concat
+        base = len(db_df)
+        pending = []
+        targets, sources = [], []
+        selected = np.arange(len(input_df)) if only is None else np.flatnonzero(only)
+        for i in selected:
+            if unchanged[i]:
+                matches += 1
+                continue
+            row = input_df.iloc[i]
+            product_id = row.iloc[1]  # Column B is product ID
+            positions = index.positions(product_id)
+            
+            if not positions:
+                # New product
+                new_items.append(row)
+                pending.append(row)
+                index.add(product_id, base + len(pending) - 1)
+                continue
                 
-        return diffs
+            # Compare product info
+            appended = positions[0] >= base
+            old_row = pending[positions[0] - base] if appended else db_df.iloc[positions[0]]
+            if repeated[i]:
+                # The key matched by canonical form, whatever form each side stores it in
+                diff = [d for d in self._compare_rows(old_row, row, compare_cols)
+                        if d['column'] != db_df.columns[1]]
+                if stats is not None:
+                    stats.add_row(old_row, row, [d['column'] for d in diff])
+            else:
+                diff = [{'column': col, 'old_value': old_row[col], 'new_value': row[col]}
+                        for col, d in zip(diff_cols, differs[i]) if d]
+            if not diff:
+                matches += 1
+                continue
+            updates.append({
+                'product_id': product_id,
+                'differences': diff,
+                'old_data': old_row,
+                'new_data': row
+            })
+            # Update database (every row carrying this ID)
+            if appended:
+                # Only the first row of a new ID is appended
+                updated = old_row.copy()
+                updated[compare_cols] = row[compare_cols].values
+                pending[positions[0] - base] = updated
+            elif repeated[i]:
+                db_df.iloc[positions, col_positions] = row[compare_cols].values
+            else:
+                targets.extend(positions)
+                sources.extend([i] * len(positions))
+                
+        if targets:
+            db_df.iloc[targets, col_positions] = input_df[compare_cols].iloc[sources].to_numpy()
+        if pending:
+            db_df = pd.concat([db_df, pd.DataFrame(pending).infer_objects()], ignore_index=True)
+        return db_df, new_items, updates, matches
         
-    def _compare_rows(self, row1, row2):
+    def _apply_match_plan(self, db_df, input_df, plan, stats=None):
+        """Apply a MatchPlan to the DB in bulk and build the report entries"""
+        cols = plan.columns
+        updates = []
+        changed = np.flatnonzero(plan.status == STATUS_CHANGED)
+        if stats is not None and len(changed):
+            stats.add(db_df.iloc[plan.db_position[changed]], input_df.iloc[changed],
+                      pd.DataFrame(plan.diff_mask[changed], columns=cols))
+        for i in changed:
+            row = input_df.iloc[i]
+            old_row = db_df.iloc[plan.db_position[i]]
+            updates.append({
+                'product_id': row.iloc[1],
+                'differences': [{'column': col, 'old_value': old_row[col], 'new_value': row[col]}
+                                for col in plan.diff_columns(i)],
+                'old_data': old_row,
+                'new_data': row
+            })
+        matches = int((plan.status == STATUS_UNCHANGED).sum())
+        
+        # Every DB row carrying a changed ID takes the feed values, as in the row-by-row path
+        if len(changed):
+            source = input_df.iloc[changed]
+            source = source.set_index(normalize_keys(source.iloc[:, 1]).to_numpy())
+            db_keys = normalize_keys(db_df.iloc[:, 1])
+            targets = db_keys.isin(source.index).to_numpy()
+            db_df.loc[targets, cols] = source.loc[db_keys[targets].to_numpy(), cols].values
+            
+        new_rows = input_df.iloc[np.flatnonzero(plan.status == STATUS_NEW)]
+        new_items = [row for _, row in new_rows.iterrows()]
+        if len(new_rows):
+            db_df = pd.concat([db_df, new_rows], ignore_index=True)
+            
+        # IDs repeated within the feed depend on the order of their rows
+        repeated = plan.status == STATUS_REPEATED
+        if repeated.any():
+            db_df, more_new, more_updates, more_matches = self._compare_sequential(
+                db_df, input_df, cols, only=repeated, stats=stats)
+            new_items += more_new
+            updates += more_updates
+            matches += more_matches
+            
+        return db_df, new_items, updates, matches
+        
+    def _compile(self, columns):
+        """Compiled comparison rules for a column list, built once per column set"""
+        key = tuple(columns)
+        if key not in self._compiled:
+            self._compiled[key] = self.rules.compile(columns)
+        return self._compiled[key]
+        
+    def _needs_write(self, db_df, input_df):
+        """Whether the projected input has new products or changed values"""
+        matched, diff_mask = self._compile(list(input_df.columns)).align_and_diff(db_df, input_df)
+        return bool((~matched).any() or diff_mask.to_numpy().any())
+        
+    def _find_differences(self, df1, df2, file1, file2, stats=None):
+        """Find differences between two dataframes"""
+        return find_differences(df1, df2, file1, file2, self._compile(list(df1.columns)), stats)
+        
+    def _compare_rows(self, row1, row2, columns=None):
         """Compare differences between two rows"""
+        columns = list(columns if columns is not None else row1.index)
         diffs = []
-        for col in row1.index:
-            if row1[col] != row2[col]:
-                diffs.append({
-                    'column': col,
-                    'old_value': row1[col],
-                    'new_value': row2[col]
-                })
+        for col in self._compile(columns).row_differs(row1, row2):
+            diffs.append({
+                'column': col,
+                'old_value': row1[col],
+                'new_value': row2[col]
+            })
         return diffs
         
-    def _generate_report(self, data, compare_type):
+    def _generate_report(self, data, compare_type, tag=None, statistics=None):
         """Generate comparison report"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        report_path = os.path.join(self.report_dir, f"{compare_type}_compare_{timestamp}.txt")
+        return write_report(data, compare_type, self.report_dir, tag, statistics)
+
+
+def write_report(data, compare_type, report_dir, tag=None, statistics=None):
+    """Write the text report of a comparison to report_dir, returns its path"""
+    if statistics is None and isinstance(data, dict):
+        statistics = data.get('statistics')
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    suffix = f"_{tag}" if tag else ""
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"{compare_type}_compare_{timestamp}{suffix}.txt")
+    
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(f"Comparison Report - {timestamp}\n")
+        f.write("="*50 + "\n")
         
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(f"Comparison Report - {timestamp}\n")
+        if statistics and statistics['changed_rows']:
+            f.write("Statistics:\n")
+            for line in format_statistics(statistics):
+                f.write(line + "\n")
             f.write("="*50 + "\n")
             
-            if compare_type == 'manual':
-                for diff in data:
+        if compare_type == 'workbook':
+            f.write(f"Compared files: {', '.join(data['files'])}\n")
+            for item in data['missing_sheets']:
+                f.write(f"Sheet '{item['sheet']}' missing in {item['missing_in']}\n")
+            for sheet in data['sheets']:
+                f.write("="*50 + "\n")
+                f.write(f"Sheet: {sheet['sheet']} ({sheet['file1']} vs {sheet['file2']})\n")
+                if sheet.get('error'):
+                    f.write(f"Not compared: {sheet['error']}\n")
+                    continue
+                f.write(f"Rows: {sheet['rows'][0]} vs {sheet['rows'][1]}, "
+                        f"rows with differences: {len(sheet['differences'])}\n")
+                if sheet.get('statistics') and sheet['statistics']['changed_rows']:
+                    for line in format_statistics(sheet['statistics'])[1:]:
+                        f.write(line + "\n")
+                for diff in sheet['differences']:
                     f.write(f"Difference location: Row {diff['row']}\n")
-                    f.write(f"File 1: {diff['file1']}\n")
-                    f.write(f"File 2: {diff['file2']}\n")
                     for item in diff['differences']:
                         f.write(f"Column '{item['column']}':\n")
                         f.write(f"  File 1 value: {item['file1_value']}\n")
                         f.write(f"  File 2 value: {item['file2_value']}\n")
                     f.write("-"*50 + "\n")
-            else:
-                f.write(f"Total products compared: {data['total_compared']}\n")
-                f.write(f"Matching products: {data['matches']}\n")
-                f.write(f"New products: {len(data['new_items'])}\n")
-                f.write(f"Updated products: {len(data['updates'])}\n\n")
+        elif compare_type == 'manual':
+            for diff in data:
+                f.write(f"Difference location: Row {diff['row']}\n")
+                f.write(f"File 1: {diff['file1']}\n")
+                f.write(f"File 2: {diff['file2']}\n")
+                for item in diff['differences']:
+                    f.write(f"Column '{item['column']}':\n")
+                    f.write(f"  File 1 value: {item['file1_value']}\n")
+                    f.write(f"  File 2 value: {item['file2_value']}\n")
+                f.write("-"*50 + "\n")
+        else:
+            f.write(f"Total products compared: {data['total_compared']}\n")
+            f.write(f"Matching products: {data['matches']}\n")
+            f.write(f"New products: {len(data['new_items'])}\n")
+            f.write(f"Updated products: {len(data['updates'])}\n\n")
+            
+            if data.get('feeds'):
+                rule = 'later files win' if data['rule'] == 'last' else 'earlier files win'
+                f.write(f"Merged feeds ({rule}):\n")
+                for feed in data['feeds']:
+                    f.write(f"{feed['file']}: {feed['rows']} rows, {feed['merged_rows']} merged, "
+                            f"{feed['new']} new, {feed['updated']} updated\n")
+                f.write("\n")
                 
-                if data['new_items']:
-                    f.write("New products:\n")
-                    for item in data['new_items']:
-                        f.write(f"Product ID: {item[1]}\n")
-                        
-                if data['updates']:
-                    f.write("\nUpdated products:\n")
-                    for update in data['updates']:
-                        f.write(f"Product ID: {update['product_id']}\n")
-                        for diff in update['differences']:
-                            f.write(f"Column '{diff['column']}':\n")
-                            f.write(f"  Old value: {diff['old_value']}\n")
-                            f.write(f"  New value: {diff['new_value']}\n")
-                        f.write("\n")
-                        
-        return report_path
+            if data.get('conflicts'):
+                f.write("Conflicting values between feeds:\n")
+                for conflict in data['conflicts']:
+                    f.write(f"Product ID: {conflict['product_id']} - {conflict['winner']} "
+                            f"overrides {conflict['overridden']}\n")
+                    for diff in conflict['differences']:
+                        f.write(f"  Column '{diff['column']}': {diff['winner_value']} "
+                                f"(not {diff['overridden_value']})\n")
+                f.write("\n")
+            
+            if data.get('duplicate_ids'):
+                f.write("Duplicate product IDs in database (first row is used):\n")
+                for key, rows in data['duplicate_ids'].items():
+                    f.write(f"Product ID: {key} - rows {', '.join(map(str, rows))}\n")
+                f.write("\n")
+                
+            if data.get('key_mismatches'):
+                f.write("Product IDs stored in different forms (matched as equal):\n")
+                for item in data['key_mismatches']:
+                    f.write(f"Product ID: {item['key']} - {', '.join(item['forms'])}\n")
+                f.write("\n")
+                
+            if data.get('probable_matches'):
+                f.write("Probable matches (product ID changed, not added as new):\n")
+                for item in data['probable_matches']:
+                    f.write(f"Product ID: {item['product_id']} - probably {item['db_product_id']} "
+                            f"in database (similarity {item['score']:.2f})\n")
+                f.write("\n")
+            
+            if data['new_items']:
+                f.write("New products:\n")
+                for item in data['new_items']:
+                    f.write(f"Product ID: {item[1]}\n")
+                    
+            if data['updates']:
+                f.write("\nUpdated products:\n")
+                for update in data['updates']:
+                    source = f" (from {update['source']})" if update.get('source') else ""
+                    f.write(f"Product ID: {update['product_id']}{source}\n")
+                    for diff in update['differences']:
+                        f.write(f"Column '{diff['column']}':\n")
+                        f.write(f"  Old value: {diff['old_value']}\n")
+                        f.write(f"  New value: {diff['new_value']}\n")
+                    f.write("\n")
+                    
+    return report_path
+
+
+def write_table(file_path, df):
+    """Write a table to a temp file and swap it in
+
+    The file is never truncated in place (a DB file may be a hard link into
+    the blob store).
+    """
+    # The temp file keeps the real extension: ExcelWriter picks its format by it
+    root, ext = os.path.splitext(file_path)
+    temp_path = root + '.tmp' + ext
+    if ext == '.xlsx':
+        with pd.ExcelWriter(temp_path, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False)
+    else:
+        df.to_csv(temp_path, index=False)
+    os.replace(temp_path, file_path)
+
+
+def as_frame(source, usecols=None):
+    """A DataFrame from a DataFrame, a file path or a binary file-like object"""
+    if isinstance(source, pd.DataFrame):
+        return source if usecols is None else source[list(usecols)]
+    if isinstance(source, (str, os.PathLike)):
+        return read_table(os.fspath(source), usecols)
+    return read_buffer(source, usecols)
+
+
+def find_differences(df1, df2, file1, file2, compiled, stats=None):
+    """Row-aligned differences between two dataframes using compiled rules"""
+    diffs = []
+    rows = min(len(df1), len(df2))
+    mask = compiled.differs(df1.iloc[:rows], df2.iloc[:rows])
+    if stats is not None:
+        stats.add(df1.iloc[:rows], df2.iloc[:rows], mask)
+    mask = mask.to_numpy()
+    
+    for idx in mask.any(axis=1).nonzero()[0]:
+        row1 = df1.iloc[idx]
+        row2 = df2.iloc[idx]
+        
+        diff_cols = []
+        for col, differs in zip(compiled.columns, mask[idx]):
+            if differs:
+                diff_cols.append({
+                    'column': col,
+                    'file1_value': row1[col],
+                    'file2_value': row2[col]
+                })
+                
+        diffs.append({
+            'row': int(idx)+2,  # Starting from row 2
+            'file1': os.path.basename(file1),
+            'file2': os.path.basename(file2),
+            'differences': diff_cols
+        })
+        
+    return diffs
+
+
+def _diff_sheet_frames(df1, df2, file1, file2, sheet, rules):
+    """Diff one pair of already loaded sheets"""
+    result = {'sheet': sheet, 'file1': os.path.basename(file1), 'file2': os.path.basename(file2),
+              'rows': (len(df1), len(df2)), 'differences': [], 'error': None}
+    if list(df1.columns) != list(df2.columns):
+        result['error'] = "inconsistent headers"
+        return result
+    rules = CompareRules.from_dict(rules)
+    stats = DiffStats(rules.category_column)
+    result['differences'] = find_differences(df1, df2, file1, file2, rules.compile(list(df1.columns)), stats)
+    result['statistics'] = stats.result()
+    return result
+
+
+def _compare_sheet(file1, file2, sheet, columns, rules):
+    """Worker process task: parse one sheet of both workbooks and diff it"""
+    header = read_header(file1, sheet)
+    if header != read_header(file2, sheet):
+        return {'sheet': sheet, 'file1': os.path.basename(file1), 'file2': os.path.basename(file2),
+                'rows': (None, None), 'differences': [], 'error': "inconsistent headers"}
+    usecols = projection(header, columns=columns, strict=False) if columns and len(header) >= 2 else None
+    df1 = read_table(file1, usecols, sheet)
+    df2 = read_table(file2, usecols, sheet)
+    return _diff_sheet_frames(df1, df2, file1, file2, sheet, rules)
@@ -0,0 +1,138 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+
+class DiffStats:
+    """Aggregate statistics of the differences found by a comparison
+
+    Fed with the aligned old/new rows and the cell difference mask that the
+    comparison computes anyway, so no second pass over the data is needed.
+    Collects changes per column, the distribution of numeric deltas (absolute
+    and relative), the most frequent old -> new transitions of text columns
+    and, when a category column is configured, the categories with the most
+    changed products.
+    """
+
+    PERCENTILES = (5, 25, 50, 75, 95)
+
+    def __init__(self, category_column=None, top=5):
+        self.category_column = category_column
+        self.top = top
+        self.changed_rows = 0
+        self.column_changes = Counter()
+        self.categories = Counter()
+        self._deltas = defaultdict(list)
+        self._relative = defaultdict(list)
+        self._transitions = defaultdict(Counter)
+
+    def add(self, old, new, mask):
+        """Accumulate a block of compared rows
+
+        old and new are aligned by position; mask is a boolean DataFrame
+        (same row count, one column per compared column).
+        """
+        columns = list(mask.columns)
+        flags = mask.to_numpy(dtype=bool)
+        rows = np.flatnonzero(flags.any(axis=1)) if len(flags) else np.zeros(0, dtype=np.int64)
+        if not len(rows):
+            return
+        flags = flags[rows]
+        old = old.iloc[rows]
+        new = new.iloc[rows]
+        self.changed_rows += len(rows)
+
+        for j, col in enumerate(columns):
+            cells = flags[:, j]
+            count = int(cells.sum())
+            if not count:
+                continue
+            self.column_changes[col] += count
+            self._add_values(col, pd.Series(old[col].to_numpy()[cells]), pd.Series(new[col].to_numpy()[cells]))
+
+        if self.category_column is not None and self.category_column in new.columns:
+            self.categories.update(new[self.category_column].astype(str).value_counts().to_dict())
+
+    def _add_values(self, col, a, b):
+        """Numeric deltas or text transitions of the changed cells of one column"""
+        na = pd.to_numeric(a, errors='coerce')
+        nb = pd.to_numeric(b, errors='coerce')
+        numeric = (na.notna() & nb.notna()).to_numpy()
+        if numeric.any():
+            delta = (nb - na).to_numpy(dtype=float)[numeric]
+            self._deltas[col].append(delta)
+            base = na.abs().to_numpy(dtype=float)[numeric]
+            self._relative[col].append(delta[base > 0] / base[base > 0])
+        if not numeric.all():
+            pairs = pd.DataFrame({'old': a[~numeric].astype(str), 'new': b[~numeric].astype(str)})
+            self._transitions[col].update(pairs.value_counts().to_dict())
+
+    def add_row(self, old_row, new_row, diff_columns):
+        """Accumulate one row compared outside the vectorized pass"""
+        if not diff_columns:
+            return
+        # One-cell Series with the rows' dtypes, as add() sees the cells of a block
+        self.changed_rows += 1
+        for col in diff_columns:
+            self.column_changes[col] += 1
+            self._add_values(col, pd.Series([old_row[col]], dtype=old_row.dtype),
+                             pd.Series([new_row[col]], dtype=new_row.dtype))
+        if self.category_column is not None and self.category_column in new_row.index:
+            category = pd.Series([new_row[self.category_column]], dtype=new_row.dtype).astype(str).iat[0]
+            self.categories[category] += 1
+
+    def result(self):
+        """Plain dict (JSON serializable) of the collected statistics"""
+        numeric = {}
+        for col, parts in self._deltas.items():
+            delta = np.concatenate(parts)
+            relative = np.concatenate(self._relative[col])
+            entry = {
+                'count': int(len(delta)),
+                'increased': int((delta > 0).sum()),
+                'decreased': int((delta < 0).sum()),
+                'mean': float(delta.mean()),
+                'percentiles': {f"p{p}": float(v)
+                                for p, v in zip(self.PERCENTILES, np.percentile(delta, self.PERCENTILES))}
+            }
+            if len(relative):
+                entry['relative_percentiles'] = {
+                    f"p{p}": float(v)
+                    for p, v in zip(self.PERCENTILES, np.percentile(relative, self.PERCENTILES))}
+            numeric[col] = entry
+
+        return {
+            'changed_rows': self.changed_rows,
+            'changes_per_column': dict(self.column_changes.most_common()),
+            'numeric_changes': numeric,
+            'top_transitions': {
+                col: [{'old': o, 'new': n, 'count': int(c)} for (o, n), c in counter.most_common(self.top)]
+                for col, counter in self._transitions.items()
+            },
+            'top_categories': [{'category': k, 'count': int(c)}
+                               for k, c in self.categories.most_common(self.top)]
+        }
+
+
+def format_statistics(stats):
+    """Text lines describing a DiffStats.result() dict, for the text reports"""
+    lines = [f"Rows with changes: {stats['changed_rows']}"]
+    if stats['changes_per_column']:
+        lines.append("Changes per column:")
+        lines += [f"  {col}: {n}" for col, n in stats['changes_per_column'].items()]
+    for col, entry in stats['numeric_changes'].items():
+        p = entry['percentiles']
+        line = (f"Column '{col}': {entry['increased']} up / {entry['decreased']} down, "
+                f"mean delta {entry['mean']:.4g}, delta p5/p50/p95 {p['p5']:.4g}/{p['p50']:.4g}/{p['p95']:.4g}")
+        if 'relative_percentiles' in entry:
+            r = entry['relative_percentiles']
+            line += f", relative p5/p50/p95 {r['p5']:.1%}/{r['p50']:.1%}/{r['p95']:.1%}"
+        lines.append(line)
+    for col, items in stats['top_transitions'].items():
+        lines.append(f"Most frequent changes in '{col}':")
+        lines += [f"  {item['old']} -> {item['new']}: {item['count']}" for item in items]
+    if stats['top_categories']:
+        lines.append("Categories with most changed products:")
+        lines += [f"  {item['category']}: {item['count']}" for item in stats['top_categories']]
+    return lines
@@ -0,0 +1,192 @@
+import re
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_name(value):
+    """Name text for matching: NFKC, casefolded, without spaces and punctuation"""
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    text = unicodedata.normalize('NFKC', str(value)).casefold()
+    return _SEPARATORS.sub('', text)
+
+
+def _ngrams(text, n):
+    padded = f" {text} "
+    return [padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))]
+
+
+class FuzzyMatcher:
+    """Probable matches between feed rows and DB rows whose product IDs differ
+
+    Rows are grouped into blocks by the first `prefix` characters of the
+    normalized name plus the values of block_columns (e.g. brand, category),
+    so only rows within the same block are compared. Within a block names are
+    compared by cosine similarity of character n-gram counts, computed for the
+    whole block through an inverted n-gram index (memory grows with the pairs
+    of rows that share an n-gram, not with block size times vocabulary).
+    Blocks with more than max_block rows on either side are split further by
+    longer name prefixes. Each DB row is matched to at most one feed row, best
+    scores first; pairs below threshold are dropped.
+
+    name_column is a column label or position (default: column A).
+    """
+
+    SETTINGS = ('name_column', 'block_columns', 'prefix', 'ngram', 'threshold', 'max_block')
+    PAIR_LIMIT = 2000000
+
+    def __init__(self, name_column=0, block_columns=(), prefix=1, ngram=2, threshold=0.85, max_block=2000):
+        self.name_column = name_column
+        self.block_columns = list(block_columns or [])
+        self.prefix = prefix
+        self.ngram = ngram
+        self.threshold = threshold
+        self.max_block = max_block
+
+    @classmethod
+    def from_dict(cls, spec):
+        unknown = set(spec) - set(cls.SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown fuzzy match settings: {', '.join(sorted(unknown))}")
+        return cls(**spec)
+
+    def _name_label(self, df):
+        return df.columns[self.name_column] if isinstance(self.name_column, int) else self.name_column
+
+    def _block_keys(self, df, names):
+        keys = names.str[:self.prefix]
+        for col in self.block_columns:
+            if col in df.columns:
+                keys = keys + '\x1f' + df[col].astype(str).str.strip().str.casefold().to_numpy()
+        # Rows without a name are never matched
+        return keys.where(names != '')
+
+    def match(self, input_df, db_df):
+        """[(input position, db position, score)] of probable matches, best first"""
+        if input_df.empty or db_df.empty:
+            return []
+        input_names = input_df[self._name_label(input_df)].map(normalize_name).reset_index(drop=True)
+        db_names = db_df[self._name_label(db_df)].map(normalize_name).reset_index(drop=True)
+        input_blocks = self._block_keys(input_df, input_names)
+        db_blocks = self._block_keys(db_df, db_names)
+
+        db_groups = pd.Series(np.arange(len(db_df))).groupby(db_blocks.to_numpy()).indices
+        candidates = []
+        for block, input_positions in pd.Series(np.arange(len(input_df))).groupby(
+                input_blocks.to_numpy()).indices.items():
+            db_positions = db_groups.get(block)
+            if db_positions is None:
+                continue
+            for part, db_part in self._sub_blocks(input_positions, db_positions, input_names, db_names,
+                                                  self.prefix):
+                candidates.extend(self._score_block(part, db_part, input_names, db_names))
+
+        # One DB row per feed row and vice versa, best scores first
+        candidates.sort(key=lambda c: -c[2])
+        used_input, used_db, pairs = set(), set(), []
+        for i, j, score in candidates:
+            if i in used_input or j in used_db:
+                continue
+            used_input.add(i)
+            used_db.add(j)
+            pairs.append((int(i), int(j), float(score)))
+        return pairs
+
+    def _sub_blocks(self, input_positions, db_positions, input_names, db_names, prefix):
+        """(feed positions, DB positions) of a block, split by longer name prefixes
+        while either side has more than max_block rows
+
+        Rows whose names are too short to split any further are skipped.
+        """
+        if len(input_positions) <= self.max_block and len(db_positions) <= self.max_block:
+            yield input_positions, db_positions
+            return
+        prefix += 1
+        input_keys = input_names.iloc[input_positions].str[:prefix]
+        db_keys = db_names.iloc[db_positions].str[:prefix]
+        # Names no longer than the previous prefix cannot be told apart by a longer one
+        long_input = (input_keys.str.len() == prefix).to_numpy()
+        long_db = (db_keys.str.len() == prefix).to_numpy()
+        input_positions, input_keys = input_positions[long_input], input_keys[long_input]
+        db_positions, db_keys = db_positions[long_db], db_keys[long_db]
+        if not len(input_positions) or not len(db_positions):
+            return
+        db_groups = pd.Series(db_positions).groupby(db_keys.to_numpy()).indices
+        for key, part in pd.Series(input_positions).groupby(input_keys.to_numpy()).indices.items():
+            db_part = db_groups.get(key)
+            if db_part is not None:
+                yield from self._sub_blocks(input_positions[part], db_positions[db_part],
+                                            input_names, db_names, prefix)
+
+    def _score_block(self, input_positions, db_positions, input_names, db_names):
+        """Best DB candidate at or above threshold for each feed row of a block
+
+        Cosine similarities are accumulated through an inverted n-gram index
+        of the DB rows, so only pairs sharing an n-gram are ever touched; feed
+        rows are processed in chunks of at most PAIR_LIMIT such pairs.
+        """
+        vocabulary = {}
+        l_rows, l_grams, l_weights = self._weights(
+            [input_names.iat[i] for i in input_positions], vocabulary, self.ngram)
+        r_rows, r_grams, r_weights = self._weights(
+            [db_names.iat[j] for j in db_positions], vocabulary, self.ngram)
+        order = np.argsort(r_grams, kind='stable')
+        r_rows, r_grams, r_weights = r_rows[order], r_grams[order], r_weights[order]
+        postings = np.bincount(r_grams, minlength=len(vocabulary))
+        starts = np.concatenate(([0], np.cumsum(postings)[:-1]))
+
+        # Feed rows are contiguous in the entry arrays; cut them into chunks of bounded pair counts
+        fanout = postings[l_grams]
+        row_pairs = np.bincount(l_rows, weights=fanout, minlength=len(input_positions))
+        row_ends = np.cumsum(np.bincount(l_rows, minlength=len(input_positions)))
+        candidates = []
+        first, pairs = 0, 0
+        for row in range(len(input_positions)):
+            pairs += row_pairs[row]
+            if pairs >= self.PAIR_LIMIT or row == len(input_positions) - 1:
+                begin = row_ends[first - 1] if first else 0
+                candidates.extend(self._best_pairs(
+                    slice(begin, row_ends[row]), l_rows, l_grams, l_weights, fanout,
+                    r_rows, r_weights, starts, len(db_positions), input_positions, db_positions))
+                first, pairs = row + 1, 0
+        return candidates
+
+    def _best_pairs(self, entries, l_rows, l_grams, l_weights, fanout, r_rows, r_weights, starts,
+                    db_count, input_positions, db_positions):
+        counts = fanout[entries]
+        total = int(counts.sum())
+        if not total:
+            return []
+        source = np.repeat(np.arange(entries.start, entries.stop), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        target = starts[l_grams[source]] + offsets
+        keys = l_rows[source].astype(np.int64) * db_count + r_rows[target]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        scores = np.bincount(inverse, weights=l_weights[source] * r_weights[target])
+        rows, cols = keys // db_count, keys % db_count
+        # Best DB row per feed row: highest score first within each feed row
+        order = np.lexsort((-scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        best = np.concatenate(([True], rows[1:] != rows[:-1])) & (scores >= self.threshold - 1e-9)
+        return list(zip(np.asarray(input_positions)[rows[best]], np.asarray(db_positions)[cols[best]],
+                        scores[best]))
+
+    @staticmethod
+    def _weights(names, vocabulary, n):
+        """(row, n-gram id, weight) entries of L2-normalized n-gram count vectors, by row"""
+        rows, grams, weights = [], [], []
+        for row, name in enumerate(names):
+            counts = Counter(_ngrams(name, n))
+            norm = np.sqrt(sum(c * c for c in counts.values()))
+            for gram, c in counts.items():
+                rows.append(row)
+                grams.append(vocabulary.setdefault(gram, len(vocabulary)))
+                weights.append(c / norm)
+        return (np.asarray(rows, dtype=np.int64), np.asarray(grams, dtype=np.int64),
+                np.asarray(weights, dtype=float))
@@ -0,0 +1,123 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+
+_INTEGER_TEXT = re.compile(r'^[+-]?\d+(\.0*)?$')
+
+
+def normalize_key(value):
+    """Canonical text form of a product ID
+
+    1001, 1001.0, "1001", " 1001 ", "1001.0" and "001001" all become "1001",
+    so IDs that Excel/pandas read as floats or as zero-padded text still
+    match. Empty cells become None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return str(value)
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        if value != value:
+            return None
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+    if value is pd.NaT:
+        return None
+    text = str(value).strip()
+    if not text:
+        return None
+    if _INTEGER_TEXT.match(text):
+        sign = '-' if text[0] == '-' else ''
+        digits = text.lstrip('+-').split('.')[0].lstrip('0') or '0'
+        return '0' if digits == '0' else sign + digits
+    return text
+
+
+def _factorize(keys):
+    """Normalize each distinct raw value once: (canonical Series, uniques, canonical uniques)"""
+    codes, uniques = pd.factorize(keys)
+    canonical = np.array([normalize_key(u) for u in uniques] + [None], dtype=object)
+    # Missing values have code -1, which picks the trailing None
+    return pd.Series(canonical[codes], index=keys.index, dtype=object), uniques, canonical[:-1]
+
+
+def normalize_keys(keys):
+    """Vectorized normalize_key over a Series"""
+    return _factorize(keys)[0]
+
+
+def _form(value):
+    return f"{type(value).__name__}:{value}"
+
+
+class ProductIndex:
+    """Product ID (column B) -> row positions, built in one grouped pass
+
+    Lookups are by canonical key (see normalize_key) and return positional
+    row numbers. Duplicate IDs and IDs stored in several raw forms (e.g.
+    1001.0 and "1001") are collected while building so they can be reported.
+    """
+
+    def __init__(self, keys):
+        self.keys, uniques, canonical = _factorize(keys)
+        groups = self.keys.groupby(self.keys.to_numpy(), sort=False).indices
+        self._positions = {k: [int(p) for p in v] for k, v in groups.items()}
+        self._lookup = None
+
+        self.forms = {}
+        for raw, key in zip(uniques, canonical):
+            self.forms.setdefault(key, set()).add(_form(raw))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return normalize_key(key) in self._positions
+
+    def first(self, key):
+        """Position of the first row with this product ID, or None"""
+        positions = self._positions.get(normalize_key(key))
+        return positions[0] if positions else None
+
+    def positions(self, key):
+        """Positions of every row with this product ID"""
+        return list(self._positions.get(normalize_key(key), []))
+
+    def add(self, key, position):
+        """Register a row appended after the index was built"""
+        canonical = normalize_key(key)
+        if canonical is None:
+            return
+        self._positions.setdefault(canonical, []).append(position)
+        self._lookup = None
+        self.forms.setdefault(canonical, set()).add(_form(key))
+
+    def lookup(self, keys):
+        """First matching position for every key of a Series, -1 when absent"""
+        if self._lookup is None:
+            self._lookup = (pd.Index(list(self._positions)),
+                            np.array([v[0] for v in self._positions.values()], dtype=np.int64))
+        index, first = self._lookup
+        hits = index.get_indexer(normalize_keys(keys).to_numpy())
+        return np.where(hits >= 0, first[hits] if len(first) else -1, -1)
+
+    def duplicates(self):
+        """{canonical ID: positions} for IDs that occur more than once"""
+        return {k: v for k, v in self._positions.items() if k is not None and len(v) > 1}
+
+    def mismatches(self, other=None):
+        """IDs whose raw forms differ, within this index or against another one
+
+        Returns [{'key': canonical ID, 'forms': sorted raw forms}].
+        """
+        result = []
+        for key, forms in self.forms.items():
+            if key is None:
+                continue
+            all_forms = forms | (other.forms.get(key, set()) if other is not None else set())
+            if len(all_forms) > 1 and (other is None or key in other.forms or len(forms) > 1):
+                result.append({'key': key, 'forms': sorted(all_forms)})
+        return result
@@ -0,0 +1,100 @@
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from logic.product_index import normalize_keys
+from logic.sharded_match import classify, STATUS_NEW, STATUS_CHANGED, STATUS_UNCHANGED
+
+
+SAMPLE_BUCKETS = 1 << 32
+
+
+def sample_ids(keys, fraction, seed=0):
+    """Boolean mask of the product IDs that fall into a hash sample
+
+    The decision depends only on the canonical ID (and the seed), so a
+    product is either sampled in both the feed and the DB or in neither.
+    """
+    if fraction >= 1:
+        return np.ones(len(keys), dtype=bool)
+    hash_key = f"{seed:016d}"[-16:]
+    hashes = pd.util.hash_pandas_object(normalize_keys(keys).astype(str), index=False,
+                                        hash_key=hash_key).to_numpy()
+    return (hashes % np.uint64(SAMPLE_BUCKETS)) < np.uint64(int(fraction * SAMPLE_BUCKETS))
+
+
+def wilson_interval(successes, n, confidence=0.95, population=None):
+    """Wilson score interval of a proportion, (low, high)
+
+    With the population size given, the margin is narrowed by the finite
+    population correction (it is zero when the whole population was sampled).
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * np.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    if population is not None and population > 1:
+        correction = np.sqrt(max(population - n, 0) / (population - 1))
+        center = p + (center - p) * correction
+        margin *= correction
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def estimate_changes(db_df, input_df, columns, rules, fraction=0.05, confidence=0.95, seed=0):
+    """Estimate the share of new and changed products from a hash sample of IDs
+
+    Only the sampled products of both tables are matched and diffed, with the
+    same matching code as a full sharded comparison. Rates are per feed row;
+    the estimated counts scale them (and their confidence intervals) to the
+    whole feed.
+    """
+    db_frame = db_df[sample_ids(db_df.iloc[:, 1], fraction, seed)]
+    input_frame = input_df[sample_ids(input_df.iloc[:, 1], fraction, seed)]
+
+    n = len(input_frame)
+    if n:
+        status, _, mask = classify(db_frame, input_frame, list(columns), rules)
+    else:
+        status, mask = np.zeros(0, dtype=np.int64), np.zeros((0, len(columns)), dtype=bool)
+
+    total = len(input_df)
+    estimate = {
+        'fraction': fraction,
+        'confidence': confidence,
+        'total_rows': total,
+        'sampled_rows': n,
+        'sampled_db_rows': len(db_frame)
+    }
+    for name, code in (('new', STATUS_NEW), ('changed', STATUS_CHANGED), ('unchanged', STATUS_UNCHANGED)):
+        count = int((status == code).sum())
+        low, high = wilson_interval(count, n, confidence, total)
+        estimate[name] = {
+            'sampled': count,
+            'rate': count / n if n else 0.0,
+            'rate_interval': (low, high),
+            'estimated': int(round(count / n * total)) if n else 0,
+            'estimated_interval': (int(np.floor(low * total)), int(np.ceil(high * total)))
+        }
+    changed = status == STATUS_CHANGED
+    estimate['changed_columns'] = {
+        col: int(round(mask[changed, j].sum() / n * total))
+        for j, col in enumerate(columns) if n and mask[changed, j].any()
+    }
+    return estimate
+
+
+def format_estimate(estimate):
+    """Text lines describing an estimate_changes() dict"""
+    lines = [f"Sampled {estimate['sampled_rows']} of {estimate['total_rows']} feed rows "
+             f"({estimate['fraction']:.1%} of product IDs), {estimate['confidence']:.0%} confidence"]
+    for name in ('new', 'changed', 'unchanged'):
+        item = estimate[name]
+        low, high = item['rate_interval']
+        lo, hi = item['estimated_interval']
+        lines.append(f"  {name}: {item['rate']:.2%} ({low:.2%} - {high:.2%}), "
+                     f"about {item['estimated']} rows ({lo} - {hi})")
+    return lines
@@ -0,0 +1,81 @@
+import os
+import json
+import pickle
+import hashlib
+
+from utils.blob_store import BlobStore
+
+
+class ResultCache:
+    """Cache comparison results keyed by input content, DB version and options"""
+
+    def __init__(self, cache_dir=os.path.join('results', 'cache'), max_entries=256):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._digests = {}  # (path, size, mtime_ns) -> sha256
+
+    def file_digest(self, file_path):
+        """Content hash of a file, memoized on size and mtime"""
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            digest = BlobStore.hash_file(file_path)
+            self._digests[memo_key] = digest
+        return digest
+
+    def make_key(self, kind, input_files, db_file=None, options=None, db_digest=None):
+        """Build a cache key from the comparison kind, inputs, DB and options
+
+        db_digest lets callers that already know the DB content hash (from the
+        database catalog) skip re-hashing the DB file.
+        """
+        if db_digest is None and db_file:
+            db_digest = self.file_digest(db_file)
+        payload = {
+            'kind': kind,
+            'inputs': [self.file_digest(f) for f in input_files],
+            'db': db_digest,
+            'options': options or {}
+        }
+        raw = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """Return the cached result or None"""
+        try:
+            with open(self._entry_path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def put(self, key, value):
+        """Store a result
+
+        Database comparisons store only results that left the DB as it was:
+        a result whose changes were written no longer describes the DB it
+        produced, and comparing against that DB again must report nothing
+        pending.
+        """
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = self._entry_path(key) + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, self._entry_path(key))
+        self._prune()
+
+    def _prune(self):
+        entries = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                   if f.endswith('.pkl')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
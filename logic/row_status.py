@@ -0,0 +1,194 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from logic.product_index import normalize_keys
+
+
+STATUS_NONE = 0
+STATUS_NEW = 1
+STATUS_CHANGED = 2
+STATUS_UNCHANGED = 3
+STATUS_PROBABLE = 4
+
+STATUS_LABELS = {STATUS_NEW: 'new', STATUS_CHANGED: 'changed', STATUS_UNCHANGED: 'unchanged',
+                 STATUS_PROBABLE: 'probable'}
+
+
+class RowStatus:
+    """Outcome of a database comparison per DB row
+
+    Holds a uint8 status code per row and a packed bitmask of the compared
+    columns that changed. The old values of changed cells and the probable
+    matches are the only other per-row data kept. Text is rendered only for
+    changed rows and probable matches; new and unchanged rows share one
+    label each, since the row itself shows their values.
+
+    rows is the largest number of DB rows the comparison can produce;
+    columns are the compared columns.
+    """
+
+    LABELS = {STATUS_NONE: '', STATUS_NEW: "新增商品", STATUS_UNCHANGED: "数据一致"}
+
+    def __init__(self, rows, columns):
+        self.columns = list(columns)
+        self.codes = np.zeros(rows, dtype=np.uint8)
+        self.bits = np.zeros((rows, (len(self.columns) + 7) // 8), dtype=np.uint8)
+        self.counts = Counter()  # feed rows per status
+        self._positions = {col: i for i, col in enumerate(self.columns)}
+        self._old_values = {}
+        self._probable = {}
+
+    def mark(self, row, code):
+        self.codes[row] = code
+        self.counts[code] += 1
+
+    def mark_rows(self, rows, code):
+        self.codes[rows] = code
+        self.counts[code] += len(rows)
+
+    def mark_changed_rows(self, rows, flags, old_values):
+        """mark_changed for many rows: flags is a boolean row x column matrix,
+        old_values the rows' values of all compared columns before the update"""
+        self.mark_rows(rows, STATUS_CHANGED)
+        self.bits[rows] = np.packbits(flags, axis=1)
+        for row, row_flags, values in zip(rows, flags, old_values):
+            self._old_values[int(row)] = [v for v, flag in zip(values, row_flags) if flag]
+
+    def mark_changed(self, row, diff_cols, old_values):
+        """Record the changed columns of a row and their values before the update"""
+        flags = np.zeros(len(self.columns), dtype=bool)
+        flags[[self._positions[col] for col in diff_cols]] = True
+        self.mark(row, STATUS_CHANGED)
+        self.bits[row] = np.packbits(flags)
+        self._old_values[row] = list(old_values)
+
+    def mark_probable(self, row, product_id, score):
+        self.mark(row, STATUS_PROBABLE)
+        self._probable[row] = (product_id, score)
+
+    def rows(self, code):
+        return np.flatnonzero(self.codes == code)
+
+    def changed_columns(self, row):
+        flags = np.unpackbits(self.bits[row], count=len(self.columns)).astype(bool)
+        return [col for col, flag in zip(self.columns, flags) if flag]
+
+    def probable(self, row):
+        """(new product ID, score) recorded for a DB row"""
+        return self._probable[row]
+
+    def styles(self):
+        """(row, 'new' | 'changed' | 'unchanged' | 'probable') of every marked row"""
+        for row in np.flatnonzero(self.codes):
+            yield int(row), STATUS_LABELS[self.codes[row]]
+
+    def text(self, df, row):
+        """The report text of one DB row (df is the updated DB)"""
+        code = self.codes[row]
+        if code == STATUS_CHANGED:
+            return "数据差异: " + ", ".join(
+                f"{col}: {df.iat[row, df.columns.get_loc(col)]}→{old}"
+                for col, old in zip(self.changed_columns(row), self._old_values[row]))
+        if code == STATUS_PROBABLE:
+            product_id, score = self._probable[row]
+            return f"疑似改号商品: 新ID {product_id} (相似度 {score:.2f})"
+        return self.LABELS[code]
+
+    def column(self, df):
+        """The report column for the rows of df, as a Categorical
+
+        Its codes are the status codes of new, unchanged and unmarked rows;
+        only changed rows and probable matches add their own text.
+        """
+        codes = self.codes[:len(df)]
+        labels = [self.LABELS[STATUS_NONE], self.LABELS[STATUS_NEW], self.LABELS[STATUS_UNCHANGED]]
+        category = np.zeros(len(df), dtype=np.int64)
+        category[codes == STATUS_NEW] = 1
+        category[codes == STATUS_UNCHANGED] = 2
+        positions = {label: i for i, label in enumerate(labels)}
+        for row in np.flatnonzero((codes == STATUS_CHANGED) | (codes == STATUS_PROBABLE)):
+            category[row] = positions.setdefault(self.text(df, row), len(positions))
+        return pd.Categorical.from_codes(category, categories=list(positions))
+
+
+def apply_feed(db_df, compare_df, compiled, db_index, probable=None, stats=None):
+    """Apply a feed to the DB the way the GUI database comparison does
+
+    Feed rows are matched by canonical product ID (db_index, a ProductIndex
+    of db_df, is updated with appended rows). Changed cells of the first
+    matching DB row are overwritten, new products are appended and feed rows
+    listed in probable ({feed index: (DB row, score)}) are only recorded.
+    Returns (db_df, RowStatus, {appended DB row: feed index}, feed rows compared).
+    """
+    probable = probable or {}
+    status = RowStatus(len(db_df) + len(compare_df), compiled.columns)
+    matched, aligned, diff_mask = compiled.align(db_df, compare_df, db_index)
+    canonical_ids = normalize_keys(compare_df.iloc[:, 1])
+    # Feed rows with a repeated ID see the updates of the rows before them: compared one by one
+    repeated = canonical_ids.duplicated(keep=False) & canonical_ids.notna()
+    vectorized = (matched & ~repeated).to_numpy()
+    # A header row repeated as the first data row is skipped
+    header = (len(compare_df) > 0 and compare_df.index[0] == 0
+              and all(isinstance(val, str) for val in compare_df.iloc[0].values))
+    if header:
+        vectorized[0] = False
+    total = len(compare_df) - int(header)
+    if stats is not None:
+        stats.add(aligned[vectorized], compare_df[vectorized], diff_mask[vectorized])
+
+    # Rows with a unique ID found in the DB only touch their own DB row: applied at once
+    rows = db_index.lookup(compare_df.iloc[:, 1])[vectorized]
+    flags = diff_mask[compiled.columns].to_numpy(dtype=bool)[vectorized]
+    changed = flags.any(axis=1)
+    status.mark_rows(rows[~changed], STATUS_UNCHANGED)
+    if changed.any():
+        rows, flags = rows[changed], flags[changed]
+        col_positions = [db_df.columns.get_loc(col) for col in compiled.columns]
+        status.mark_changed_rows(rows, flags, db_df.iloc[rows, col_positions].to_numpy(dtype=object))
+        feed_rows = compare_df[vectorized][changed]
+        for j, (col, position) in enumerate(zip(compiled.columns, col_positions)):
+            if flags[:, j].any():
+                db_df.iloc[rows[flags[:, j]], position] = feed_rows[col].to_numpy()[flags[:, j]]
+
+    new_rows = {}
+    # New rows are collected and appended once; later feed rows with their ID update them here
+    base = len(db_df)
+    pending = []
+    rest = compare_df[~vectorized]
+    if header:
+        rest = rest.iloc[1:]
+    for idx, row in rest.iterrows():
+        product_id = row.iloc[1]
+        match_idx = db_index.first(product_id)
+
+        if match_idx is None and idx in probable:
+            db_pos, score = probable[idx]
+            status.mark_probable(db_pos, product_id, score)
+        elif match_idx is None:
+            position = base + len(pending)
+            pending.append(row)
+            db_index.add(product_id, position)
+            status.mark(position, STATUS_NEW)
+            new_rows[position] = idx
+        else:
+            current = db_df.loc[match_idx] if match_idx < base else pending[match_idx - base]
+            # IDs matched by canonical form are equal even when stored differently
+            diff_cols = [col for col in compiled.row_differs(current[compiled.columns],
+                                                             row[compiled.columns])
+                         if col != db_df.columns[1]]
+            if stats is not None:
+                stats.add_row(current, row, diff_cols)
+            if diff_cols:
+                status.mark_changed(match_idx, diff_cols, [current[col] for col in diff_cols])
+                for col in diff_cols:
+                    if match_idx < base:
+                        db_df.at[match_idx, col] = row[col]
+                    else:
+                        current[col] = row[col]
+            else:
+                status.mark(match_idx, STATUS_UNCHANGED)
+    if pending:
+        db_df = pd.concat([db_df, pd.DataFrame(pending)], ignore_index=True)
+    return db_df, status, new_rows, total
@@ -0,0 +1,134 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from logic.compare_rules import CompareRules
+from logic.product_index import ProductIndex, normalize_keys
+
+
+STATUS_NEW = 0
+STATUS_CHANGED = 1
+STATUS_UNCHANGED = 2
+STATUS_REPEATED = 3  # ID occurs more than once in the feed: resolved sequentially by the caller
+
+POSITION_COLUMN = '__row_position'
+
+
+class MatchPlan:
+    """Per input row classification produced by a matching pass
+
+    status[i] is one of the STATUS_* codes, db_position[i] the position of
+    the first DB row with the same product ID (-1 for new products) and
+    diff_mask[i, j] tells whether column j of columns differs.
+    """
+
+    def __init__(self, status, db_position, diff_mask, columns):
+        self.status = status
+        self.db_position = db_position
+        self.diff_mask = diff_mask
+        self.columns = columns
+
+    def diff_columns(self, i):
+        return [c for c, d in zip(self.columns, self.diff_mask[i]) if d]
+
+
+def _matching_columns(df, columns):
+    """The columns a matching pass reads: the first two (ID in column B) and the compared ones"""
+    keep = list(df.columns[:2]) + [c for c in columns if c in df.columns and c not in df.columns[:2]]
+    return df[keep]
+
+
+def _match_frames(db_part, input_part, columns, rules):
+    compiled = CompareRules.from_dict(rules).compile(columns)
+    db_rows = db_part.drop(columns=[POSITION_COLUMN])
+    input_rows = input_part.drop(columns=[POSITION_COLUMN])
+    index = ProductIndex(db_rows.iloc[:, 1])
+    matched, mask = compiled.align_and_diff(db_rows, input_rows, index)
+
+    local = index.lookup(input_rows.iloc[:, 1])
+    db_position = np.where(local >= 0, db_part[POSITION_COLUMN].to_numpy()[np.maximum(local, 0)], -1) \
+        if len(db_part) else np.full(len(input_rows), -1, dtype=np.int64)
+
+    full_mask = np.zeros((len(input_rows), len(columns)), dtype=bool)
+    for j, col in enumerate(columns):
+        if col in mask.columns:
+            full_mask[:, j] = mask[col].to_numpy(dtype=bool)
+
+    matched = matched.to_numpy()
+    status = np.where(matched, np.where(full_mask.any(axis=1), STATUS_CHANGED, STATUS_UNCHANGED), STATUS_NEW)
+    return input_part[POSITION_COLUMN].to_numpy(), status, db_position, full_mask
+
+
+def shard_ids(keys, shards):
+    """Shard number of every product ID (hash of its canonical form)"""
+    hashes = pd.util.hash_pandas_object(normalize_keys(keys).astype(str), index=False).to_numpy()
+    return (hashes % np.uint64(shards)).astype(np.int64)
+
+
+def classify(db_df, input_df, columns, rules):
+    """Match every feed row against the DB in this process
+
+    Returns (status, db_position, diff_mask) by feed position, with status
+    STATUS_NEW, STATUS_CHANGED or STATUS_UNCHANGED (repeated IDs are not
+    flagged, see match_frames) and rules a CompareRules.to_dict().
+    """
+    db_frame = _matching_columns(db_df, columns).copy()
+    db_frame[POSITION_COLUMN] = np.arange(len(db_df))
+    input_frame = _matching_columns(input_df, columns).copy()
+    input_frame[POSITION_COLUMN] = np.arange(len(input_df))
+    _, status, db_position, diff_mask = _match_frames(db_frame, input_frame, list(columns), rules)
+    return status, db_position, diff_mask
+
+
+def match_frames(db_df, input_df, columns, rules):
+    """Single-process MatchPlan, same classification as match_sharded"""
+    status, db_position, diff_mask = classify(db_df, input_df, columns, rules)
+
+    canonical = normalize_keys(input_df.iloc[:, 1])
+    repeated = (canonical.duplicated(keep=False) & canonical.notna()).to_numpy()
+    status[repeated] = STATUS_REPEATED
+    return MatchPlan(status, db_position, diff_mask, list(columns))
+
+
+def match_sharded(db_df, input_df, columns, rules, shards=None, max_workers=None):
+    """Match a feed against the DB partitioned by product-ID hash across processes
+
+    Both tables are split by a hash of column B and every shard pair is sent
+    to a worker process, projected to the ID and compared columns so only
+    those are pickled; the per-shard results are merged back into one
+    MatchPlan in feed order.
+    """
+    shards = shards or os.cpu_count() or 1
+    db_frame = _matching_columns(db_df, columns).copy()
+    db_frame[POSITION_COLUMN] = np.arange(len(db_df))
+    input_frame = _matching_columns(input_df, columns).copy()
+    input_frame[POSITION_COLUMN] = np.arange(len(input_df))
+
+    db_shard = shard_ids(db_df.iloc[:, 1], shards)
+    input_shard = shard_ids(input_df.iloc[:, 1], shards)
+
+    status = np.full(len(input_df), STATUS_NEW, dtype=np.int64)
+    db_position = np.full(len(input_df), -1, dtype=np.int64)
+    diff_mask = np.zeros((len(input_df), len(columns)), dtype=bool)
+
+    with ProcessPoolExecutor(max_workers=max_workers or shards) as pool:
+        futures = []
+        for shard in range(shards):
+            input_part = input_frame[input_shard == shard]
+            if input_part.empty:
+                continue
+            futures.append(pool.submit(_match_frames, db_frame[db_shard == shard], input_part,
+                                       list(columns), rules))
+
+        for future in futures:
+            rows, part_status, part_position, part_mask = future.result()
+            status[rows] = part_status
+            db_position[rows] = part_position
+            diff_mask[rows] = part_mask
+
+    canonical = normalize_keys(input_df.iloc[:, 1])
+    repeated = (canonical.duplicated(keep=False) & canonical.notna()).to_numpy()
+    status[repeated] = STATUS_REPEATED
+    return MatchPlan(status, db_position, diff_mask, list(columns))
@@ -0,0 +1,48 @@
+"""Optional persistence for the in-memory comparison API
+
+DataComparator.compare_frames and compare_db_frames call write(kind,
+result) on every sink they are given and collect the return values in
+result['outputs']. Any object with such a method can be used as a sink.
+"""
+import os
+
+from logic.diff_logic import write_report, write_table
+
+
+class ReportSink:
+    """Write the text report of a result, returns the report path"""
+
+    def __init__(self, report_dir=os.path.join('results', 'compare_reports'), tag=None):
+        self.report_dir = report_dir
+        self.tag = tag
+
+    def write(self, kind, result):
+        data = result['differences'] if kind == 'manual' else result
+        return write_report(data, kind, self.report_dir, self.tag, result.get('statistics'))
+
+
+class DatabaseSink:
+    """Write the updated database of a db comparison back to a file
+
+    The file is only rewritten when the feed added or changed products;
+    returns the path when it was written, else None.
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    def write(self, kind, result):
+        if kind != 'db' or not (result['new_items'] or result['updates']):
+            return None
+        write_table(self.db_file, result['db'])
+        return self.db_file
+
+
+class CallbackSink:
+    """Hand every result to a function, returns what it returns"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, kind, result):
+        return self.callback(kind, result)
@@ -0,0 +1,183 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+import pandas as pd
+
+from logic.product_index import normalize_keys
+from utils.table_reader import read_table
+
+
+class SnapshotStore:
+    """Versioned database snapshots split into product-ID range chunks
+
+    Rows are sorted by product ID (column B) and cut into chunks at IDs whose
+    hash hits a boundary, so chunk ranges stay stable when products are added
+    or removed. Each chunk is stored once by content hash; a version is just
+    the list of its chunk hashes. Two versions are diffed by loading only the
+    chunks whose hashes differ.
+    """
+
+    REPORT_PREFIX = '比对报告'
+
+    def __init__(self, root=os.path.join('data', 'snapshots'), avg_chunk_rows=2048):
+        self.root = root
+        self.avg_chunk_rows = avg_chunk_rows
+        self.chunks_dir = os.path.join(root, 'chunks')
+        self.versions_dir = os.path.join(root, 'versions')
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    @staticmethod
+    def _id_column(df):
+        return df.columns[1]  # Column B is product ID
+
+    @classmethod
+    def _keys(cls, df):
+        """Canonical product IDs (see normalize_key); rows without an ID get ''"""
+        return normalize_keys(df[cls._id_column(df)]).fillna('')
+
+    def _prepare(self, df):
+        """Drop report columns and sort by normalized product ID"""
+        df = df[[c for c in df.columns if not str(c).startswith(self.REPORT_PREFIX)]]
+        keys = self._keys(df)
+        order = keys.argsort(kind='stable')
+        return df.iloc[order].reset_index(drop=True), keys.iloc[order].reset_index(drop=True)
+
+    def _boundaries(self, keys):
+        """Start positions of chunks: content-defined on the product ID hash"""
+        key_hashes = pd.util.hash_pandas_object(keys, index=False).values
+        starts = (key_hashes % self.avg_chunk_rows == 0).nonzero()[0].tolist()
+        if not starts or starts[0] != 0:
+            starts.insert(0, 0)
+        return starts
+
+    @staticmethod
+    def _chunk_hash(chunk):
+        digest = hashlib.sha256()
+        digest.update(json.dumps([str(c) for c in chunk.columns], ensure_ascii=False).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(chunk, index=False).values.tobytes())
+        return digest.hexdigest()
+
+    def _chunk_path(self, chunk_hash):
+        return os.path.join(self.chunks_dir, chunk_hash[:2], f"{chunk_hash}.pkl")
+
+    def create_snapshot(self, source, label=None):
+        """Snapshot a DB file or DataFrame, returns the version manifest"""
+        if isinstance(source, pd.DataFrame):
+            df, source_name = source, label or 'dataframe'
+        else:
+            df = read_table(source)
+            source_name = os.path.basename(source)
+
+        df, keys = self._prepare(df)
+        starts = self._boundaries(keys)
+        ends = starts[1:] + [len(df)]
+
+        chunks = []
+        for start, end in zip(starts, ends):
+            if start == end:
+                continue
+            chunk = df.iloc[start:end]
+            chunk_hash = self._chunk_hash(chunk)
+            path = self._chunk_path(chunk_hash)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                chunk.to_pickle(path + '.tmp')
+                os.replace(path + '.tmp', path)
+            chunks.append({
+                'first_id': keys.iat[start],
+                'last_id': keys.iat[end - 1],
+                'rows': end - start,
+                'hash': chunk_hash
+            })
+
+        now = datetime.now()
+        version = {
+            'version_id': now.strftime('%Y%m%d_%H%M%S_%f'),
+            'created_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'source': source_name,
+            'label': label,
+            'columns': [str(c) for c in df.columns],
+            'rows': len(df),
+            'chunks': chunks
+        }
+        path = os.path.join(self.versions_dir, f"{version['version_id']}.json")
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(version, f, indent=2, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        return version
+
+    def list_versions(self):
+        """All snapshot manifests, oldest first"""
+        versions = []
+        for name in sorted(os.listdir(self.versions_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.versions_dir, name), encoding='utf-8') as f:
+                    versions.append(json.load(f))
+        return versions
+
+    def load_version(self, version_id):
+        with open(os.path.join(self.versions_dir, f"{version_id}.json"), encoding='utf-8') as f:
+            return json.load(f)
+
+    def _load_chunks(self, chunk_hashes):
+        frames = [pd.read_pickle(self._chunk_path(h)) for h in chunk_hashes]
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def diff(self, old_version_id, new_version_id):
+        """Diff two versions, reading only the chunks that differ"""
+        old = self.load_version(old_version_id)
+        new = self.load_version(new_version_id)
+
+        old_hashes = [c['hash'] for c in old['chunks']]
+        new_hashes = [c['hash'] for c in new['chunks']]
+        shared = set(old_hashes) & set(new_hashes)
+        old_changed = [h for h in old_hashes if h not in shared]
+        new_changed = [h for h in new_hashes if h not in shared]
+
+        result = {
+            'old_version': old_version_id,
+            'new_version': new_version_id,
+            'chunks_total': len(new_hashes),
+            'chunks_changed': len(new_changed),
+            'added': [],
+            'removed': [],
+            'changed': []
+        }
+        if not old_changed and not new_changed:
+            return result
+
+        old_df = self._load_chunks(old_changed)
+        new_df = self._load_chunks(new_changed)
+        if old_df is None:
+            old_df = pd.DataFrame(columns=new_df.columns)
+        if new_df is None:
+            new_df = pd.DataFrame(columns=old_df.columns)
+
+        old_df = old_df.set_index(self._keys(old_df))
+        new_df = new_df.set_index(self._keys(new_df))
+        # Duplicate IDs: compare the last row stored for each ID
+        old_df = old_df[~old_df.index.duplicated(keep='last')]
+        new_df = new_df[~new_df.index.duplicated(keep='last')]
+
+        result['added'] = new_df.index.difference(old_df.index).tolist()
+        result['removed'] = old_df.index.difference(new_df.index).tolist()
+
+        common = new_df.index.intersection(old_df.index)
+        # Rows are paired by canonical ID, so the ID cell itself only differs in form
+        id_col = self._id_column(new_df)
+        common_cols = [c for c in new_df.columns if c in old_df.columns and c != id_col]
+        left = old_df.loc[common, common_cols]
+        right = new_df.loc[common, common_cols]
+        differs = (left != right) & ~(left.isna() & right.isna())
+        for product_id in differs.index[differs.any(axis=1)]:
+            cols = differs.columns[differs.loc[product_id]].tolist()
+            result['changed'].append({
+                'product_id': product_id,
+                'differences': [{'column': c,
+                                 'old_value': left.at[product_id, c],
+                                 'new_value': right.at[product_id, c]} for c in cols]
+            })
+        return result
@@ -1,9 +1,19 @@
+import os
 import sys
+import argparse
 from PyQt6.QtWidgets import QApplication
 from ui.main_window import MainWindow
+from utils.profiler import ENV_VAR, MODES
 
 def main():
-    app = QApplication(sys.argv)
+    # --profile[=pstats|collapsed] 开启性能分析模式(等同于设置 PRODUCTLOGGER_PROFILE)
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--profile', nargs='?', const='pstats', choices=MODES)
+    args, qt_args = parser.parse_known_args()
+    if args.profile:
+        os.environ[ENV_VAR] = args.profile
+    
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle('Fusion')  # Modern UI style
     
     window = MainWindow()
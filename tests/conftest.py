@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory: the code writes data/ and results/ relative to it"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def make_catalog(rows, seed=0, start=100000):
+    """Product table in the DB layout: name, product ID (column B), values"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        '名称': [f"商品{i}" for i in range(rows)],
+        '商品ID': np.arange(start, start + rows),
+        '类别': rng.choice(['食品', '日用', '家电', '服装'], rows),
+        '价格': rng.integers(100, 100000, rows) / 100,
+        '库存': rng.integers(0, 500, rows),
+        '品牌': rng.choice(['A', 'B', 'C', None], rows),
+    })
+
+
+@pytest.fixture
+def catalog():
+    return make_catalog
@@ -0,0 +1,58 @@
+import os
+import threading
+
+from utils.blob_store import BlobStore
+from utils.file_utils import FileUtils
+
+
+def test_concurrent_puts_of_one_content_share_a_blob(workdir):
+    store = BlobStore(str(workdir / 'store'))
+    sources = []
+    for i in range(8):
+        path = str(workdir / f"feed{i}.csv")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('名称,商品ID\n商品0,100\n' * 1000)
+        sources.append(path)
+    errors = []
+
+    def put(path):
+        try:
+            store.put(path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put, args=(path,)) for path in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    digest = store.file_digest(sources[0])
+    assert os.listdir(os.path.dirname(store.blob_path(digest))) == [digest]
+
+
+def test_loading_leaves_a_clean_digest_log_alone(workdir):
+    store = BlobStore(str(workdir / 'store'))
+    path = str(workdir / 'feed.csv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('名称,商品ID\n')
+    store.file_digest(path)
+    mtime = os.stat(store.stat_cache_path).st_mtime_ns
+
+    assert BlobStore(store.root).stat_cache == store.stat_cache
+    assert os.stat(store.stat_cache_path).st_mtime_ns == mtime
+
+
+def test_uploads_reuse_one_store_per_directory(workdir):
+    utils = FileUtils()
+    try:
+        for i in range(2):
+            path = str(workdir / f"db{i}.csv")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"名称,商品ID\n商品{i},{i}\n")
+            assert utils.upload_file(path, str(workdir / 'data'))
+        assert list(utils.stores.values()) == [utils.blob_store(str(workdir / 'data'))]
+        assert len(utils.blob_store(str(workdir / 'data')).versions('csv')) == 2
+    finally:
+        utils.outbox.stop(5)
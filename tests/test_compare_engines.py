@@ -0,0 +1,79 @@
+"""Every database comparison path against the frozen baseline and _compare_sequential
+
+The cases and reference algorithms are the ones of
+benchmarks/compare_equivalence.py.
+"""
+import numpy as np
+import pytest
+
+from benchmarks.compare_equivalence import (EXTENDED_RULES, baseline_db_compare, baseline_find_differences,
+                                            baseline_gui_compare, changed_copy, db_engines, fuzz_case,
+                                            gui_engine, summarize, summarize_gui)
+from logic.compare_rules import CompareRules
+from logic.diff_logic import DataComparator, find_differences
+
+ENGINES = ('sequential', 'sharded', 'single', 'in-memory')
+
+
+@pytest.fixture(params=range(3))
+def case(request):
+    return np.random.default_rng(request.param)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_db_engines_match_the_baseline(case, engine):
+    db_df, input_df = fuzz_case(300, case, baseline=True)
+    expected = summarize(*baseline_db_compare(db_df, input_df))
+    assert summarize(*db_engines(db_df, input_df, {}, 2)[engine]()) == expected
+
+
+@pytest.mark.parametrize('engine', [e for e in ENGINES if e != 'sequential'])
+@pytest.mark.parametrize('rules', sorted(EXTENDED_RULES))
+def test_db_engines_match_sequential_with_rules_and_id_forms(case, engine, rules):
+    db_df, input_df = fuzz_case(300, case)
+    engines = db_engines(db_df, input_df, EXTENDED_RULES[rules], 2)
+    assert summarize(*engines[engine]()) == summarize(*engines['sequential']())
+
+
+def test_gui_path_matches_the_baseline(case):
+    db_df, input_df = fuzz_case(300, case, baseline=True)
+    assert summarize_gui(*gui_engine(db_df, input_df, {})) == summarize_gui(*baseline_gui_compare(db_df, input_df))
+
+
+def test_sequential_keeps_feed_order_of_new_rows(case):
+    db_df, input_df = fuzz_case(300, case, baseline=True)
+    expected, new_items, _, _ = baseline_db_compare(db_df, input_df)
+    result, got, _, _ = DataComparator()._compare_sequential(db_df.copy(), input_df, list(input_df.columns))
+    assert [row.name for row in got] == [row.name for row in new_items]
+    assert list(result.iloc[len(db_df):, 1]) == list(expected.iloc[len(db_df):, 1])
+
+
+def test_in_memory_compare_leaves_its_inputs_alone(case):
+    db_df, input_df = fuzz_case(300, case)
+    before = db_df.copy()
+    result = DataComparator().compare_db_frames(db_df, input_df)
+    assert db_df.equals(before)
+    assert len(result['db']) == len(db_df) + len(result['new_items'])
+
+
+def test_compare_frames_matches_the_baseline(case):
+    db_df, _ = fuzz_case(300, case, baseline=True)
+    other = changed_copy(db_df, case)
+    result = DataComparator().compare_frames([db_df, other], names=['a', 'b'])
+    got = [(d['row'], tuple(item['column'] for item in d['differences'])) for d in result['differences']]
+    assert got == baseline_find_differences(db_df, other)
+    compiled = CompareRules().compile(list(db_df.columns))
+    assert result['differences'] == find_differences(db_df, other, 'a', 'b', compiled)
+
+
+def test_db_compare_files_match_compare_db_frames(workdir, catalog):
+    db_df, feed = catalog(50), catalog(50, seed=1)
+    feed.loc[[3, 7], '库存'] += 1
+    db_file, feed_file = str(workdir / 'db.csv'), str(workdir / 'feed.csv')
+    db_df.to_csv(db_file, index=False)
+    feed.to_csv(feed_file, index=False)
+
+    in_memory = DataComparator().compare_db_frames(db_file, feed_file)
+    _, _, report = DataComparator().db_compare(db_file, feed_file)
+    assert summarize(in_memory['db'], in_memory['new_items'], in_memory['updates'], in_memory['matches']) == \
+        summarize(DataComparator()._read(db_file), report['new_items'], report['updates'], report['matches'])
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.compare_equivalence import EXTENDED_RULES, changed_copy, fuzz_case
+from logic.compare_rules import CompareRules
+
+
+def per_cell(df1, df2):
+    """The original comparison: row1[col] != row2[col], cell by cell"""
+    return np.array([[bool(df1.iat[i, j] != df2.iat[i, j]) for j in range(df1.shape[1])]
+                     for i in range(len(df1))], dtype=bool)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_plain_rules_match_the_per_cell_compare(seed):
+    rng = np.random.default_rng(seed)
+    df1, _ = fuzz_case(200, rng)
+    df2 = changed_copy(df1, rng)
+    df2.loc[df2.index[::11], '库存'] = np.nan
+    df1.loc[df1.index[::13], '品牌'] = np.nan  # NaN against None and NaN
+    compiled = CompareRules().compile(list(df1.columns))
+
+    expected = per_cell(df1, df2)
+    assert (compiled.differs(df1, df2).to_numpy() == expected).all()
+    for i in range(0, len(df1), 17):
+        assert compiled.row_differs(df1.iloc[i], df2.iloc[i]) == list(df1.columns[expected[i]])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_row_differs_matches_the_vectorized_diff(seed):
+    rng = np.random.default_rng(seed)
+    df1, _ = fuzz_case(200, rng)
+    df2 = changed_copy(df1, rng)
+    df2.loc[df2.index[::7], '备注'] = ' 促销 '
+    compiled = CompareRules.from_dict(EXTENDED_RULES['tolerant']).compile(list(df1.columns))
+
+    mask = compiled.differs(df1, df2)
+    for i in range(len(df1)):
+        assert compiled.row_differs(df1.iloc[i], df2.iloc[i]) == list(mask.columns[mask.iloc[i].to_numpy()])
+
+
+@pytest.mark.parametrize('spec, old, new, differs', [
+    ({'tolerance': 0.01}, 1.0, 1.005, False),
+    ({'tolerance': 0.01}, 1.0, 1.02, True),
+    ({'tolerance': 0.01}, '1.0', 1.005, False),
+    ({'rel_tolerance': 0.1}, 100, 109, False),
+    ({'rel_tolerance': 0.1}, 100, 112, True),
+    ({'trim': True}, ' 促销 ', '促销', False),
+    ({'casefold': True}, 'ABC', 'abc', False),
+    ({'trim': True}, '促销', '新品', True),
+    ({'date': True}, '2024-01-05', '2024/01/05', False),
+    ({'date': True}, '2024-01-05', '2024-01-06', True),
+    ({'nan_equal': True}, None, np.nan, False),
+    ({}, None, None, False),
+    ({}, np.nan, np.nan, True),
+    ({}, None, np.nan, True),
+])
+def test_settings(spec, old, new, differs):
+    compiled = CompareRules(columns={'值': spec}).compile(['值'])
+    left = pd.DataFrame({'值': pd.Series([old], dtype=object)})
+    right = pd.DataFrame({'值': pd.Series([new], dtype=object)})
+    assert bool(compiled.differs(left, right).iat[0, 0]) is differs
+    assert compiled.row_differs(left.iloc[0], right.iloc[0]) == (['值'] if differs else [])
+
+
+def test_ignored_columns_are_not_compiled():
+    rules = CompareRules(ignore=['备注'], default={'trim': True})
+    assert rules.compile(['名称', '商品ID', '备注']).columns == ['名称', '商品ID']
+    with pytest.raises(ValueError):
+        CompareRules(default={'tolerence': 1})
@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+import pytest
+
+from logic.snapshot_store import SnapshotStore
+from utils.compare_service import CompareClient, CompareService
+from utils.db_catalog import DatabaseCatalog
+from utils.table_reader import read_table
+
+
+@pytest.fixture
+def service(workdir, catalog):
+    db_file = str(workdir / 'db.csv')
+    catalog(5).to_csv(db_file, index=False)
+    db_catalog = DatabaseCatalog(str(workdir / 'catalog.json'))
+    db_catalog.register(db_file)
+    service = CompareService(db_file, port=0, token_file=str(workdir / 'service.token'),
+                             catalog=db_catalog, snapshot_store=SnapshotStore(str(workdir / 'snapshots')))
+    service.start()
+    yield service
+    service.stop(timeout=5)
+
+
+def client_for(service, token_file=None):
+    return CompareClient(port=service.port, token_file=token_file or service.token_file)
+
+
+def test_requests_need_the_session_token(service, workdir):
+    assert client_for(service).status()['db_file'] == service.db_file
+    with pytest.raises(ValueError):
+        client_for(service, token_file=str(workdir / 'missing.token')).status()
+
+
+def test_db_job_refreshes_catalog_and_snapshot(service, workdir, catalog):
+    feed = pd.concat([catalog(5), catalog(2, start=100005)], ignore_index=True)
+    feed.loc[0, '价格'] = 12345.0
+    feed_file = str(workdir / 'feed.csv')
+    feed.to_csv(feed_file, index=False)
+    before = service.catalog.current()['content_hash']
+
+    client = client_for(service)
+    job = client.wait(client.submit('db', [feed_file], columns=['价格']), timeout=30)
+
+    assert job['status'] == 'done', job['message']
+    assert (job['result']['new_items'], job['result']['updates']) == (2, 1)
+    assert len(read_table(service.db_file)) == 7
+    entry = service.catalog.current()
+    assert entry['rows'] == 7
+    assert entry['content_hash'] != before
+    assert not DatabaseCatalog._stale(entry)
+    [version] = service.snapshot_store.list_versions()
+    assert version['rows'] == 7
+
+
+def test_unregistered_database_is_rejected(service, workdir, catalog):
+    other = str(workdir / 'other.csv')
+    catalog(3).to_csv(other, index=False)
+    with pytest.raises(ValueError):
+        client_for(service).submit('db', [other], db_file=other)
+    assert not os.path.exists(str(workdir / 'results'))
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+
+from utils.blob_store import BlobStore
+from utils.db_catalog import DatabaseCatalog
+
+
+def register(workdir, catalog, rows=5):
+    db_file = str(workdir / 'db.csv')
+    catalog(rows).to_csv(db_file, index=False)
+    db_catalog = DatabaseCatalog(str(workdir / 'catalog.json'))
+    db_catalog.register(db_file, catalog(rows))
+    return db_catalog, db_file
+
+
+def test_current_entry_survives_a_reload(workdir, catalog):
+    db_catalog, db_file = register(workdir, catalog)
+    entry = DatabaseCatalog(db_catalog.catalog_path).current()
+    assert (entry['path'], entry['rows'], entry['format']) == (db_file, 5, 'csv')
+    assert entry['content_hash'] == BlobStore.hash_file(db_file)
+
+
+def test_file_rewritten_behind_the_catalog_is_refreshed(workdir, catalog):
+    db_catalog, db_file = register(workdir, catalog)
+    df = catalog(8)
+    df['备注'] = 'x'
+    df.to_csv(db_file, index=False)
+    os.utime(db_file, ns=(1, 1))  # a different mtime even on coarse clocks
+
+    entry = db_catalog.current()
+    assert entry['content_hash'] == BlobStore.hash_file(db_file)
+    assert entry['columns'][-1] == '备注'
+    assert entry['rows'] is None
+    assert not DatabaseCatalog._stale(entry)
+    assert DatabaseCatalog(db_catalog.catalog_path).current()['content_hash'] == entry['content_hash']
+
+
+def test_touched_file_with_the_same_content_keeps_its_entry(workdir, catalog):
+    db_catalog, db_file = register(workdir, catalog)
+    os.utime(db_file, ns=(1, 1))
+    entry = db_catalog.current()
+    assert entry['rows'] == 5
+    assert 'updated_at' not in entry
+    assert entry['mtime_ns'] == 1
+
+
+def test_update_path_refreshes_the_newest_entry_of_that_file(workdir, catalog):
+    db_catalog, db_file = register(workdir, catalog)
+    other = str(workdir / 'other.csv')
+    catalog(2).to_csv(other, index=False)
+    db_catalog.register(other)
+
+    df = pd.concat([catalog(5), catalog(1, start=200000)], ignore_index=True)
+    df.to_csv(db_file, index=False)
+    entry = db_catalog.update_path(os.path.join(str(workdir), '.', 'db.csv'), df)
+    assert entry['rows'] == 6
+    assert entry['content_hash'] == BlobStore.hash_file(db_file)
+    assert db_catalog.current()['path'] == other
+    assert db_catalog.update_path(str(workdir / 'missing.csv')) is None
+
+
+def test_rebuild_registers_the_newest_db_file(workdir, catalog):
+    os.makedirs('data/csv')
+    os.makedirs('data/xlsx')
+    catalog(3).to_csv('data/csv/old.csv', index=False)
+    os.utime('data/csv/old.csv', ns=(1, 1))
+    catalog(4).to_excel('data/xlsx/new.xlsx', index=False)
+    entry = DatabaseCatalog().rebuild_from_disk()
+    assert entry['path'] == os.path.join('data', 'xlsx', 'new.xlsx')
+    assert DatabaseCatalog().current()['format'] == 'xlsx'
@@ -0,0 +1,71 @@
+import os
+import threading
+
+import pandas as pd
+
+from logic.diff_logic import DataComparator
+from utils.blob_store import BlobStore
+from utils.folder_watcher import FolderWatcher
+from utils.table_reader import read_table
+
+
+def make_watcher(workdir, db_file):
+    watcher = FolderWatcher(str(workdir / 'drop'), db_file, backup_dir=str(workdir / 'backup'),
+                            blob_store=BlobStore(str(workdir / 'store')))
+    for path in (watcher.watch_dir, watcher.processed_dir, watcher.failed_dir, watcher.backup_dir):
+        os.makedirs(path, exist_ok=True)
+    return watcher
+
+
+def test_same_named_feeds_keep_separate_backups(workdir, catalog):
+    db_file = str(workdir / 'db.csv')
+    catalog(5).to_csv(db_file, index=False)
+    watcher = make_watcher(workdir, db_file)
+
+    for price in (1.0, 2.0):
+        feed = catalog(5)
+        feed['价格'] = price
+        path = os.path.join(watcher.watch_dir, 'feed.csv')
+        feed.to_csv(path, index=False)
+        result = watcher._ingest(path)
+        assert result['success'], result['message']
+
+    assert len(os.listdir(watcher.backup_dir)) == 2
+    processed = [n for n in os.listdir(watcher.processed_dir) if n.endswith('feed.csv')]
+    assert len(processed) == 2
+    assert (read_table(db_file)['价格'] == 2.0).all()
+
+
+def test_set_database_retargets_later_feeds(workdir, catalog):
+    old_db, new_db = str(workdir / 'old.csv'), str(workdir / 'new.csv')
+    catalog(3).to_csv(old_db, index=False)
+    catalog(3).to_csv(new_db, index=False)
+    watcher = make_watcher(workdir, old_db)
+    watcher.set_database(new_db)
+
+    path = os.path.join(watcher.watch_dir, 'feed.csv')
+    catalog(1, start=200000).to_csv(path, index=False)
+    assert watcher._ingest(path)['success']
+    assert (len(read_table(old_db)), len(read_table(new_db))) == (3, 4)
+
+
+def test_concurrent_writers_keep_each_others_updates(workdir, catalog):
+    # Without the per-DB lock both read the same old DB and the last write wins
+    db_file = str(workdir / 'db.csv')
+    catalog(200).to_csv(db_file, index=False)
+    feeds = []
+    for i in range(4):
+        path = str(workdir / f'feed{i}.csv')
+        catalog(20, seed=i, start=300000 + 1000 * i).to_csv(path, index=False)
+        feeds.append(path)
+
+    results = []
+    threads = [threading.Thread(target=lambda p=p: results.append(DataComparator().db_compare(db_file, p)))
+               for p in feeds]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(ok for ok, _, _ in results)
+    assert len(read_table(db_file)) == 200 + 4 * 20
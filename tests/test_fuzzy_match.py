@@ -0,0 +1,107 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from logic.compare_rules import CompareRules
+from logic.diff_logic import DataComparator
+from logic.fuzzy_match import FuzzyMatcher, _ngrams, normalize_name
+
+SYLLABLES = ['牛奶', '面包', '苹果', '洗发水', 'Pro', 'Max', '家庭装', '500ml', '特价', '原味', 'A', '香草']
+
+
+def brute_force(matcher, feed, db):
+    """Cosine similarity of every same-block pair, assigned greedily best first"""
+    def vector(name):
+        return Counter(_ngrams(normalize_name(name), matcher.ngram))
+
+    def block(df, i, name):
+        values = [normalize_name(name)[:matcher.prefix]]
+        values += [str(df[col].iat[i]).strip().casefold() for col in matcher.block_columns]
+        return tuple(values)
+
+    candidates = []
+    for i, a in enumerate(feed['名称']):
+        for j, b in enumerate(db['名称']):
+            if not normalize_name(a) or block(feed, i, a) != block(db, j, b):
+                continue
+            va, vb = vector(a), vector(b)
+            score = sum(c * vb[g] for g, c in va.items()) / np.sqrt(
+                sum(c * c for c in va.values()) * sum(c * c for c in vb.values()))
+            if score >= matcher.threshold - 1e-9:
+                candidates.append((i, j, score))
+    candidates.sort(key=lambda c: -c[2])
+    used_feed, used_db, pairs = set(), set(), {}
+    for i, j, score in candidates:
+        if i not in used_feed and j not in used_db:
+            used_feed.add(i)
+            used_db.add(j)
+            pairs[(i, j)] = score
+    return pairs
+
+
+def products(rng, rows):
+    names = [''.join(rng.choice(SYLLABLES, rng.integers(2, 5))) + str(i) for i in range(rows)]
+    return pd.DataFrame({'名称': names, '商品ID': np.arange(rows), '品牌': rng.choice(['A', 'B'], rows)})
+
+
+def renamed(rng, db):
+    """Feed rows: some DB names with small edits, some unrelated"""
+    feed = db.sample(frac=0.5, random_state=int(rng.integers(1000))).reset_index(drop=True)
+    feed['名称'] = [n.replace('装', ' 装').upper() if k % 2 else n + '新' for k, n in enumerate(feed['名称'])]
+    return pd.concat([feed, products(rng, 10)], ignore_index=True)
+
+
+def found(pairs):
+    return {(i, j): score for i, j, score in pairs}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_the_brute_force_pairs(seed):
+    rng = np.random.default_rng(seed)
+    db = products(rng, 60)
+    feed = renamed(rng, db)
+    matcher = FuzzyMatcher(block_columns=['品牌'], threshold=0.6)
+    got = found(matcher.match(feed, db))
+    expected = brute_force(matcher, feed, db)
+    assert got.keys() == expected.keys()
+    assert all(got[k] == pytest.approx(expected[k]) for k in got)
+
+
+def test_chunked_scoring_finds_the_same_pairs():
+    rng = np.random.default_rng(7)
+    db = products(rng, 80)
+    feed = renamed(rng, db)
+    matcher = FuzzyMatcher(threshold=0.6)
+    expected = matcher.match(feed, db)
+    matcher.PAIR_LIMIT = 50
+    assert matcher.match(feed, db) == expected
+
+
+def test_split_blocks_only_pair_rows_of_one_prefix():
+    rng = np.random.default_rng(3)
+    db = products(rng, 80)
+    feed = renamed(rng, db)
+    matcher = FuzzyMatcher(threshold=0.6, max_block=5)
+    pairs = matcher.match(feed, db)
+    assert pairs
+    for i, j, score in pairs:
+        assert normalize_name(feed['名称'].iat[i])[:2] == normalize_name(db['名称'].iat[j])[:2]
+        assert score >= 0.6
+
+
+def test_db_compare_reports_renamed_ids_as_probable(workdir, catalog):
+    db = catalog(10)
+    feed = db.copy()
+    feed.loc[3, '商品ID'] = 999999
+    feed.loc[3, '名称'] = '商品3 '
+    db_file, feed_file = str(workdir / 'db.csv'), str(workdir / 'feed.csv')
+    db.to_csv(db_file, index=False)
+    feed.to_csv(feed_file, index=False)
+
+    rules = CompareRules(fuzzy_match={'threshold': 0.8})
+    _, _, report = DataComparator(rules).db_compare(db_file, feed_file, columns=['价格'])
+    [probable] = report['probable_matches']
+    assert (probable['product_id'], probable['db_product_id']) == (999999, 100003)
+    assert report['new_items'] == []
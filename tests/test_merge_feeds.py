@@ -0,0 +1,63 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from benchmarks.compare_equivalence import canonical_table
+from logic.diff_logic import DataComparator
+from utils.table_reader import read_table
+
+
+@pytest.fixture
+def feeds(workdir, catalog):
+    db = catalog(30)
+    first = pd.concat([catalog(20), catalog(4, seed=1, start=200000)], ignore_index=True)
+    first.loc[:5, '价格'] += 1
+    second = pd.concat([catalog(30).iloc[10:], catalog(4, seed=1, start=200002)], ignore_index=True)
+    second.loc[:3, '价格'] += 2  # IDs 100010-100013, not changed by the first feed
+    second.loc[len(second) - 1, '库存'] = 999  # 200005, new in the second feed only
+    second = pd.concat([second, second.iloc[[0]].assign(库存=-1)], ignore_index=True)  # last row of an ID wins
+
+    paths = {}
+    for name, df in (('db', db), ('first', first), ('second', second)):
+        paths[name] = str(workdir / f"{name}.csv")
+        df.to_csv(paths[name], index=False)
+    return paths
+
+
+def applied_one_by_one(workdir, paths, order):
+    db_file = str(workdir / 'sequential.csv')
+    shutil.copy(paths['db'], db_file)
+    for name in order:
+        assert DataComparator().db_compare(db_file, paths[name], use_cache=False)[0]
+    return read_table(db_file)
+
+
+@pytest.mark.parametrize('rule, order', [('last', ('first', 'second')), ('first', ('second', 'first'))])
+@pytest.mark.parametrize('shards', [None, 2])
+def test_merge_matches_applying_the_feeds_in_order(workdir, feeds, rule, order, shards):
+    expected = applied_one_by_one(workdir, feeds, order)
+    success, message, report = DataComparator().merge_feeds(feeds['db'], [feeds['first'], feeds['second']],
+                                                            rule=rule, shards=shards)
+    assert success, message
+    assert canonical_table(read_table(feeds['db'])) == canonical_table(expected)
+    assert len(report['new_items']) == 6
+    assert [f['rows'] for f in report['feeds']] == [24, 25]
+
+
+def test_merge_reports_conflicts_and_sources(feeds):
+    _, _, report = DataComparator().merge_feeds(feeds['db'], [feeds['first'], feeds['second']],
+                                                columns=['价格', '库存'])
+    conflicting = {str(c['product_id']) for c in report['conflicts']}
+    assert {'100010', '200002', '200003'} <= conflicting
+    assert '200005' not in conflicting  # only in the second feed
+    sources = {str(u['product_id']): u['source'] for u in report['updates']}
+    assert sources['100000'] == 'first.csv'
+    assert sources['100010'] == 'second.csv'
+    assert read_table(feeds['db']).set_index('商品ID').at[100010, '库存'] == -1
+
+
+def test_unknown_rule_and_bad_headers_are_rejected(workdir, feeds, catalog):
+    assert not DataComparator().merge_feeds(feeds['db'], [feeds['first']], rule='newest')[0]
+    catalog(3).drop(columns=['品牌']).to_csv(str(workdir / 'bad.csv'), index=False)
+    assert not DataComparator().merge_feeds(feeds['db'], [str(workdir / 'bad.csv')])[0]
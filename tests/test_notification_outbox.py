@@ -0,0 +1,181 @@
+"""NotificationOutbox delivery against a local stand-in SMTP server
+
+Uses aiosmtpd when it is installed and the standard library smtpd
+(Python < 3.12) otherwise.
+
+    python -m pytest tests/test_notification_outbox.py
+"""
+import os
+import json
+import socket
+import threading
+import warnings
+from email import message_from_bytes, message_from_string
+
+import pytest
+
+from utils.notification_outbox import NotificationOutbox
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        import asyncore
+        import smtpd
+except ImportError:
+    smtpd = None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class StandInSMTP:
+    """Local SMTP server keeping the received messages in .messages"""
+
+    def __init__(self):
+        self.port = free_port()
+        self.messages = []
+        self._received = threading.Condition()
+
+    def _receive(self, data):
+        message = message_from_bytes(data) if isinstance(data, bytes) else message_from_string(data)
+        with self._received:
+            self.messages.append(message)
+            self._received.notify_all()
+
+    def wait_for(self, count, timeout=10.0):
+        with self._received:
+            return self._received.wait_for(lambda: len(self.messages) >= count, timeout)
+
+    def start(self):
+        if Controller is not None:
+            stand_in = self
+
+            class Handler:
+                async def handle_DATA(self, server, session, envelope):
+                    stand_in._receive(envelope.content)
+                    return '250 OK'
+
+            self._controller = Controller(Handler(), hostname='127.0.0.1', port=self.port)
+            self._controller.start()
+            return
+        stand_in = self
+
+        class Server(smtpd.SMTPServer):
+            def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+                stand_in._receive(data)
+
+        self._map = {}
+        self._stopped = threading.Event()
+        Server(('127.0.0.1', self.port), None, map=self._map, decode_data=False)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            asyncore.loop(timeout=0.05, map=self._map, count=1)
+
+    def stop(self):
+        if Controller is not None:
+            self._controller.stop()
+        else:
+            self._stopped.set()
+            self._thread.join(5)
+            asyncore.close_all(self._map)
+
+
+def stored_text(outbox_dir):
+    """Everything the outbox has written to disk"""
+    text = []
+    for root, _, files in os.walk(outbox_dir):
+        for name in files:
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                text.append(f.read())
+    return '\n'.join(text)
+
+
+pytestmark = pytest.mark.skipif(Controller is None and smtpd is None, reason="needs aiosmtpd or smtpd")
+
+
+@pytest.fixture
+def server():
+    server = StandInSMTP()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    outboxes = []
+
+    def make(port, **kwargs):
+        outbox = NotificationOutbox(str(tmp_path), host='127.0.0.1', port=port, username='',
+                                    starttls=False, poll_interval=0.05, timeout=5, **kwargs)
+        outboxes.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in outboxes:
+        outbox.stop(5)
+
+
+def failed_records(outbox):
+    records = []
+    for name in os.listdir(outbox.failed_dir):
+        with open(os.path.join(outbox.failed_dir, name), encoding='utf-8') as f:
+            records.append(json.load(f))
+    return records
+
+
+def test_delivers_messages(server, make_outbox):
+    outbox = make_outbox(server.port)
+    outbox.enqueue('user@example.com', '系统锁定通知', "已被锁定15分钟")
+    outbox.enqueue('user@example.com', '密码重置验证码', "验证码: 1a2b3c4d", secret=True, expires_in=900)
+
+    assert outbox.flush(10)
+    assert server.wait_for(2)
+    bodies = [m.get_payload(decode=True).decode('utf-8') for m in server.messages]
+    assert len(bodies) == 2
+    assert any('1a2b3c4d' in body for body in bodies)
+    assert outbox.pending_count() == 0
+    assert failed_records(outbox) == []
+
+
+def test_secret_waiting_for_retry_is_not_written(tmp_path, make_outbox):
+    outbox = make_outbox(free_port(), base_delay=60)
+    outbox.enqueue('user@example.com', '密码重置验证码', "验证码: 1a2b3c4d", secret=True)
+
+    assert outbox.flush(10)  # first attempt failed, next one in a minute
+    assert outbox.pending_count() == 1
+    assert failed_records(outbox) == []
+    assert '1a2b3c4d' not in stored_text(tmp_path)
+
+
+def test_failed_secret_is_recorded_without_body(tmp_path, make_outbox):
+    outbox = make_outbox(free_port(), max_retries=1)
+    outbox.enqueue('user@example.com', '密码重置验证码', "验证码: 1a2b3c4d", secret=True)
+
+    assert outbox.flush(10)
+    assert outbox.pending_count() == 0
+    [record] = failed_records(outbox)
+    assert record['body'] is None
+    assert record['last_error']
+    assert '1a2b3c4d' not in stored_text(tmp_path)
+
+
+def test_expired_message_is_not_sent(server, make_outbox):
+    outbox = make_outbox(server.port)
+    outbox.enqueue('user@example.com', '密码重置验证码', "验证码: 1a2b3c4d", secret=True, expires_in=0)
+
+    assert outbox.flush(10)
+    assert not server.wait_for(1, timeout=0.5)
+    assert outbox.pending_count() == 0
+    [record] = failed_records(outbox)
+    assert record['last_error'] == "expired before delivery"
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.compare_equivalence import baseline_db_compare, fuzz_case, summarize
+from logic.diff_logic import DataComparator
+from logic.product_index import ProductIndex, normalize_key, normalize_keys
+
+
+@pytest.mark.parametrize('value', [1001, 1001.0, np.int64(1001), np.float64(1001.0), '1001', ' 1001 ',
+                                   '1001.0', '001001', '+1001'])
+def test_id_forms_share_one_key(value):
+    assert normalize_key(value) == '1001'
+
+
+@pytest.mark.parametrize('value', [None, np.nan, pd.NaT, '', '   '])
+def test_blank_ids_have_no_key(value):
+    assert normalize_key(value) is None
+
+
+def test_other_ids_keep_their_text():
+    assert [normalize_key(v) for v in ('A-01', 'a-01', 10.5, '-007', '0')] == ['A-01', 'a-01', '10.5', '-7', '0']
+    keys = pd.Series([1, '001', 2.0, None, 'x'], dtype=object)
+    assert list(normalize_keys(keys)) == ['1', '1', '2', None, 'x']
+
+
+def test_index_positions_duplicates_and_forms():
+    index = ProductIndex(pd.Series([1001, '1001', 1002.0, None, 'B7', 1001.0], dtype=object))
+    assert index.first('001001') == 0
+    assert index.positions(1001) == [0, 1, 5]
+    assert index.first(None) is None and index.first(9) is None
+    assert list(index.lookup(pd.Series(['1002', 1001, None, 'b7']))) == [2, 0, -1, -1]
+    assert index.duplicates() == {'1001': [0, 1, 5]}
+    # 1001 and 1001.0 are one raw value to pd.factorize
+    assert index.mismatches() == [{'key': '1001', 'forms': ['int:1001', 'str:1001']}]
+
+    index.add('B7', 6)
+    index.add(None, 7)
+    assert index.positions('B7') == [4, 6]
+    assert list(index.lookup(pd.Series(['B7']))) == [4]
+
+
+def test_mismatches_against_the_feed_only_report_shared_ids():
+    db = ProductIndex(pd.Series([1001, 1002]))
+    feed = ProductIndex(pd.Series(['1001', 1002, '1003']))
+    assert db.mismatches(feed) == [{'key': '1001', 'forms': ['int:1001', 'str:1001']}]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_db_compare_matches_the_baseline_with_duplicate_ids(seed):
+    db_df, input_df = fuzz_case(300, np.random.default_rng(seed), baseline=True)
+    assert ProductIndex(db_df.iloc[:, 1]).duplicates()
+    result = DataComparator()._compare_sequential(db_df.copy(), input_df, list(input_df.columns))
+    assert summarize(*result) == summarize(*baseline_db_compare(db_df, input_df))
+
+
+def test_zero_padded_text_ids_match_numeric_db_ids(catalog):
+    db_df = catalog(5)
+    feed = db_df.copy()
+    feed['商品ID'] = [f"00{v}" for v in feed['商品ID']]
+    feed.loc[2, '价格'] += 1
+    _, new_items, updates, matches = DataComparator()._compare_sequential(db_df.copy(), feed, ['价格'])
+    assert (len(new_items), [u['product_id'] for u in updates], matches) == (0, ['00100002'], 4)
@@ -0,0 +1,48 @@
+import shutil
+
+import pandas as pd
+
+import logic.diff_logic
+from logic.compare_rules import CompareRules
+from logic.diff_logic import DataComparator
+
+
+def write_feed(workdir, catalog):
+    db = catalog(40)
+    db['备注'] = 'db'
+    feed = pd.concat([db, catalog(10, seed=1, start=200000).assign(备注='feed')], ignore_index=True)
+    feed.loc[:4, '价格'] += 1
+    feed['备注'] = 'feed'  # ignored by the rules
+    db_file, feed_file = str(workdir / 'db.csv'), str(workdir / 'feed.csv')
+    db.to_csv(db_file, index=False)
+    feed.to_csv(feed_file, index=False)
+    return db_file, feed_file
+
+
+def test_full_sample_matches_the_comparison(workdir, catalog):
+    db_file, feed_file = write_feed(workdir, catalog)
+    rules = CompareRules(ignore=['备注'])
+    success, _, estimate = DataComparator(rules).quick_estimate(db_file, feed_file, fraction=1)
+    assert success
+
+    shutil.copy(db_file, str(workdir / 'copy.csv'))
+    success, _, report = DataComparator(rules).db_compare(str(workdir / 'copy.csv'), feed_file)
+    assert success
+    assert estimate['new']['estimated'] == len(report['new_items']) == 10
+    assert estimate['changed']['estimated'] == len(report['updates'])
+    assert estimate['unchanged']['estimated'] == report['matches']
+
+
+def test_reads_only_the_id_and_compared_columns(workdir, catalog, monkeypatch):
+    db_file, feed_file = write_feed(workdir, catalog)
+    reads = []
+
+    def read_table(path, usecols=None, row_index=False):
+        reads.append(usecols)
+        return pd.read_csv(path, usecols=usecols)[usecols]
+
+    monkeypatch.setattr(logic.diff_logic, 'read_table', read_table)
+    comparator = DataComparator(CompareRules(ignore=['备注']))
+    assert comparator.quick_estimate(db_file, feed_file, fraction=0.5)[0]
+    assert comparator.quick_estimate(db_file, feed_file, columns=['价格'])[0]
+    assert reads == [['名称', '商品ID', '类别', '价格', '库存', '品牌']] * 2 + [['名称', '商品ID', '价格']] * 2
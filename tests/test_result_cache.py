@@ -0,0 +1,53 @@
+import shutil
+
+import pandas as pd
+
+from logic.diff_logic import DataComparator
+
+
+def write_files(workdir, catalog):
+    db_file, feed_file = str(workdir / 'db.csv'), str(workdir / 'feed.csv')
+    catalog(20).to_csv(db_file, index=False)
+    feed = pd.concat([catalog(20), catalog(3, seed=1, start=200000)], ignore_index=True)
+    feed.loc[0, '价格'] += 1
+    feed.to_csv(feed_file, index=False)
+    return db_file, feed_file
+
+
+def test_rerun_after_write_reports_nothing_pending(workdir, catalog):
+    db_file, feed_file = write_files(workdir, catalog)
+    comparator = DataComparator()
+
+    _, _, first = comparator.db_compare(db_file, feed_file, columns=['价格'])
+    assert (len(first['new_items']), len(first['updates'])) == (3, 1)
+
+    _, message, second = comparator.db_compare(db_file, feed_file, columns=['价格'])
+    assert 'cached' not in message
+    assert (len(second['new_items']), len(second['updates'])) == (0, 0)
+
+    _, message, third = DataComparator().db_compare(db_file, feed_file, columns=['价格'])
+    assert 'cached' in message
+    assert (len(third['new_items']), len(third['updates'])) == (0, 0)
+
+
+def test_restored_db_is_compared_again(workdir, catalog):
+    db_file, feed_file = write_files(workdir, catalog)
+    shutil.copy(db_file, str(workdir / 'original.csv'))
+    comparator = DataComparator()
+    comparator.db_compare(db_file, feed_file, columns=['价格'])
+    comparator.db_compare(db_file, feed_file, columns=['价格'])
+
+    shutil.copy(str(workdir / 'original.csv'), db_file)
+    _, message, report = comparator.db_compare(db_file, feed_file, columns=['价格'])
+    assert 'cached' not in message
+    assert (len(report['new_items']), len(report['updates'])) == (3, 1)
+
+
+def test_manual_compare_reuses_the_report(workdir, catalog):
+    files = [str(workdir / 'a.csv'), str(workdir / 'b.csv')]
+    catalog(5).to_csv(files[0], index=False)
+    catalog(5, seed=1).to_csv(files[1], index=False)
+
+    _, _, report = DataComparator().manual_compare(files)
+    _, message, cached = DataComparator().manual_compare(files)
+    assert 'cached' in message and cached == report
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from logic.diff_logic import DataComparator
+from utils.row_index import RowOffsetIndex
+from utils.table_reader import read_table, source_lines
+
+
+def test_rows_match_the_parsed_frame_across_blank_lines(workdir):
+    path = str(workdir / 'feed.csv')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('\n名称,商品ID\n商品0,100\n\n商品1,101\r\n\r\n   \n"多\n行",102\n,\n商品3,103\n\n')
+    df = read_table(path)
+
+    lines = dict(source_lines(path, 2, context=10))
+    assert len(lines) == len(df) + 1
+    assert lines[1] == '名称,商品ID'
+    for i, product_id in enumerate(df['商品ID']):
+        if pd.notna(product_id):
+            assert lines[i + 2].endswith(str(int(product_id)))
+    assert lines[4] == '"多\n行",102'
+
+
+def test_comparisons_write_no_sidecar_unless_asked(workdir, catalog):
+    files = [str(workdir / 'a.csv'), str(workdir / 'b.csv')]
+    for path in files:
+        catalog(5).to_csv(path, index=False)
+
+    assert DataComparator().manual_compare(files)[0]
+    assert not any(name.endswith(RowOffsetIndex.SUFFIX) for name in os.listdir(workdir))
+    catalog(6).to_csv(files[1], index=False)  # not a cached result
+    assert DataComparator(row_index=True).manual_compare(files)[0]
+    assert RowOffsetIndex.load(files[0]) is not None
+
+
+def test_old_sidecar_format_is_rebuilt(workdir, catalog):
+    path = str(workdir / 'db.csv')
+    catalog(3).to_csv(path, index=False)
+    index = RowOffsetIndex.build(path)
+    with open(RowOffsetIndex.sidecar_path(path), 'wb') as f:
+        np.save(f, np.concatenate([np.array(RowOffsetIndex._signature(path)), index.offsets[:1]]))
+
+    assert RowOffsetIndex.load(path) is None
+    assert len(RowOffsetIndex.ensure(path)) == 4
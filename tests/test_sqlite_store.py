@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from logic.compare_rules import CompareRules
+from logic.diff_logic import DataComparator
+from utils.sqlite_store import SQLiteProductStore
+from utils.table_reader import read_table
+
+
+def feed_frame(missing=True):
+    df = pd.DataFrame({
+        '名称': ['a', 'b', 'c'],
+        '商品ID': [1001, 1002, 1003],
+        '价格': [1.5, 2.5, 3.0],
+        '上架日期': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-03-01']),
+        '备注': ['x', 'y', 'z'],
+        '库存': [1, 2, 3],
+    })
+    if missing:
+        df.loc[1, ['价格', '备注']] = np.nan
+        df.loc[2, '上架日期'] = pd.NaT
+    return df
+
+
+def write(df, path):
+    if path.endswith('.xlsx'):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def store(workdir):
+    store = SQLiteProductStore(os.path.join(workdir, 'products.sqlite'))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize('ext', ['xlsx', 'csv'])
+def test_reapplying_imported_file_has_no_updates(store, workdir, ext):
+    path = write(feed_frame(missing=False), os.path.join(workdir, f'feed.{ext}'))
+    store.import_dataframe(read_table(path))
+
+    ok, _, report = DataComparator().store_compare(store, path)
+    assert ok
+    assert (report['matches'], report['updates'], report['new_items']) == (3, [], [])
+
+
+@pytest.mark.parametrize('ext', ['xlsx', 'csv'])
+def test_reapplying_with_missing_values_and_nan_equal(store, workdir, ext):
+    path = write(feed_frame(), os.path.join(workdir, f'feed.{ext}'))
+    store.import_dataframe(read_table(path))
+
+    comparator = DataComparator(CompareRules(default={'nan_equal': True}))
+    ok, _, report = comparator.store_compare(store, path)
+    assert ok
+    assert (report['matches'], report['updates']) == (3, [])
+
+
+@pytest.mark.parametrize('ext', ['xlsx', 'csv'])
+def test_store_matches_file_db(store, workdir, ext):
+    # Plain rules: missing cells differ (NaN != NaN) in the file DB too
+    db_path = write(feed_frame(), os.path.join(workdir, f'db.{ext}'))
+    feed = feed_frame()
+    feed.loc[0, '价格'] = 9.9
+    feed.loc[3] = ['d', 1004, 4.0, pd.Timestamp('2024-04-01'), 'w', 4]
+    feed_path = write(feed, os.path.join(workdir, f'feed.{ext}'))
+    store.import_dataframe(read_table(db_path))
+
+    _, _, from_store = DataComparator().store_compare(store, feed_path)
+    _, _, from_file = DataComparator().db_compare(db_path, feed_path)
+
+    def outcome(report):
+        return (report['matches'], [r.iloc[1] for r in report['new_items']],
+                sorted((u['product_id'], tuple(d['column'] for d in u['differences']))
+                       for u in report['updates']))
+    assert outcome(from_store) == outcome(from_file)
+
+
+def test_blank_ids_are_kept_apart_and_new(store):
+    db = pd.DataFrame({'名称': ['a', 'x', 'y'], '商品ID': [1, None, ''], '价格': [1.0, 2.0, 3.0]})
+    store.import_dataframe(db)
+    assert store.count() == 3
+
+    feed = pd.DataFrame({'名称': ['a', 'z'], '商品ID': [1, np.nan], '价格': [1.0, 5.0]})
+    new_rows, changed, unchanged = store.apply_feed(feed, CompareRules().compile(list(feed.columns)))
+    assert ([r['名称'] for r in new_rows], changed, unchanged) == (['z'], [], 1)
+    assert store.count() == 4
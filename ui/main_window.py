@@ -1,19 +1,38 @@
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
     QLabel, QTextEdit, QFileDialog, QMessageBox, QSplitter,
-    QDialog, QLineEdit, QFormLayout, QInputDialog
+    QDialog, QLineEdit, QFormLayout, QInputDialog, QCheckBox
 )
-from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QColor, QTextCharFormat
 import os
 import shutil
 import hashlib
-import smtplib
-from email.mime.text import MIMEText
 from datetime import datetime
 import pandas as pd
+import numpy as np
+from utils.folder_watcher import FolderWatcher
+from utils.compare_service import CompareService, CompareClient, DEFAULT_PORT
+from utils.blob_store import BlobStore
+from logic.result_cache import ResultCache
+from logic.snapshot_store import SnapshotStore
+from utils.db_catalog import DatabaseCatalog
+from utils.notification_outbox import NotificationOutbox
+from utils.sqlite_store import SQLiteProductStore
+from utils.profiler import RunProfiler, env_mode
+from utils.prefetch import TablePrefetcher
+from utils.table_reader import read_header, read_table, projection, source_lines
+from logic.compare_rules import CompareRules
+from logic.product_index import ProductIndex, normalize_keys
+from logic.diff_stats import DiffStats
+from logic.diff_logic import DataComparator, db_lock
+from logic.fuzzy_match import FuzzyMatcher
+from logic.row_status import apply_feed, STATUS_NEW, STATUS_CHANGED, STATUS_UNCHANGED, STATUS_PROBABLE
 
 class MainWindow(QMainWindow):
+    # 后台解析完成(在工作线程中发出，Qt自动转到界面线程处理)
+    prefetch_finished = pyqtSignal(str, object)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle("产品数据比对系统 3.0")
@@ -28,9 +47,24 @@ class MainWindow(QMainWindow):
         self.manual_files = []
         self.db_compare_file = None
         self.current_db_file = None
+        self.folder_watcher = None
+        self.compare_service = None
+        self.product_store = None
         
         # 确保数据目录存在
         os.makedirs('data', exist_ok=True)
+        self.blob_store = BlobStore()
+        self.result_cache = ResultCache()
+        self.snapshot_store = SnapshotStore()
+        self.db_catalog = DatabaseCatalog()
+        self.outbox = NotificationOutbox()
+        # 旧版本会把验证码明文写入发件箱目录，启动时清除
+        self.outbox.purge('密码重置验证码')
+        self.outbox.start()
+        
+        # 选择文件后立即在后台解析，点击比对时直接使用解析结果
+        self.prefetcher = TablePrefetcher()
+        self.prefetch_finished.connect(self.on_prefetch_finished)
         
         # 加载保存的凭证
         self.load_credentials()
@@ -68,6 +102,11 @@ class MainWindow(QMainWindow):
         # 4. 账户管理区域
         self.setup_account_management_area(left_layout)
         
+        # 5. 性能分析开关(也可用 --profile 启动参数或 PRODUCTLOGGER_PROFILE 环境变量开启)
+        self.profile_check = QCheckBox("性能分析模式(结果保存到results/profiles)")
+        self.profile_check.setChecked(env_mode() is not None)
+        left_layout.addWidget(self.profile_check)
+        
         left_widget.setLayout(left_layout)
         
         # 右侧信息显示区域
@@ -197,16 +236,10 @@ class MainWindow(QMainWindow):
             return
             
         try:
-            msg = MIMEText("您的数据比对系统因多次密码错误已被锁定15分钟")
-            msg['Subject'] = '系统锁定通知'
-            msg['From'] = 'system@datacompare.com'
-            msg['To'] = self.user_email
-            
-            # 这里需要配置SMTP服务器
-            with smtplib.SMTP('smtp.example.com', 587) as server:
-                server.starttls()
-                server.login('username', 'password')
-                server.send_message(msg)
+            # 邮件进入发送队列，由后台线程发送，不阻塞界面
+            # SMTP服务器通过 SMTP_HOST/SMTP_PORT/SMTP_USER/SMTP_PASSWORD 环境变量配置
+            self.outbox.enqueue(self.user_email, '系统锁定通知',
+                                "您的数据比对系统因多次密码错误已被锁定15分钟")
         except Exception as e:
             self.log_message(f"发送邮件失败: {str(e)}")
 
@@ -218,9 +251,12 @@ class MainWindow(QMainWindow):
         label = QLabel("数据库上传区域")
         upload_btn = QPushButton("上传数据库文件")
         upload_btn.clicked.connect(self.upload_database_file)
+        history_btn = QPushButton("数据库版本差异")
+        history_btn.clicked.connect(self.diff_database_versions)
         
         vbox.addWidget(label)
         vbox.addWidget(upload_btn)
+        vbox.addWidget(history_btn)
         group.setLayout(vbox)
         layout.addWidget(group)
 
@@ -234,17 +270,22 @@ class MainWindow(QMainWindow):
         upload_btn2 = QPushButton("上传比对文件2") 
         upload_btn3 = QPushButton("上传比对文件3")
         compare_btn = QPushButton("开始比对")
+        self.sheet_compare_check = QCheckBox("按工作表比对全部工作表(xlsx)")
         
         upload_btn1.clicked.connect(lambda: self.upload_manual_file(1))
         upload_btn2.clicked.connect(lambda: self.upload_manual_file(2))
         upload_btn3.clicked.connect(lambda: self.upload_manual_file(3))
-        compare_btn.clicked.connect(self.compare_manual_files)
+        compare_btn.clicked.connect(lambda: self.run_profiled('ui_manual_compare', self.compare_manual_files))
+        source_btn = QPushButton("查看原始行(CSV)")
+        source_btn.clicked.connect(self.show_source_lines)
         
         vbox.addWidget(label)
         vbox.addWidget(upload_btn1)
         vbox.addWidget(upload_btn2)
         vbox.addWidget(upload_btn3)
+        vbox.addWidget(self.sheet_compare_check)
         vbox.addWidget(compare_btn)
+        vbox.addWidget(source_btn)
         group.setLayout(vbox)
         layout.addWidget(group)
 
@@ -256,13 +297,36 @@ class MainWindow(QMainWindow):
         label = QLabel("数据库比对区域")
         upload_btn = QPushButton("上传比对文件")
         compare_btn = QPushButton("与数据库比对")
+        # 完整比对前抽样估算新增/变化商品比例，不修改数据库
+        estimate_btn = QPushButton("快速估算(抽样)")
+        # 多个供应商文件一次合并到数据库(只读写一次数据库)
+        merge_btn = QPushButton("批量合并多个文件")
+        self.watch_btn = QPushButton("监控文件夹自动比对")
+        # 多台电脑/多个程序同时更新同一个数据库时使用SQLite共享库
+        self.shared_store_check = QCheckBox("使用共享SQLite数据库(多实例同时更新)")
+        
+        # 只比对指定列(商品ID列总会包含)，只解析这些列以加快比对
+        self.compare_columns_edit = QLineEdit()
+        self.compare_columns_edit.setPlaceholderText("比对列(逗号分隔，留空比对全部列)")
         
         upload_btn.clicked.connect(self.upload_compare_file)
-        compare_btn.clicked.connect(self.compare_with_database)
+        compare_btn.clicked.connect(lambda: self.run_profiled('ui_db_compare', self.compare_with_database))
+        estimate_btn.clicked.connect(self.estimate_database_changes)
+        merge_btn.clicked.connect(lambda: self.run_profiled('ui_merge_feeds', self.merge_feeds_into_database))
+        self.watch_btn.clicked.connect(self.toggle_folder_watch)
+        # 后台比对服务：数据库常驻内存，脚本可通过本机HTTP提交比对任务
+        self.service_btn = QPushButton("启动后台比对服务")
+        self.service_btn.clicked.connect(self.toggle_compare_service)
         
         vbox.addWidget(label)
         vbox.addWidget(upload_btn)
+        vbox.addWidget(self.compare_columns_edit)
+        vbox.addWidget(self.shared_store_check)
+        vbox.addWidget(estimate_btn)
         vbox.addWidget(compare_btn)
+        vbox.addWidget(merge_btn)
+        vbox.addWidget(self.watch_btn)
+        vbox.addWidget(self.service_btn)
         group.setLayout(vbox)
         layout.addWidget(group)
 
@@ -357,15 +421,11 @@ class MainWindow(QMainWindow):
         # 发送包含临时验证码的邮件
         try:
             temp_code = hashlib.sha256(os.urandom(32)).hexdigest()[:8]
-            msg = MIMEText(f"您的密码重置验证码是: {temp_code}\n验证码15分钟内有效")
-            msg['Subject'] = '密码重置验证码'
-            msg['From'] = 'system@datacompare.com'
-            msg['To'] = self.user_email
-            
-            with smtplib.SMTP('smtp.example.com', 587) as server:
-                server.starttls()
-                server.login('username', 'password')
-                server.send_message(msg)
+            # 验证码只保存在内存中，不写入发件箱目录；15分钟内未发出则作废
+            self.outbox.enqueue(self.user_email, '密码重置验证码',
+                                f"您的密码重置验证码是: {temp_code}\n验证码15分钟内有效",
+                                secret=True, expires_in=15 * 60)
+            code_sent = datetime.now()
                 
             # 弹出验证码输入框
             code, ok = QInputDialog.getText(
@@ -373,7 +433,9 @@ class MainWindow(QMainWindow):
                 f"验证码已发送到{self.user_email}，请输入验证码:"
             )
             
-            if ok and code == temp_code:
+            if ok and (datetime.now() - code_sent).total_seconds() > 15 * 60:
+                QMessageBox.warning(self, "错误", "验证码已过期，请重新获取")
+            elif ok and code == temp_code:
                 # 允许设置新密码
                 new_pwd, ok = QInputDialog.getText(
                     self, '设置新密码',
@@ -485,20 +547,18 @@ class MainWindow(QMainWindow):
     def load_latest_database(self):
         """自动加载最新的数据库文件"""
         try:
-            # 检查xlsx目录
-            xlsx_dir = os.path.join('data', 'xlsx')
-            if os.path.exists(xlsx_dir):
-                # 只获取非临时文件(~$开头的)并按文件名中的时间戳排序
-                files = [f for f in os.listdir(xlsx_dir) 
-                        if f.endswith('.xlsx') and not f.startswith('~$')]
-                if files:
-                    # 按文件名中的时间戳排序(格式: YYYYMMDD_HHMMSS.xlsx)
-                    files.sort(key=lambda x: x.split('.')[0], reverse=True)
-                    latest_file = os.path.join(xlsx_dir, files[0])
-                    self.current_db_file = latest_file
-                    self.log_message(f"已自动加载数据库文件: {latest_file}")
-                    self.display_file_info(latest_file)
-                    return True
+            # 从数据库目录表直接获取当前数据库，无需扫描目录
+            entry = self.db_catalog.current()
+            if entry is None:
+                # 旧版本数据目录没有目录表，扫描一次并登记
+                entry = self.db_catalog.rebuild_from_disk()
+            if entry:
+                self.current_db_file = entry['path']
+                self.log_message(f"已自动加载数据库文件: {entry['path']}")
+                self.log_message(f"文件信息:\n名称: {os.path.basename(entry['path'])}\n"
+                                 f"类型: .{entry['format']}\n行数: {entry['rows'] if entry['rows'] is not None else '未知'}\n"
+                                 f"列数: {len(entry['columns'] or [])}")
+                return True
             
             self.log_message("未找到数据库文件，请先上传数据库文件", "orange")
             return False
@@ -506,6 +566,40 @@ class MainWindow(QMainWindow):
             self.log_message(f"加载数据库文件失败: {str(e)}", "red")
             return False
 
+    def diff_database_versions(self):
+        """比对两个数据库历史版本"""
+        versions = self.snapshot_store.list_versions()
+        if len(versions) < 2:
+            QMessageBox.warning(self, "错误", "至少需要2个数据库版本才能比对")
+            return
+            
+        items = [f"{v['version_id']} | {v['created_at']} | {v['label'] or v['source']} | {v['rows']}行"
+                 for v in reversed(versions)]
+        old_item, ok = QInputDialog.getItem(self, "选择旧版本", "旧版本:", items, 1, False)
+        if not ok:
+            return
+        new_item, ok = QInputDialog.getItem(self, "选择新版本", "新版本:", items, 0, False)
+        if not ok:
+            return
+            
+        try:
+            diff = self.snapshot_store.diff(old_item.split(' | ')[0], new_item.split(' | ')[0])
+            self.log_message(f"\n=== 数据库版本差异: {diff['old_version']} → {diff['new_version']} ===", "darkblue")
+            self.log_message(f"变化数据块: {diff['chunks_changed']}/{diff['chunks_total']}")
+            self.log_message(f"新增商品: {len(diff['added'])}, 删除商品: {len(diff['removed'])}, "
+                             f"变更商品: {len(diff['changed'])}")
+            for product_id in diff['added']:
+                self.log_message(f"新增商品: ID {product_id}", "orange")
+            for product_id in diff['removed']:
+                self.log_message(f"删除商品: ID {product_id}", "orange")
+            for item in diff['changed']:
+                details = ", ".join(f"{d['column']}: {d['old_value']}→{d['new_value']}"
+                                    for d in item['differences'])
+                self.log_message(f"变更商品: ID {item['product_id']} - {details}", "red")
+        except Exception as e:
+            self.log_message(f"版本比对失败: {str(e)}", "red")
+            QMessageBox.critical(self, "错误", f"版本比对失败: {str(e)}")
+
     def load_credentials(self):
         """加载保存的凭证"""
         try:
@@ -544,15 +638,42 @@ class MainWindow(QMainWindow):
             info = f"文件信息:\n名称: {file_name}\n大小: {file_size:.2f}KB\n类型: {ext}"
             
             if ext in ('.xlsx', '.csv'):
-                if ext == '.xlsx':
-                    df = pd.read_excel(file_path)
-                else:
-                    df = pd.read_csv(file_path)
-                info += f"\n行数: {len(df)}\n列数: {len(df.columns)}"
+                # 行数和列数在后台解析完成后显示(见 on_prefetch_finished)
+                self.start_prefetch(file_path)
+                info += "\n正在后台解析..."
                 
             self.log_message(info)
         except Exception as e:
             self.log_message(f"获取文件信息失败: {str(e)}", "red")
+            
+    def start_prefetch(self, file_path):
+        """在后台线程中解析文件"""
+        self.prefetcher.prefetch(file_path, lambda path, future: self.prefetch_finished.emit(path, future))
+        
+    def on_prefetch_finished(self, file_path, future):
+        """后台解析完成: 显示行列数并提前检查表格格式"""
+        if future.cancelled():
+            return
+        name = os.path.basename(file_path)
+        error = future.exception()
+        if error is not None:
+            self.log_message(f"文件 {name} 解析失败: {str(error)}", "red")
+            return
+        df = future.result()
+        self.log_message(f"文件 {name} 解析完成 - 行数: {len(df)} 列数: {len(df.columns)}")
+        
+        header = [col for col in df.columns if not str(col).startswith('比对报告')]
+        if len(header) < 2:
+            self.log_message(f"文件 {name} 少于2列，无法比对", "orange")
+        if file_path in self.manual_files and self.manual_files[0] != file_path:
+            if list(df.columns) != read_header(self.manual_files[0]):
+                self.log_message(f"文件 {name} 与比对文件1格式不一致", "orange")
+        if file_path == self.db_compare_file:
+            db_entry = self.db_catalog.current()
+            db_cols = db_entry and [col for col in db_entry['columns'] or []
+                                    if not str(col).startswith('比对报告')]
+            if db_cols and header != db_cols:
+                self.log_message(f"文件 {name} 与数据库文件格式不一致", "orange")
 
     def upload_database_file(self):
         """上传数据库文件"""
@@ -569,28 +690,48 @@ class MainWindow(QMainWindow):
                 # 获取文件扩展名
                 ext = os.path.splitext(file_path)[1][1:].lower()
                 save_dir = os.path.join('data', ext)
-                
+
                 # 创建目录
                 os.makedirs(save_dir, exist_ok=True)
-                
-                # 备份文件
-                backup_dir = os.path.join('data', 'backup')
-                os.makedirs(backup_dir, exist_ok=True)
-                backup_path = os.path.join(backup_dir, os.path.basename(file_path))
-                
-                # 保存文件
+
+                # 按内容哈希存入仓库(相同内容只保存一份)
+                digest, is_new = self.blob_store.put(file_path)
+                latest = self.blob_store.latest_version('database')
+                if (not is_new and latest and os.path.exists(latest['path'])
+                        and self.blob_store.file_digest(latest['path']) == digest):
+                    self.log_message(f"数据库文件内容与当前数据库相同，无需重复上传: {latest['path']}", "orange")
+                    QMessageBox.information(self, "提示", "数据库文件内容未变化")
+                    return
+
+                # 备份文件(按内容区分，同名文件不再互相覆盖)
+                self.blob_store.backup(digest, file_path)
+
+                # 保存文件(硬链接到仓库中的内容，无需再次复制)
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 save_path = os.path.join(save_dir, f"{timestamp}.{ext}")
+                self.blob_store.link(digest, save_path)
+                self.blob_store.record_version(digest, os.path.basename(file_path), 'database', save_path)
                 
-                # 执行复制
-                shutil.copy2(file_path, backup_path)
-                shutil.copy2(file_path, save_path)
+                # 保存数据库版本快照，用于历史版本差异比对
+                db_df = read_table(save_path)
+                self.snapshot_store.create_snapshot(db_df, label=f"上传 {os.path.basename(file_path)}")
                 
-                # 清理旧文件
+                # 登记到数据库目录表并设为当前数据库
+                self.db_catalog.register(save_path, db_df, content_hash=digest)
+                self.current_db_file = save_path
+                if self.compare_service:
+                    self.compare_service.set_database(os.path.abspath(save_path), db_df)
+                # 文件夹监控改为使用新数据库，之后才能删除旧文件
+                if self.folder_watcher:
+                    self.folder_watcher.set_database(save_path)
+
+                # 清理旧文件(等待正在改写该文件的比对结束后再删除)
                 for f in os.listdir(save_dir):
                     if f != os.path.basename(save_path):
+                        old_path = os.path.join(save_dir, f)
                         try:
-                            os.remove(os.path.join(save_dir, f))
+                            with db_lock(old_path):
+                                os.remove(old_path)
                         except Exception as e:
                             self.log_message(f"删除旧文件失败: {str(e)}", "red")
                 
@@ -627,31 +768,185 @@ class MainWindow(QMainWindow):
             self.db_compare_file = file_path
             self.log_message(f"比对文件已上传: {file_path}")
             self.display_file_info(file_path)
+            # 同时预先加载数据库
+            db_entry = self.db_catalog.current()
+            if db_entry and os.path.exists(db_entry['path']):
+                self.start_prefetch(db_entry['path'])
+
+    def toggle_folder_watch(self):
+        """启动/停止文件夹监控"""
+        if self.folder_watcher and self.folder_watcher.is_running():
+            self.folder_watcher.stop(timeout=5)
+            self.folder_watcher = None
+            self.watch_timer.stop()
+            self.watch_btn.setText("监控文件夹自动比对")
+            self.log_message("已停止文件夹监控")
+            return
+            
+        if not self.current_db_file:
+            QMessageBox.warning(self, "错误", "请先上传数据库文件")
+            return
+            
+        watch_dir = QFileDialog.getExistingDirectory(self, "选择监控文件夹")
+        if not watch_dir:
+            return
+            
+        self.folder_watcher = FolderWatcher(watch_dir, self.current_db_file, blob_store=self.blob_store)
+        self.folder_watcher.start()
+        
+        # 工作线程不能直接操作界面，由定时器在主线程中读取结果
+        self.watch_timer = QTimer(self)
+        self.watch_timer.timeout.connect(self.drain_watch_results)
+        self.watch_timer.start(1000)
+        
+        self.watch_btn.setText("停止文件夹监控")
+        self.log_message(f"开始监控文件夹: {watch_dir}", "blue")
+
+    def toggle_compare_service(self):
+        """启动/停止本机后台比对服务"""
+        if self.compare_service and self.compare_service.is_running():
+            self.compare_service.stop(timeout=5)
+            self.compare_service = None
+            self.service_btn.setText("启动后台比对服务")
+            self.log_message("已停止后台比对服务")
+            return
+            
+        if not self.current_db_file:
+            QMessageBox.warning(self, "错误", "请先上传数据库文件")
+            return
+        if CompareClient(port=DEFAULT_PORT, timeout=1).is_available():
+            QMessageBox.warning(self, "错误", f"端口 {DEFAULT_PORT} 上已有比对服务在运行")
+            return
+            
+        try:
+            self.compare_service = CompareService(os.path.abspath(self.current_db_file),
+                                                  catalog=self.db_catalog,
+                                                  snapshot_store=self.snapshot_store)
+            self.compare_service.start()
+        except OSError as e:
+            self.compare_service = None
+            QMessageBox.critical(self, "错误", f"启动后台比对服务失败: {str(e)}")
+            return
+            
+        self.service_btn.setText("停止后台比对服务")
+        self.log_message(f"后台比对服务已启动: {self.compare_service.address} "
+                         f"(python -m utils.compare_service db 比对文件.xlsx)", "blue")
 
+    def drain_watch_results(self):
+        """显示文件夹监控的比对结果"""
+        if not self.folder_watcher:
+            return
+            
+        while not self.folder_watcher.results.empty():
+            result = self.folder_watcher.results.get_nowait()
+            if result['success']:
+                report = result['report']
+                self.log_message(
+                    f"自动比对完成: {result['file']} - 新增 {len(report['new_items'])}, "
+                    f"更新 {len(report['updates'])}, 一致 {report['matches']}, "
+                    f"报告: {result['report_path']}", "green")
+            else:
+                self.log_message(f"自动比对失败: {result['file']} - {result['message']}", "red")
+
+    def selected_columns(self):
+        """获取用户指定的比对列，未指定时返回None"""
+        text = self.compare_columns_edit.text().replace('，', ',')
+        columns = [c.strip() for c in text.split(',') if c.strip()]
+        return columns or None
+
+    def statistics_summary(self, stats):
+        """差异统计的文字说明"""
+        if not stats or not stats['changed_rows']:
+            return ""
+        lines = ["差异统计:"]
+        lines += [f"- 列 {col}: {n} 处变化" for col, n in stats['changes_per_column'].items()]
+        for col, entry in stats['numeric_changes'].items():
+            p = entry['percentiles']
+            line = (f"- {col} 数值变化: 上升 {entry['increased']}, 下降 {entry['decreased']}, "
+                    f"变化量 P5/P50/P95: {p['p5']:.4g}/{p['p50']:.4g}/{p['p95']:.4g}")
+            if 'relative_percentiles' in entry:
+                r = entry['relative_percentiles']
+                line += f", 变化幅度 P5/P50/P95: {r['p5']:.1%}/{r['p50']:.1%}/{r['p95']:.1%}"
+            lines.append(line)
+        for col, items in stats['top_transitions'].items():
+            lines.append(f"- {col} 最常见变化: " + "; ".join(
+                f"{item['old']}→{item['new']} ({item['count']})" for item in items))
+        if stats['top_categories']:
+            lines.append("- 变化最多的类别: " + "; ".join(
+                f"{item['category']} ({item['count']})" for item in stats['top_categories']))
+        return "\n".join(lines) + "\n"
+        
+    def run_profiled(self, name, handler):
+        """执行比对操作；开启性能分析模式时记录各函数耗时并保存分析文件"""
+        mode = (env_mode() or 'pstats') if self.profile_check.isChecked() else None
+        profiler = RunProfiler(name, mode)
+        with profiler:
+            handler()
+        if profiler.output_path:
+            self.log_message(f"性能分析结果已保存: {profiler.output_path} (耗时{profiler.elapsed:.2f}秒)", "blue")
+            
+    def show_source_lines(self):
+        """按行号查看比对文件中的原始行(首次查看时建立行偏移索引，之后直接定位，无需重新解析文件)"""
+        files = [f for f in self.manual_files if f] + ([self.db_compare_file] if self.db_compare_file else [])
+        files = [f for f in files if not f.endswith('.xlsx')]
+        if not files:
+            QMessageBox.warning(self, "错误", "请先上传CSV比对文件")
+            return
+            
+        names = [os.path.basename(f) for f in files]
+        name, ok = QInputDialog.getItem(self, "查看原始行", "选择文件:", names, 0, False)
+        if not ok:
+            return
+        row, ok = QInputDialog.getInt(self, "查看原始行", "行号(表头为第1行):", 2, 1)
+        if not ok:
+            return
+            
+        lines = source_lines(files[names.index(name)], row)
+        if not lines:
+            self.log_message("无法定位该行(文件编码不支持或行号超出范围)", "red")
+            return
+        text = "\n".join(f"{'>' if r == row else ' '} {r}: {line}" for r, line in lines)
+        self.info_display.append(f"{name} 第{row}行附近的原始内容:\n{text}")
+        
     def compare_manual_files(self):
         """手动比对文件"""
         if len(self.manual_files) < 2:
             QMessageBox.warning(self, "错误", "至少需要上传2个文件才能比对")
             return
             
+        if self.sheet_compare_check.isChecked():
+            self.compare_manual_workbooks()
+            return
+            
         try:
-            # 读取所有文件
-            dfs = []
-            file_names = []
-            for file in self.manual_files:
-                if file.endswith('.xlsx'):
-                    df = pd.read_excel(file)
-                else:
-                    df = pd.read_csv(file)
-                dfs.append(df)
-                file_names.append(os.path.basename(file))
+            # 输入文件未变化时直接返回上次的报告
+            columns = self.selected_columns()
+            rules = CompareRules.load()
+            cache_key = self.result_cache.make_key('ui_manual', self.manual_files,
+                                                   options={'columns': columns, 'rules': rules.to_dict()})
+            cached = self.result_cache.get(cache_key)
+            if cached and os.path.exists(cached['report_path']):
+                self.log_message(f"比对文件未变化，直接使用上次的比对结果: {cached['report_path']}", "blue")
+                for comparison in cached['report_data']['comparisons']:
+                    self.log_message(f"📊 {comparison['file_pair']} - 共发现 {comparison['total_differences']} 处差异", "orange")
+                QMessageBox.information(self, "完成", "文件未变化，已使用上次的比对报告")
+                return
                 
-            # 检查格式一致性
-            cols = [df.columns.tolist() for df in dfs]
+            # 检查格式一致性(只读取表头)
+            cols = [read_header(file) for file in self.manual_files]
             if not all(c == cols[0] for c in cols):
                 QMessageBox.warning(self, "错误", "文件格式不一致，无法比对")
                 return
                 
+            # 读取所有文件(指定比对列时只解析这些列)
+            usecols = projection(cols[0], columns=columns) if columns else None
+            dfs = []
+            file_names = []
+            for file in self.manual_files:
+                df = self.prefetcher.get(file, usecols)
+                dfs.append(df if df is not None else read_table(file, usecols))
+                file_names.append(os.path.basename(file))
+                
             # 创建结果目录
             result_dir = os.path.join('results', 'compare_reports')
             os.makedirs(result_dir, exist_ok=True)
@@ -678,19 +973,21 @@ class MainWindow(QMainWindow):
                     if len(dfs[i]) != len(dfs[j]):
                         self.log_message(f"⚠️ 行数差异: {file_names[i]}有{len(dfs[i])}行, {file_names[j]}有{len(dfs[j])}行", "orange")
                     
-                    # 逐行比对
+                    # 按比对规则一次性计算所有单元格差异，只遍历有差异的行
                     max_rows = min(len(dfs[i]), len(dfs[j]))
-                    for row_idx in range(max_rows):
-                        row_diff = False
+                    compiled = rules.compile(list(dfs[i].columns))
+                    mask_df = compiled.differs(dfs[i].iloc[:max_rows], dfs[j].iloc[:max_rows])
+                    pair_stats = DiffStats(rules.category_column)
+                    pair_stats.add(dfs[i].iloc[:max_rows], dfs[j].iloc[:max_rows], mask_df)
+                    mask = mask_df.to_numpy()
+                    for row_idx in mask.any(axis=1).nonzero()[0]:
+                        row_diff = True
                         diff_details = []
                         
-                        # 逐列比对
-                        for col in dfs[i].columns:
-                            val1 = dfs[i].iloc[row_idx][col]
-                            val2 = dfs[j].iloc[row_idx][col]
-                            
-                            if val1 != val2:
-                                row_diff = True
+                        for col, differs in zip(compiled.columns, mask[row_idx]):
+                            if differs:
+                                val1 = dfs[i].iloc[row_idx][col]
+                                val2 = dfs[j].iloc[row_idx][col]
                                 diff_details.append(f"{col}: '{val1}' vs '{val2}'")
                         
                         if row_diff:
@@ -698,7 +995,7 @@ class MainWindow(QMainWindow):
                             # 在UI中用不同颜色显示差异
                             self.log_message(f"🔴 行 {row_idx+1} 差异: {', '.join(diff_details)}", "red")
                             file_pair_diffs.append({
-                                'row': row_idx+1,
+                                'row': int(row_idx)+1,
                                 'details': diff_details
                             })
                     
@@ -707,8 +1004,10 @@ class MainWindow(QMainWindow):
                         all_differences.append({
                             'file_pair': f"{file_names[i]} vs {file_names[j]}",
                             'diffs': file_pair_diffs,
-                            'total_diffs': diff_count
+                            'total_diffs': diff_count,
+                            'statistics': pair_stats.result()
                         })
+                        self.log_message(self.statistics_summary(pair_stats.result()), "darkblue")
                     
                     # 输出文件比对摘要
                     summary_msg = f"📊 比对摘要: {file_names[i]} 和 {file_names[j]} - "
@@ -727,6 +1026,7 @@ class MainWindow(QMainWindow):
                 comparison = {
                     "file_pair": diff['file_pair'],
                     "total_differences": diff['total_diffs'],
+                    "statistics": diff['statistics'],
                     "differences": []
                 }
                 
@@ -743,6 +1043,7 @@ class MainWindow(QMainWindow):
             import json
             with open(report_path, 'w', encoding='utf-8') as f:
                 json.dump(report_data, f, indent=4, ensure_ascii=False)
+            self.result_cache.put(cache_key, {'report_path': report_path, 'report_data': report_data})
             
             self.log_message(f"\n比对完成! 详细报告已保存到: {report_path}", "blue")
             QMessageBox.information(self, "完成", "文件比对完成，报告已保存")
@@ -751,201 +1052,358 @@ class MainWindow(QMainWindow):
             self.log_message(f"比对失败: {str(e)}", "red")
             QMessageBox.critical(self, "错误", f"比对失败: {str(e)}")
 
-    def compare_with_database(self):
-        """与数据库比对"""
+    def compare_manual_workbooks(self):
+        """按工作表名称逐个比对多工作表文件(各工作表并行解析和比对)"""
+        if not all(f.endswith('.xlsx') for f in self.manual_files):
+            QMessageBox.warning(self, "错误", "按工作表比对只支持xlsx文件")
+            return
+            
+        try:
+            self.log_message("开始按工作表比对文件...", "blue")
+            comparator = DataComparator()
+            success, msg, report_path = comparator.compare_workbooks(
+                self.manual_files, columns=self.selected_columns())
+            if not success:
+                QMessageBox.warning(self, "错误", msg)
+                return
+                
+            self.log_message(msg)
+            self.log_message(f"\n比对完成! 详细报告已保存到: {report_path}", "blue")
+            QMessageBox.information(self, "完成", "工作表比对完成，报告已保存")
+        except Exception as e:
+            self.log_message(f"比对失败: {str(e)}", "red")
+            QMessageBox.critical(self, "错误", f"比对失败: {str(e)}")
+
+    def compare_with_shared_store(self, db_path, columns, rules):
+        """与共享SQLite数据库比对，只写回新增和变化的商品"""
+        if self.product_store is None:
+            self.product_store = SQLiteProductStore()
+        if self.product_store.is_empty():
+            self.log_message("首次使用共享数据库，正在导入当前数据库文件...")
+            self.product_store.import_dataframe(read_table(db_path))
+            
+        self.log_message("开始与共享数据库比对...")
+        comparator = DataComparator(rules)
+        success, msg, report = comparator.store_compare(self.product_store, self.db_compare_file, columns)
+        if not success:
+            QMessageBox.warning(self, "错误", msg)
+            return
+            
+        report_path = comparator._generate_report(report, 'db')
+        summary = f"""比对完成（共享数据库）:
+- 总商品数: {report['total_compared']}
+- 新增商品: {len(report['new_items'])}
+- 变化商品: {len(report['updates'])}
+- 未变化商品: {report['matches']}
+- 比对报告: {report_path}
+{self.statistics_summary(report['statistics'])}"""
+        self.info_display.append(summary)
+        self.log_message("共享数据库比对完成", "green")
+        QMessageBox.information(self, "完成", "与共享数据库比对完成")
+        
+    def estimate_database_changes(self):
+        """按商品ID哈希抽样比对，估算新增和变化商品的比例(不修改数据库)"""
         if not self.db_compare_file:
             QMessageBox.warning(self, "错误", "请先上传比对文件")
             return
+        db_entry = self.db_catalog.current()
+        if db_entry is None:
+            QMessageBox.warning(self, "错误", "数据库中没有文件")
+            return
+            
+        percent, ok = QInputDialog.getDouble(self, "快速估算", "抽样比例(%):", 5.0, 0.1, 100.0, 1)
+        if not ok:
+            return
             
         try:
-            # 读取比对文件
-            if self.db_compare_file.endswith('.xlsx'):
-                compare_df = pd.read_excel(self.db_compare_file)
-            else:
-                compare_df = pd.read_csv(self.db_compare_file)
+            comparator = DataComparator(CompareRules.load(), tables=self.prefetcher)
+            success, msg, estimate = comparator.quick_estimate(
+                db_entry['path'], self.db_compare_file, self.selected_columns(), fraction=percent / 100)
+            if not success:
+                QMessageBox.warning(self, "错误", msg)
+                return
                 
-            # 检查表格格式
-            if len(compare_df.columns) < 2:
-                QMessageBox.warning(self, "错误", "比对文件必须包含至少2列数据")
+            lines = [f"快速估算(抽样 {estimate['sampled_rows']}/{estimate['total_rows']} 行, "
+                     f"{estimate['confidence']:.0%} 置信区间):"]
+            for name, label in (('new', '新增商品'), ('changed', '变化商品'), ('unchanged', '未变化商品')):
+                item = estimate[name]
+                low, high = item['estimated_interval']
+                lines.append(f"- {label}: 约 {item['estimated']} ({item['rate']:.1%}), 区间 {low} - {high}")
+            for col, count in estimate['changed_columns'].items():
+                lines.append(f"  列 {col}: 约 {count} 行变化")
+            self.info_display.append("\n".join(lines))
+            self.log_message("快速估算完成(数据库未修改)", "green")
+        except Exception as e:
+            self.log_message(f"快速估算失败: {str(e)}", "red")
+            QMessageBox.critical(self, "错误", f"快速估算失败: {str(e)}")
+        
+    def merge_feeds_into_database(self):
+        """选择多个文件，一次比对并合并到数据库，生成合并报告"""
+        db_entry = self.db_catalog.current()
+        if db_entry is None:
+            QMessageBox.warning(self, "错误", "数据库中没有文件")
+            return
+        files, _ = QFileDialog.getOpenFileNames(self, "选择要合并的文件(按优先级顺序)", "",
+                                                "表格文件 (*.xlsx *.csv)")
+        if not files:
+            return
+        choice, ok = QInputDialog.getItem(self, "冲突规则", "同一商品在多个文件中不同时:",
+                                          ["后选择的文件优先", "先选择的文件优先"], 0, False)
+        if not ok:
+            return
+        rule = 'last' if choice == "后选择的文件优先" else 'first'
+        
+        try:
+            db_path = db_entry['path']
+            self.log_message(f"开始合并 {len(files)} 个文件到数据库...", "blue")
+            comparator = DataComparator(CompareRules.load(), tables=self.prefetcher)
+            success, msg, report = comparator.merge_feeds(db_path, files, rule, self.selected_columns())
+            if not success:
+                QMessageBox.warning(self, "错误", msg)
                 return
                 
-            # 读取数据库文件
-            db_dirs = [d for d in os.listdir('data') if d in ('xlsx', 'csv')]
-            db_files = []
-            for dir_name in db_dirs:
-                dir_path = os.path.join('data', dir_name)
-                if os.path.isdir(dir_path):
-                    files = [f for f in os.listdir(dir_path) if f.endswith(('.xlsx', '.csv'))]
-                    if files:
-                        db_files.extend([os.path.join(dir_name, f) for f in files])
-            
-            if not db_files:
+            if report['new_items'] or report['updates']:
+                db_df = self.prefetcher.get(db_path)
+                if db_df is None:
+                    db_df = read_table(db_path)
+                self.db_catalog.update_current(db_df)
+                self.snapshot_store.create_snapshot(db_df, label=f"合并 {len(files)} 个文件")
+                
+            report_path = comparator._generate_report(report, 'merge')
+            lines = ["合并完成:"]
+            for feed in report['feeds']:
+                lines.append(f"- {feed['file']}: {feed['rows']} 行, 采用 {feed['merged_rows']} 行, "
+                             f"新增 {feed['new']}, 更新 {feed['updated']}")
+            lines += [f"- 新增商品: {len(report['new_items'])}",
+                      f"- 变化商品: {len(report['updates'])}",
+                      f"- 未变化商品: {report['matches']}",
+                      f"- 文件间冲突: {len(report['conflicts'])}",
+                      f"- 合并报告: {report_path}"]
+            self.info_display.append("\n".join(lines) + "\n" + self.statistics_summary(report['statistics']))
+            self.log_message("批量合并完成", "green")
+            QMessageBox.information(self, "完成", "批量合并完成，报告已保存")
+        except Exception as e:
+            self.log_message(f"批量合并失败: {str(e)}", "red")
+            QMessageBox.critical(self, "错误", f"批量合并失败: {str(e)}")
+        
+    def log_status_rows(self, db_df, row_status, limit=50):
+        """在日志中列出新增、更新和疑似改号的商品(每类最多limit个，无差异商品不逐个列出)"""
+        for code, name, color in ((STATUS_NEW, "新增", None), (STATUS_CHANGED, "更新", None),
+                                  (STATUS_PROBABLE, "疑似改号", "orange")):
+            rows = row_status.rows(code)
+            for row in rows[:limit]:
+                if code == STATUS_CHANGED:
+                    message = f"更新商品: ID {db_df.iat[row, 1]} - 差异项: {', '.join(row_status.changed_columns(row))}"
+                elif code == STATUS_PROBABLE:
+                    product_id, score = row_status.probable(row)
+                    message = f"疑似改号商品: 新ID {product_id} ↔ 原ID {db_df.iat[row, 1]} (相似度 {score:.2f})"
+                else:
+                    message = f"新增商品: ID {db_df.iat[row, 1]}"
+                self.log_message(message, color)
+            if len(rows) > limit:
+                self.log_message(f"... 另有 {len(rows) - limit} 个{name}商品未列出", color)
+        
+    def db_cache_key(self, db_digest, columns, rules):
+        """数据库比对结果的缓存键(比对文件内容、数据库版本、比对列和比对规则)"""
+        return self.result_cache.make_key('ui_db', [self.db_compare_file], db_digest=db_digest,
+                                          options={'columns': columns, 'rules': rules.to_dict()})
+        
+    def find_probable_matches(self, compare_df, db_df, rules):
+        """按名称模糊匹配疑似改号的商品: {比对文件行索引: (数据库行位置, 相似度)}
+        
+        只在数据库中找不到ID的比对行与比对文件中没有出现的数据库商品之间匹配，
+        分组列(如品牌、类别)未被解析时从比对文件补读。
+        """
+        matcher = FuzzyMatcher.from_dict(rules.fuzzy_match)
+        db_keys = normalize_keys(db_df.iloc[:, 1])
+        compare_keys = normalize_keys(compare_df.iloc[:, 1])
+        unmatched = (compare_keys.notna() & ~compare_keys.isin(db_keys)).to_numpy()
+        missing = (db_keys.notna() & ~db_keys.isin(compare_keys)).to_numpy()
+        if not unmatched.any() or not missing.any():
+            return {}
+            
+        feed = compare_df[unmatched]
+        extra = [col for col in matcher.block_columns
+                 if col not in feed.columns and col in db_df.columns]
+        if extra:
+            extra_df = self.prefetcher.get(self.db_compare_file, extra)
+            if extra_df is None:
+                extra_df = read_table(self.db_compare_file, extra)
+            feed = feed.join(extra_df.loc[feed.index, extra])
+            
+        rows = np.flatnonzero(unmatched)
+        db_rows = np.flatnonzero(missing)
+        return {compare_df.index[rows[i]]: (int(db_rows[j]), score)
+                for i, j, score in matcher.match(feed, db_df[missing])}
+        
+    def compare_with_database(self):
+        """与数据库比对"""
+        if not self.db_compare_file:
+            QMessageBox.warning(self, "错误", "请先上传比对文件")
+            return
+            
+        try:
+            # 从数据库目录表获取当前数据库
+            db_entry = self.db_catalog.current()
+            if db_entry is None:
                 QMessageBox.warning(self, "错误", "数据库中没有文件")
                 return
+            db_path = db_entry['path']
+            
+            # 输入文件和数据库都未变化时直接返回上次的结果，不再重写数据库
+            columns = self.selected_columns()
+            rules = CompareRules.load()
+            cache_key = self.db_cache_key(db_entry['content_hash'], columns, rules)
+            cached = self.result_cache.get(cache_key)
+            if cached:
+                self.log_message("比对文件和数据库均未变化，直接使用上次的比对结果", "blue")
+                self.info_display.append(cached['summary'])
+                QMessageBox.information(self, "完成", "数据未变化，已使用上次的比对结果")
+                return
                 
-            # 获取最新的数据库文件
-            db_files.sort(key=lambda x: os.path.getmtime(os.path.join('data', x)), reverse=True)
-            db_path = os.path.join('data', db_files[0])
-            if db_path.endswith('.xlsx'):
-                db_df = pd.read_excel(db_path)
-            else:
-                db_df = pd.read_csv(db_path)
+            # 只读取表头检查表格格式
+            compare_header = read_header(self.db_compare_file)
+            if len(compare_header) < 2:
+                QMessageBox.warning(self, "错误", "比对文件必须包含至少2列数据")
+                return
                 
-            # 检查数据库文件格式
-            if len(db_df.columns) < 2:
+            # 检查数据库文件格式(目录表中已记录表头，无需读取文件)
+            db_header = db_entry['columns'] or read_header(db_path)
+            if len(db_header) < 2:
                 QMessageBox.warning(self, "错误", "数据库文件必须包含至少2列数据")
                 return
                 
             # 检查表头是否一致（忽略比对报告列）
-            compare_cols = [col for col in compare_df.columns if not col.startswith('比对报告')]
-            db_cols = [col for col in db_df.columns if not col.startswith('比对报告')]
+            compare_cols = [col for col in compare_header if not str(col).startswith('比对报告')]
+            db_cols = [col for col in db_header if not str(col).startswith('比对报告')]
             if compare_cols != db_cols:
                 QMessageBox.warning(self, "错误", "比对文件与数据库文件格式不一致")
                 return
                 
+            if self.shared_store_check.isChecked():
+                self.compare_with_shared_store(db_path, columns, rules)
+                return
+                
+            # 读取比对文件，只解析商品ID列和需要比对的列
+            usecols = projection(compare_header, columns=columns, exclude_prefix='比对报告')
+            compare_df = self.prefetcher.get(self.db_compare_file, usecols)
+            if compare_df is None:
+                compare_df = read_table(self.db_compare_file, usecols)
+                
             self.log_message("开始与数据库比对...")
             
-            # 初始化统计信息
-            total_items = 0
-            new_items = 0
-            changed_items = 0
-            unchanged_items = 0
+            # 读取、比对、写回期间持有数据库文件锁，避免与文件夹监控、比对服务同时改写同一文件
+            with db_lock(db_path):
+                # 读取数据库(比对后整表重写，需要全部列；选择比对文件时已在后台预先加载)
+                db_df = self.prefetcher.get(db_path)
+                if db_df is None:
+                    db_df = read_table(db_path)
             
-            # 创建Excel写入器
-            writer = pd.ExcelWriter(db_path, engine='openpyxl', mode='a', if_sheet_exists='overlay')
-            db_df = pd.read_excel(db_path)
+                # 创建带时间戳的报告列名
+                report_col = f"比对报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
             
-            # 创建带时间戳的报告列名
-            report_col = f"比对报告_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                # 获取需要比对的列（忽略所有以"比对报告"开头的列）
+                compare_cols = [col for col in compare_df.columns 
+                              if not col.startswith('比对报告')]
             
-            # 保留所有历史比对报告列
-            # 添加新的报告列
-            db_df[report_col] = ''
+                # 商品ID索引(一次分组构建，1001.0/"1001"/"001001"视为同一ID)，逐行查找为O(1)
+                db_index = ProductIndex(db_df.iloc[:, 1])
+                for key, positions in db_index.duplicates().items():
+                    self.log_message(f"数据库中商品ID重复: {key} (第{', '.join(str(p + 2) for p in positions)}行，使用第一行)", "orange")
+                for item in db_index.mismatches(ProductIndex(compare_df.iloc[:, 1])):
+                    self.log_message(f"商品ID格式不一致: {item['key']} ({', '.join(item['forms'])})，已按同一ID处理", "orange")
                 
-            # 设置样式字典
-            styles = {}
+                # 比对规则启用了模糊匹配时，按名称找出疑似改号的商品(不作为新增商品)
+                probable = self.find_probable_matches(compare_df, db_df, rules) if rules.fuzzy_match else {}
             
-            # 获取需要比对的列（忽略所有以"比对报告"开头的列）
-            compare_cols = [col for col in compare_df.columns 
-                          if not col.startswith('比对报告')]
+                # 按比对规则一次性计算差异并更新数据库；每行只记录状态码和差异列位掩码，
+                # 报告文字只为有差异的行生成(保留所有历史比对报告列)
+                # 差异统计(各列变化数、数值变化分布、变化最多的类别)直接由差异矩阵汇总
+                stats = DiffStats(rules.category_column)
+                db_df, row_status, new_rows, total_items = apply_feed(
+                    db_df, compare_df, rules.compile(compare_cols), db_index, probable, stats)
+                new_items = row_status.counts[STATUS_NEW]
+                changed_items = row_status.counts[STATUS_CHANGED]
+                unchanged_items = row_status.counts[STATUS_UNCHANGED]
+                probable_items = row_status.counts[STATUS_PROBABLE]
+                self.log_status_rows(db_df, row_status)
             
-            # 逐行比对(包括第一行数据)
-            for idx, row in compare_df.iterrows():
-                # 跳过表头行(索引0)
-                if idx == 0 and all(isinstance(val, str) for val in row.values):
-                    continue
-                    
-                total_items += 1
-                product_id = row.iloc[1]  # B列商品ID
-                match = db_df[db_df.iloc[:, 1] == product_id]  # 在数据库B列查找匹配
-                
-                if match.empty:
-                    # 新商品 - 添加到数据库
-                    new_row = row.to_frame().T
-                    new_row[report_col] = "新增商品: " + ", ".join([f"{col}: {row[col]}" for col in compare_df.columns if not col.startswith('比对报告')])
-                    db_df = pd.concat([db_df, new_row], ignore_index=True)
-                    # 标记新增商品的行索引
-                    styles[len(db_df)-1] = 'new'  # 新增商品标记为'new'
-                    new_items += 1
-                    self.log_message(f"新增商品: ID {product_id}")
-                else:
-                    # 现有商品 - 比对数据
-                    match_idx = match.index[0]
-                    diff_cols = []
-                    
-                    for col in compare_df.columns:
-                        if col != '比对报告' and row[col] != db_df.at[match_idx, col]:
-                            diff_cols.append(col)
-                    
-                    if diff_cols:
-                        # 有差异
-                        report = "数据差异: "
-                        report += ", ".join([f"{col}: {row[col]}→{db_df.at[match_idx, col]}" for col in diff_cols])
-                        db_df.at[match_idx, report_col] = report
-                        
-                        # 更新数据
-                        for col in diff_cols:
-                            db_df.at[match_idx, col] = row[col]
-                            
-                        styles[match_idx] = 'changed'  # 标记为有差异
-                        changed_items += 1
-                        self.log_message(f"更新商品: ID {product_id} - 差异项: {', '.join(diff_cols)}")
+                # 只解析了部分列时，新增商品需要补全其余列
+                other_cols = [col for col in compare_header if col not in compare_cols
+                              and not str(col).startswith('比对报告')]
+                if new_rows and other_cols:
+                    full_df = self.prefetcher.get(self.db_compare_file, other_cols)
+                    if full_df is None:
+                        full_df = read_table(self.db_compare_file, other_cols)
+                    db_rows = list(new_rows.keys())
+                    db_df.loc[db_rows, other_cols] = full_df.loc[list(new_rows.values()), other_cols].values
+            
+                # 报告列: 状态码分类列，只有差异行和疑似改号行带各自的文字
+                db_df[report_col] = row_status.column(db_df)
+            
+                # 应用样式 - 使用更可靠的方式
+                from openpyxl.styles import PatternFill
+                from openpyxl import load_workbook
+            
+                # 保存数据并应用样式 - 使用更可靠的方式
+                saved = False
+                try:
+                    # 创建临时文件路径(保留扩展名，openpyxl按扩展名识别格式)
+                    root, ext = os.path.splitext(db_path)
+                    temp_path = root + '.tmp' + ext
+                
+                    # 使用openpyxl直接创建工作簿
+                    from openpyxl import Workbook
+                    wb = Workbook()
+                    ws = wb.active
+                
+                    # 写入表头
+                    for col_num, col_name in enumerate(db_df.columns, 1):
+                        ws.cell(row=1, column=col_num, value=col_name)
+                
+                    # 写入数据
+                    for row_num, row in enumerate(db_df.values, 2):
+                        for col_num, value in enumerate(row, 1):
+                            ws.cell(row=row_num, column=col_num, value=value)
+                
+                    # 每种状态一个填充，所有行共用
+                    fills = {
+                        'new': PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid'),       # 新增-黄色
+                        'changed': PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid'),   # 差异-红色
+                        'probable': PatternFill(start_color='FFA500', end_color='FFA500', fill_type='solid'),  # 疑似改号-橙色
+                    }
+                    green_fill = PatternFill(start_color='00FF00', end_color='00FF00', fill_type='solid')     # 无差异-绿色
+                
+                    # 获取报告列索引(1-based)
+                    report_col_idx = db_df.columns.get_loc(report_col) + 1
+                
+                    # 应用颜色到报告列
+                    for idx, status in row_status.styles():
+                        row_idx = idx + 2  # Excel行索引从1开始，且跳过表头
+                        ws.cell(row=row_idx, column=report_col_idx).fill = fills.get(status, green_fill)
+                
+                    # 保存到临时文件
+                    wb.save(temp_path)
+                
+                    # 验证临时文件
+                    test_wb = load_workbook(temp_path)
+                    test_wb.close()
+                
+                    # 替换原文件
+                    os.replace(temp_path, db_path)
+                
+                    self.log_message("数据保存成功")
+                    db_entry = self.db_catalog.update_current(db_df)
+                    saved = True
+                    self.snapshot_store.create_snapshot(db_df, label=f"比对 {os.path.basename(self.db_compare_file)}")
+                except Exception as e:
+                    self.log_message(f"数据保存失败: {str(e)}", "red")
+                    # 恢复备份文件
+                    backup_path = db_path + ".bak"
+                    if os.path.exists(backup_path):
+                        shutil.copy2(backup_path, db_path)
                     else:
-                        # 无差异
-                        report = "数据一致: " + ", ".join([f"{col}: {row[col]}" for col in compare_df.columns if not col.startswith('比对报告')])
-                        db_df.at[match_idx, report_col] = report
-                        styles[match_idx] = 'unchanged'  # 标记为无差异
-                        unchanged_items += 1
-                        self.log_message(f"无差异商品: ID {product_id}")
-            
-            # 应用样式 - 使用更可靠的方式
-            from openpyxl.styles import PatternFill
-            from openpyxl import load_workbook
-            
-            # 保存数据并应用样式 - 使用更可靠的方式
-            try:
-                # 创建临时文件路径
-                temp_path = db_path + '.tmp'
-                
-                # 使用openpyxl直接创建工作簿
-                from openpyxl import Workbook
-                wb = Workbook()
-                ws = wb.active
-                
-                # 写入表头
-                for col_num, col_name in enumerate(db_df.columns, 1):
-                    ws.cell(row=1, column=col_num, value=col_name)
-                
-                # 写入数据
-                for row_num, row in enumerate(db_df.values, 2):
-                    for col_num, value in enumerate(row, 1):
-                        ws.cell(row=row_num, column=col_num, value=value)
-                
-                # 定义三种颜色填充
-                red_fill = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')  # 差异-红色
-                green_fill = PatternFill(start_color='00FF00', end_color='00FF00', fill_type='solid')  # 无差异-绿色
-                yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid') # 新增-黄色
-                
-                # 获取报告列索引(1-based)
-                report_col_idx = db_df.columns.get_loc(report_col) + 1
-                
-                # 应用颜色到报告列和整行
-                for idx, status in styles.items():
-                    row_idx = idx + 2  # Excel行索引从1开始，且跳过表头
-                    
-                    # 确保样式字典中的状态被正确识别
-                    if status == 'new':  # 新增商品 - 黄色
-                        fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-                        ws.cell(row=row_idx, column=report_col_idx).fill = fill
-                        self.log_message(f"应用黄色到新增商品行{row_idx}的报告列")
-                    elif status == 'changed':  # 有差异 - 红色
-                        fill = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
-                        ws.cell(row=row_idx, column=report_col_idx).fill = fill
-                    else:  # 无差异 - 绿色
-                        fill = PatternFill(start_color='00FF00', end_color='00FF00', fill_type='solid')
-                        ws.cell(row=row_idx, column=report_col_idx).fill = fill
-                
-                # 保存到临时文件
-                wb.save(temp_path)
-                
-                # 验证临时文件
-                test_wb = load_workbook(temp_path)
-                test_wb.close()
-                
-                # 替换原文件
-                if os.path.exists(db_path):
-                    os.remove(db_path)
-                os.rename(temp_path, db_path)
-                
-                self.log_message("数据保存成功")
-            except Exception as e:
-                self.log_message(f"数据保存失败: {str(e)}", "red")
-                # 恢复备份文件
-                backup_path = db_path + ".bak"
-                if os.path.exists(backup_path):
-                    shutil.copy2(backup_path, db_path)
-                else:
-                    self.log_message("无备份文件可恢复", "red")
+                        self.log_message("无备份文件可恢复", "red")
             
             # 输出总结报告
             summary = f"\n比对总结报告:\n"
@@ -954,8 +1412,16 @@ class MainWindow(QMainWindow):
             summary += f"新增商品数: {new_items}\n"
             summary += f"有差异商品数: {changed_items}\n"
             summary += f"无差异商品数: {unchanged_items}\n"
+            if rules.fuzzy_match:
+                summary += f"疑似改号商品数: {probable_items}\n"
+            summary += self.statistics_summary(stats.result())
             
             self.info_display.append(summary)
+            if saved and not new_items and not changed_items:
+                # 只缓存没有待应用变化的结果(写入后的数据库版本)；有新增或差异时变化已写入数据库，
+                # 再次比对应显示无待应用变化，因此不缓存
+                self.result_cache.put(self.db_cache_key(db_entry['content_hash'], columns, rules),
+                                      {'summary': summary})
             QMessageBox.information(self, "完成", "数据库比对完成")
             
         except Exception as e:
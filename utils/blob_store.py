@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+
+FICLONE = 0x40049409  # Linux ioctl for copy-on-write clones (btrfs, xfs)
+
+
+class BlobStore:
+    """Content-addressed store for uploaded files
+
+    Every unique file content is stored once under objects/<aa>/<sha256>.
+    Working copies and backups are hard links (or reflinks) to the blob,
+    and a small JSON manifest records every uploaded version. Digests of
+    hashed files are cached by (size, mtime) in an append-only log holding
+    at most STAT_CACHE_SIZE live entries, least recently used dropped first.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+    STAT_CACHE_SIZE = 4096
+
+    def __init__(self, root=os.path.join('data', 'store')):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self.stat_cache_path = os.path.join(root, 'stat_cache.jsonl')
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+        self.stat_cache = self._load_stat_cache()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'blobs': {}, 'versions': []}
+
+    def _save_manifest(self):
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+
+    def _load_stat_cache(self):
+        """Replay the digest log (last entry wins), dropping files that are gone"""
+        # Older manifests kept the cache inline; it moves to the log on the next save
+        cache = OrderedDict(self.manifest.pop('stat_cache', {}))
+        lines = 0
+        try:
+            with open(self.stat_cache_path, encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        key, size, mtime_ns, digest = json.loads(line)
+                    except (ValueError, TypeError):
+                        continue  # a line cut short by a crash
+                    cache.pop(key, None)
+                    cache[key] = [size, mtime_ns, digest]
+        except OSError:
+            pass
+        for key in [k for k in cache if not os.path.exists(k)]:
+            del cache[key]
+        while len(cache) > self.STAT_CACHE_SIZE:
+            cache.popitem(last=False)
+        if lines != len(cache):
+            self._compact_stat_cache(cache)  # only when the log holds dead or damaged lines
+        else:
+            self._stat_log_lines = lines
+        return cache
+
+    def _compact_stat_cache(self, cache):
+        """Rewrite the digest log with only the live entries"""
+        temp_path = self.stat_cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for key, entry in cache.items():
+                f.write(json.dumps([key] + entry, ensure_ascii=False) + '\n')
+        os.replace(temp_path, self.stat_cache_path)
+        self._stat_log_lines = len(cache)
+
+    @classmethod
+    def hash_file(cls, file_path):
+        """Stream the file through sha256 without loading it into memory"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def file_digest(self, file_path):
+        """Hash a file, reusing the cached digest when size and mtime are unchanged"""
+        stat = os.stat(file_path)
+        key = os.path.abspath(file_path)
+        with self._lock:
+            cached = self.stat_cache.get(key)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                self.stat_cache.move_to_end(key)
+                return cached[2]
+
+        digest = self.hash_file(file_path)
+        entry = [stat.st_size, stat.st_mtime_ns, digest]
+        with self._lock:
+            self.stat_cache.pop(key, None)
+            self.stat_cache[key] = entry
+            if len(self.stat_cache) > self.STAT_CACHE_SIZE:
+                self.stat_cache.popitem(last=False)
+            if self._stat_log_lines >= 2 * self.STAT_CACHE_SIZE:
+                self._compact_stat_cache(self.stat_cache)
+            else:
+                with open(self.stat_cache_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps([key] + entry, ensure_ascii=False) + '\n')
+                self._stat_log_lines += 1
+        return digest
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def contains(self, digest):
+        return digest in self.manifest['blobs'] and os.path.exists(self.blob_path(digest))
+
+    def put(self, file_path):
+        """Store a file by content, returns (digest, is_new)"""
+        digest = self.file_digest(file_path)
+        if self.contains(digest):
+            return digest, False
+
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # A temp name of its own: concurrent puts of the same content must not share one
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, blob_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self.manifest['blobs'][digest] = {
+                'size': os.path.getsize(blob_path),
+                'ext': os.path.splitext(file_path)[1].lower(),
+                'stored_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            self._save_manifest()
+        return digest, True
+
+    def link(self, digest, target_path):
+        """Materialize a blob at target_path without copying when possible
+
+        Writers must replace target files atomically (write temp + os.replace)
+        instead of truncating them, otherwise a hard link would modify the blob.
+        """
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+        if os.path.exists(target_path):
+            os.remove(target_path)
+
+        try:
+            os.link(blob_path, target_path)
+            return target_path
+        except OSError:
+            pass
+
+        if sys.platform.startswith('linux'):
+            try:
+                import fcntl
+                with open(blob_path, 'rb') as src, open(target_path, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return target_path
+            except OSError:
+                if os.path.exists(target_path):
+                    os.remove(target_path)
+
+        shutil.copyfile(blob_path, target_path)
+        return target_path
+
+    def record_version(self, digest, original_name, kind, path):
+        """Append an upload to the version history"""
+        version = {
+            'digest': digest,
+            'name': original_name,
+            'kind': kind,
+            'path': path,
+            'uploaded_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self._lock:
+            self.manifest['versions'].append(version)
+            self._save_manifest()
+        return version
+
+    def versions(self, kind=None):
+        """List recorded versions, oldest first"""
+        return [v for v in self.manifest['versions'] if kind is None or v['kind'] == kind]
+
+    def latest_version(self, kind):
+        versions = self.versions(kind)
+        return versions[-1] if versions else None
+
+    def backup(self, digest, file_path, backup_dir=os.path.join('data', 'backup')):
+        """Keep a per-content backup so same-named uploads no longer overwrite each other"""
+        stem, ext = os.path.splitext(os.path.basename(file_path))
+        backup_path = os.path.join(backup_dir, f"{stem}_{digest[:12]}{ext}")
+        if not os.path.exists(backup_path):
+            self.link(digest, backup_path)
+        return backup_path
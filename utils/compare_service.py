@@ -0,0 +1,539 @@
+"""Long-running comparison service on localhost
+
+Keeps the product database and recently used feeds parsed in memory and runs
+comparison jobs submitted over HTTP by the GUI or by scripts:
+
+    python -m utils.compare_service serve [--db data/xlsx/products.xlsx] [--port 8765]
+    python -m utils.compare_service db feed.xlsx [--columns 价格,库存]
+    python -m utils.compare_service merge feed1.xlsx feed2.xlsx
+    python -m utils.compare_service manual a.xlsx b.xlsx
+    python -m utils.compare_service status
+
+Every request must carry the session token that the service writes to
+data/compare_service_<port>.token when it starts (CompareClient reads it);
+browser requests (with an Origin header) and POSTs that are not JSON are
+rejected, and db/merge jobs only write databases listed in the catalog.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import secrets
+import queue
+import argparse
+import threading
+import itertools
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from logic.diff_logic import DataComparator, db_lock
+from logic.snapshot_store import SnapshotStore
+from utils.db_catalog import DatabaseCatalog
+from utils.prefetch import TablePrefetcher
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+JOB_KINDS = ('db', 'merge', 'manual', 'workbook')
+TOKEN_HEADER = 'X-Compare-Token'
+
+
+def token_path(port=DEFAULT_PORT, data_dir='data'):
+    """File holding the session token of the service on port"""
+    return os.path.join(data_dir, f"compare_service_{port}.token")
+
+
+class CompareService:
+    """Run comparison jobs against a database kept warm in memory
+
+    The database and every submitted file are parsed once into a shared
+    TablePrefetcher; later jobs reuse the parsed tables as long as the files
+    are unchanged, and a database rewritten by a job is kept in memory as
+    written. Feeds are prefetched as soon as a job is submitted, so parsing
+    overlaps the wait in the queue.
+
+    db and merge jobs rewrite the database and run one at a time, in
+    submission order, on their own worker; manual and workbook jobs only read and are shared by
+    max_workers other workers. The HTTP server binds to localhost only and
+    requires the session token written to token_file (readable by the
+    current user only) on every request. Jobs may only write db_file and
+    the databases registered in the catalog at catalog_path.
+
+    Each job runs on its own DataComparator. A db or merge job holds the DB
+    file's lock (see logic.diff_logic.db_lock) until the catalog entry and
+    a snapshot of the rewritten DB are recorded, as the GUI does after its
+    own comparisons. Pass the GUI's catalog and snapshot_store when running
+    inside it, so those files have one writer.
+    """
+
+    def __init__(self, db_file=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 max_workers=2, max_tables=8, max_jobs=500,
+                 catalog_path=os.path.join('data', 'catalog.json'), token_file=None,
+                 catalog=None, snapshot_store=None):
+        self.db_file = db_file
+        self.catalog_path = catalog.catalog_path if catalog is not None else catalog_path
+        self.catalog = catalog
+        self.snapshot_store = snapshot_store
+        self.token_file = token_file
+        self.token = None
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.tables = TablePrefetcher(max_entries=max_tables)
+
+        self.db_jobs = queue.Queue()
+        self.read_jobs = queue.Queue()
+        self.jobs = OrderedDict()   # job id -> job dict, oldest first
+        self._jobs_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+        self.started_at = None
+
+    def start(self):
+        """Warm the database, start the workers and the HTTP server"""
+        if self.db_file:
+            self.tables.prefetch(self.db_file)
+        self._stop.clear()
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        self.port = self._server.server_address[1]
+        self._write_token()
+
+        self._threads = [
+            threading.Thread(target=self._worker_loop, args=(self.db_jobs,), name='compare-db', daemon=True),
+            threading.Thread(target=self._server.serve_forever, name='compare-http', daemon=True)
+        ]
+        for i in range(self.max_workers):
+            self._threads.append(threading.Thread(
+                target=self._worker_loop, args=(self.read_jobs,), name=f'compare-worker-{i}', daemon=True))
+        for t in self._threads:
+            t.start()
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def stop(self, timeout=None):
+        """Stop accepting jobs; workers finish the job they are running"""
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._remove_token()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+        self.tables.shutdown()
+
+    def _write_token(self):
+        self.token = secrets.token_urlsafe(32)
+        if self.token_file is None:
+            self.token_file = token_path(self.port)
+        os.makedirs(os.path.dirname(self.token_file) or '.', exist_ok=True)
+        if os.path.exists(self.token_file):
+            os.remove(self.token_file)
+        fd = os.open(self.token_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self.token)
+
+    def _remove_token(self):
+        try:
+            os.remove(self.token_file)
+        except OSError:
+            pass
+
+    def authorized(self, token):
+        """Whether a request token is this session's token"""
+        return bool(self.token and token) and hmac.compare_digest(token.encode('utf-8'),
+                                                                  self.token.encode('utf-8'))
+
+    def allowed_databases(self):
+        """Absolute paths of the databases jobs may write: db_file and the catalog's versions"""
+        paths = {os.path.abspath(v['path']) for v in self._catalog().versions()}
+        if self.db_file:
+            paths.add(os.path.abspath(self.db_file))
+        return paths
+
+    def _catalog(self):
+        """The shared catalog, or the catalog file as it is now"""
+        return self.catalog if self.catalog is not None else DatabaseCatalog(self.catalog_path)
+
+    def set_database(self, db_file, df=None):
+        """Switch the database used by later db jobs (df: its parsed table, if at hand)"""
+        self.db_file = db_file
+        if df is not None:
+            self.tables.put(db_file, df)
+        else:
+            self.tables.prefetch(db_file)
+
+    def is_running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def serve_forever(self):
+        """start() and block until stop() is called (or Ctrl+C)"""
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop(timeout=5)
+
+    @property
+    def address(self):
+        return f"http://{self.host}:{self.port}"
+
+    def submit(self, kind, files, columns=None, db_file=None, shards=None, tag=None):
+        """Queue a job, returns its id
+
+        kind 'db' compares files[0] with db_file (default: the service
+        database), 'merge' merges all files into it (later files win);
+        'manual' and 'workbook' compare the given files.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        files = [os.path.abspath(f) for f in files]
+        writes_db = kind in ('db', 'merge')
+        if writes_db:
+            db_file = os.path.abspath(db_file) if db_file else self.db_file
+            if not db_file:
+                raise ValueError("No database file configured for db jobs")
+            if os.path.abspath(db_file) not in self.allowed_databases():
+                raise ValueError(f"Not a registered database: {db_file}")
+            if kind == 'db' and len(files) != 1:
+                raise ValueError("db jobs take exactly one input file")
+        elif len(files) < 2:
+            raise ValueError("At least 2 files are required for comparison")
+        for path in files + ([db_file] if writes_db else []):
+            if not os.path.isfile(path):
+                raise ValueError(f"File not found: {path}")
+
+        job = {
+            'id': str(next(self._ids)),
+            'kind': kind,
+            'files': files,
+            'db_file': db_file if writes_db else None,
+            'columns': list(columns) if columns else None,
+            'shards': shards,
+            'tag': tag,
+            'status': 'queued',
+            'submitted_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'started_at': None,
+            'elapsed': None,
+            'success': None,
+            'message': None,
+            'result': None
+        }
+        with self._jobs_lock:
+            self.jobs[job['id']] = job
+            while len(self.jobs) > self.max_jobs:
+                oldest = next(iter(self.jobs))
+                if self.jobs[oldest]['status'] in ('queued', 'running'):
+                    break
+                del self.jobs[oldest]
+
+        # Start parsing now; the worker picks the parsed tables up later
+        if kind != 'workbook':
+            for path in files:
+                self.tables.prefetch(path)
+        (self.db_jobs if writes_db else self.read_jobs).put(job['id'])
+        return job['id']
+
+    def job(self, job_id):
+        """Copy of a job's state, or None"""
+        with self._jobs_lock:
+            job = self.jobs.get(str(job_id))
+            return dict(job) if job else None
+
+    def status(self):
+        with self._jobs_lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {
+            'db_file': self.db_file,
+            'started_at': self.started_at,
+            'jobs': counts,
+            'queued_db_jobs': self.db_jobs.qsize(),
+            'queued_read_jobs': self.read_jobs.qsize()
+        }
+
+    def _worker_loop(self, jobs):
+        while not self._stop.is_set():
+            try:
+                job_id = jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._run(job_id)
+            finally:
+                jobs.task_done()
+
+    def _run(self, job_id):
+        with self._jobs_lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        start = time.perf_counter()
+        try:
+            success, message, result = self._execute(job)
+            status = 'done' if success else 'failed'
+        except Exception as e:
+            success, message, result, status = False, str(e), None, 'failed'
+        with self._jobs_lock:
+            job.update(status=status, success=success, message=message, result=result,
+                       elapsed=round(time.perf_counter() - start, 3))
+
+    def _execute(self, job):
+        comparator = DataComparator(tables=self.tables)
+        if job['kind'] == 'manual':
+            success, msg, report_path = comparator.manual_compare(job['files'], columns=job['columns'])
+            return success, msg, {'report_path': report_path} if success else None
+        if job['kind'] == 'workbook':
+            success, msg, report_path = comparator.compare_workbooks(job['files'], columns=job['columns'])
+            return success, msg, {'report_path': report_path} if success else None
+
+        input_file = job['files'][0]
+        with db_lock(job['db_file']):
+            if job['kind'] == 'merge':
+                success, msg, report = comparator.merge_feeds(job['db_file'], job['files'],
+                                                              columns=job['columns'], shards=job['shards'])
+            else:
+                success, msg, report = comparator.db_compare(job['db_file'], input_file,
+                                                             columns=job['columns'], shards=job['shards'])
+            if success and (report['new_items'] or report['updates']):
+                self._record_write(job)
+        if not success:
+            return success, msg, None
+        tag = job['tag'] or os.path.splitext(os.path.basename(input_file))[0]
+        result = {
+            'report_path': comparator._generate_report(report, job['kind'], tag=tag),
+            'total_compared': report['total_compared'],
+            'new_items': len(report['new_items']),
+            'updates': len(report['updates']),
+            'matches': report['matches'],
+            'duplicate_ids': report.get('duplicate_ids', {}),
+            'key_mismatches': report.get('key_mismatches', []),
+            'statistics': report['statistics']
+        }
+        if job['kind'] == 'merge':
+            result['feeds'] = report['feeds']
+            result['conflicts'] = len(report['conflicts'])
+        return success, msg, result
+
+
+    def _record_write(self, job):
+        """Refresh the catalog entry of a rewritten DB and snapshot it (caller holds its lock)"""
+        db_file = job['db_file']
+        df = self.tables.get(db_file)  # kept in memory as written
+        self._catalog().update_path(db_file, df)
+        if df is not None:
+            if self.snapshot_store is None:
+                self.snapshot_store = SnapshotStore()
+            names = ', '.join(os.path.basename(f) for f in job['files'])
+            self.snapshot_store.create_snapshot(df, label=f"比对服务 {names}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """JSON API of CompareService
+
+    GET  /status          service state and queue sizes
+    POST /jobs            {"kind", "files", "columns", "db_file", "shards", "tag"} -> {"id"}
+    GET  /jobs/<id>       job state and, once done, its result
+    POST /shutdown        stop the service
+
+    Every request needs the X-Compare-Token header. Requests with an Origin
+    header (sent by browsers) are refused, and POST bodies must be
+    application/json, which a web page cannot send without a CORS preflight.
+    """
+
+    def _send(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _refused(self, post=False):
+        """Send the error and return True when the request may not be served"""
+        if self.headers.get('Origin') is not None:
+            self._send(403, {'error': 'Cross-origin requests are not accepted'})
+            return True
+        if not self.server.service.authorized(self.headers.get(TOKEN_HEADER)):
+            self._send(403, {'error': 'Missing or invalid service token'})
+            return True
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if post and content_type != 'application/json':
+            self._send(415, {'error': 'Content-Type must be application/json'})
+            return True
+        return False
+
+    def do_GET(self):
+        service = self.server.service
+        if self._refused():
+            return
+        if self.path == '/status':
+            return self._send(200, service.status())
+        if self.path.startswith('/jobs/'):
+            job = service.job(self.path[len('/jobs/'):])
+            if job is None:
+                return self._send(404, {'error': 'Unknown job'})
+            return self._send(200, job)
+        self._send(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        service = self.server.service
+        if self._refused(post=True):
+            return
+        if self.path == '/shutdown':
+            self._send(200, {'stopping': True})
+            threading.Thread(target=service.stop, daemon=True).start()
+            return
+        if self.path != '/jobs':
+            return self._send(404, {'error': 'Not found'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(length) or b'{}')
+            job_id = service.submit(params.get('kind', 'db'), params.get('files') or [],
+                                    columns=params.get('columns'), db_file=params.get('db_file'),
+                                    shards=params.get('shards'), tag=params.get('tag'))
+        except (ValueError, TypeError) as e:
+            return self._send(400, {'error': str(e)})
+        self._send(202, {'id': job_id})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CompareClient:
+    """Submit jobs to a running CompareService
+
+    The session token is read from token_file (default: the service's token
+    file for port) on every request, so a restarted service is picked up.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=10.0, token_file=None):
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+        self.token_file = token_file or token_path(port)
+
+    def _token(self):
+        try:
+            with open(self.token_file, encoding='utf-8') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json',
+                                                  TOKEN_HEADER: self._token()})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error', str(e))
+            except ValueError:
+                message = str(e)
+            raise ValueError(message) from None
+
+    def is_available(self):
+        try:
+            self.status()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def status(self):
+        return self._request('GET', '/status')
+
+    def submit(self, kind, files, columns=None, db_file=None, shards=None, tag=None):
+        return self._request('POST', '/jobs', {
+            'kind': kind, 'files': [os.path.abspath(f) for f in files], 'columns': columns,
+            'db_file': os.path.abspath(db_file) if db_file else None, 'shards': shards, 'tag': tag
+        })['id']
+
+    def job(self, job_id):
+        return self._request('GET', f"/jobs/{job_id}")
+
+    def wait(self, job_id, timeout=None, poll_interval=0.2):
+        """Poll until the job is done or failed, returns the job dict"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.job(job_id)
+            if job['status'] in ('done', 'failed'):
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def db_compare(self, input_file, columns=None, db_file=None, timeout=None):
+        return self.wait(self.submit('db', [input_file], columns=columns, db_file=db_file), timeout)
+
+    def manual_compare(self, files, columns=None, timeout=None):
+        return self.wait(self.submit('manual', files, columns=columns), timeout)
+
+    def shutdown(self):
+        return self._request('POST', '/shutdown', {})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ProductLogger comparison service")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the service")
+    serve.add_argument('--db', help="database file (default: current database in data/catalog.json)")
+    serve.add_argument('--workers', type=int, default=2)
+
+    for kind in JOB_KINDS:
+        command = commands.add_parser(kind, help=f"submit a {kind} comparison and wait for it")
+        command.add_argument('files', nargs='+')
+        command.add_argument('--columns', help="comma separated columns to compare")
+        if kind in ('db', 'merge'):
+            command.add_argument('--db', help="database file (default: the service database)")
+    commands.add_parser('status', help="show the service state")
+    commands.add_parser('stop', help="stop the service")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        db_file = args.db
+        if db_file is None:
+            entry = DatabaseCatalog().current()
+            db_file = entry['path'] if entry else None
+        service = CompareService(os.path.abspath(db_file) if db_file else None,
+                                 args.host, args.port, max_workers=args.workers)
+        print(f"Comparison service on {args.host}:{args.port}, database: {db_file or '-'}")
+        service.serve_forever()
+        return 0
+
+    client = CompareClient(args.host, args.port)
+    if args.command == 'status':
+        print(json.dumps(client.status(), ensure_ascii=False, indent=2))
+        return 0
+    if args.command == 'stop':
+        client.shutdown()
+        return 0
+
+    columns = [c.strip() for c in args.columns.split(',') if c.strip()] if args.columns else None
+    job_id = client.submit(args.command, args.files, columns=columns, db_file=getattr(args, 'db', None))
+    job = client.wait(job_id)
+    print(json.dumps(job, ensure_ascii=False, indent=2, default=str))
+    return 0 if job['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import os
+import json
+import threading
+from datetime import datetime
+
+from utils.blob_store import BlobStore
+from utils.table_reader import read_header
+
+
+class DatabaseCatalog:
+    """Persistent catalog of database versions
+
+    Keeps path, format, row count, schema, content hash and creation time of
+    every DB version so the current database and its metadata are known
+    without listing or stat-ing the data directories. Entries also record
+    the file's size and mtime, so a DB rewritten without updating the
+    catalog (folder watcher, comparison service, scripts) is noticed and its
+    hash and columns refreshed when it is next looked up.
+    """
+
+    def __init__(self, catalog_path=os.path.join('data', 'catalog.json')):
+        self.catalog_path = catalog_path
+        self._lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.catalog_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'current': None, 'versions': []}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.catalog_path) or '.', exist_ok=True)
+        temp_path = self.catalog_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.catalog_path)
+
+    def register(self, path, df=None, content_hash=None, rows=None, columns=None):
+        """Record a new DB version and make it current"""
+        if df is not None:
+            rows = len(df)
+            columns = [str(c) for c in df.columns]
+        entry = {
+            'path': path,
+            'format': os.path.splitext(path)[1][1:].lower(),
+            'rows': rows,
+            'columns': columns,
+            'content_hash': content_hash or BlobStore.hash_file(path),
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        self._stamp(entry)
+        with self._lock:
+            self.data['versions'].append(entry)
+            self.data['current'] = len(self.data['versions']) - 1
+            self._save()
+        return entry
+
+    def update_current(self, df=None, content_hash=None):
+        """Refresh the current entry after the DB file was rewritten in place"""
+        with self._lock:
+            return self._update(self._current(), df, content_hash)
+
+    def update_path(self, path, df=None, content_hash=None):
+        """Refresh the newest entry of the DB at path after it was rewritten, or None"""
+        path = os.path.abspath(path)
+        with self._lock:
+            entries = [v for v in self.data['versions'] if os.path.abspath(v['path']) == path]
+            return self._update(entries[-1] if entries else None, df, content_hash)
+
+    def _update(self, entry, df, content_hash):
+        """Refresh entry (caller holds the lock)"""
+        if entry is None:
+            return None
+        if df is not None:
+            entry['rows'] = len(df)
+            entry['columns'] = [str(c) for c in df.columns]
+        entry['content_hash'] = content_hash or BlobStore.hash_file(entry['path'])
+        entry['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._stamp(entry)
+        self._save()
+        return entry
+
+    def current(self):
+        """The current DB entry, or None
+
+        If the file's size or mtime no longer match the catalog, its content
+        hash and columns are refreshed first (the row count becomes None when
+        the content changed).
+        """
+        with self._lock:
+            entry = self._current()
+            if entry is not None and self._stale(entry):
+                content_hash = BlobStore.hash_file(entry['path'])
+                if content_hash != entry['content_hash']:
+                    entry['content_hash'] = content_hash
+                    entry['columns'] = [str(c) for c in read_header(entry['path'])]
+                    entry['rows'] = None
+                    entry['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                self._stamp(entry)
+                self._save()
+        return entry
+
+    def _current(self):
+        index = self.data['current']
+        return self.data['versions'][index] if index is not None else None
+
+    @staticmethod
+    def _stamp(entry):
+        try:
+            st = os.stat(entry['path'])
+        except OSError:
+            return
+        entry['size'], entry['mtime_ns'] = st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _stale(entry):
+        try:
+            st = os.stat(entry['path'])
+        except OSError:
+            return False
+        return (entry.get('size'), entry.get('mtime_ns')) != (st.st_size, st.st_mtime_ns)
+
+    def versions(self, fmt=None):
+        return [v for v in self.data['versions'] if fmt is None or v['format'] == fmt]
+
+    def rebuild_from_disk(self, data_dir='data'):
+        """One-off migration for installs without a catalog: register the newest DB file"""
+        candidates = []
+        for fmt in ('xlsx', 'csv'):
+            dir_path = os.path.join(data_dir, fmt)
+            if os.path.isdir(dir_path):
+                candidates.extend(os.path.join(dir_path, f) for f in os.listdir(dir_path)
+                                  if f.endswith(f'.{fmt}') and not f.startswith('~$'))
+        if not candidates:
+            return None
+        latest = max(candidates, key=os.path.getmtime)
+        return self.register(latest)
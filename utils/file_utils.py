@@ -39,16 +39,22 @@ def is_locked(config):
     return False
 import shutil
 import hashlib
-import smtplib
-from email.mime.text import MIMEText
 from datetime import datetime
 
+from utils.blob_store import BlobStore
+from utils.notification_outbox import NotificationOutbox
+from utils.table_reader import read_table
+
 class FileUtils:
     def __init__(self):
         self.password_hash = None
         self.user_email = None
         self.attempt_count = 0
         self.locked_until = None
+        self.outbox = NotificationOutbox(os.path.join('data', 'alert_outbox'),
+                                         host='localhost', port=25, username='', starttls=False)
+        # One BlobStore per upload target directory, loaded on first use
+        self.stores = {}
         
     def set_credentials(self, password, email):
         """Set password and email for security"""
@@ -80,32 +86,40 @@ class FileUtils:
             return False
             
         try:
-            msg = MIMEText(message)
-            msg['Subject'] = 'Product Logger Security Alert'
-            msg['From'] = 'noreply@productlogger.com'
-            msg['To'] = self.user_email
-            
-            # TODO: Configure SMTP settings
-            with smtplib.SMTP('localhost') as server:
-                server.send_message(msg)
+            # Queued for the background sender, delivery does not block the caller
+            self.outbox.enqueue(self.user_email, 'Product Logger Security Alert',
+                                message, from_addr='noreply@productlogger.com')
             return True
         except Exception:
             return False
             
+    def blob_store(self, target_dir):
+        """The BlobStore of target_dir/store, shared by every upload to target_dir"""
+        root = os.path.abspath(os.path.join(target_dir, 'store'))
+        if root not in self.stores:
+            self.stores[root] = BlobStore(root)
+        return self.stores[root]
+            
     def upload_file(self, file_path, target_dir):
         """Handle file upload with backup and organization"""
         try:
-            # Create backup
-            backup_dir = os.path.join(target_dir, 'backup')
-            os.makedirs(backup_dir, exist_ok=True)
-            backup_path = os.path.join(backup_dir, os.path.basename(file_path))
-            shutil.copy2(file_path, backup_path)
+            # Store content once; backup and working copy are links to the blob
+            store = self.blob_store(target_dir)
+            digest, is_new = store.put(file_path)
+            store.backup(digest, file_path, os.path.join(target_dir, 'backup'))
             
             # Organize by file type
             ext = os.path.splitext(file_path)[1].lower()[1:]  # Remove dot
             type_dir = os.path.join(target_dir, ext)
             os.makedirs(type_dir, exist_ok=True)
             
+            # Identical re-upload of the current file: keep it as is
+            latest = store.latest_version(ext)
+            if (not is_new and latest and os.path.exists(latest['path'])
+                    and store.file_digest(latest['path']) == digest):
+                os.remove(file_path)
+                return latest['path']
+            
             # Save with timestamp and original filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             original_name = os.path.splitext(os.path.basename(file_path))[0]
@@ -117,7 +131,9 @@ class FileUtils:
                 if f.endswith(f".{ext}"):
                     os.remove(os.path.join(type_dir, f))
                 
-            shutil.move(file_path, final_path)
+            store.link(digest, final_path)
+            store.record_version(digest, os.path.basename(file_path), ext, final_path)
+            os.remove(file_path)
             return final_path
         except Exception as e:
             return None
@@ -133,7 +149,7 @@ class FileUtils:
             }
             
             if file_path.lower().endswith(('.xlsx', '.csv')):
-                df = pd.read_excel(file_path) if file_path.endswith('.xlsx') else pd.read_csv(file_path)
+                df = read_table(file_path)
                 stats['rows'] = len(df)
                 stats['columns'] = list(df.columns)
                 
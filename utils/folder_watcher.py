@@ -0,0 +1,181 @@
+import os
+import time
+import queue
+import shutil
+import threading
+from datetime import datetime
+
+from logic.diff_logic import DataComparator
+from utils.blob_store import BlobStore
+from utils.row_index import RowOffsetIndex
+
+
+class FolderWatcher:
+    """Watch a drop folder and run db_compare on every new xlsx/csv feed
+
+    Workers back up, report on and file feeds in parallel, but db_compare
+    holds the DB file's lock (see logic.diff_logic.db_lock) while it reads,
+    compares and rewrites it, so comparisons against one DB run one at a
+    time, also against the GUI and the comparison service. max_workers
+    therefore overlaps the I/O around comparisons, not the comparisons.
+    Backups are per content (BlobStore.backup); pass the program's
+    blob_store so its manifest is not written by two instances.
+    """
+
+    SUPPORTED_EXTS = ('.xlsx', '.csv')
+
+    def __init__(self, watch_dir, db_file, max_workers=2, max_pending=16,
+                 settle_time=2.0, poll_interval=1.0,
+                 backup_dir=os.path.join('data', 'backup'), blob_store=None):
+        self.watch_dir = watch_dir
+        self.db_file = db_file
+        self.max_workers = max_workers
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.backup_dir = backup_dir
+        self.processed_dir = os.path.join(watch_dir, 'processed')
+        self.failed_dir = os.path.join(watch_dir, 'failed')
+
+        # Bounded queue: when it is full the scanner stops enqueuing and the
+        # files simply stay in the drop folder until a worker frees a slot
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.results = queue.Queue()
+
+        self.blob_store = blob_store or BlobStore()
+        self._stop = threading.Event()
+        self._seen = {}        # path -> (size, mtime, first time this state was seen)
+        self._queued = set()   # paths waiting in or taken from the queue
+        self._threads = []
+
+    def set_database(self, db_file):
+        """Compare feeds queued from now on with db_file (e.g. after a new DB upload)"""
+        self.db_file = db_file
+
+    def start(self):
+        """Start the scanner thread and the worker pool"""
+        for path in (self.watch_dir, self.processed_dir, self.failed_dir, self.backup_dir):
+            os.makedirs(path, exist_ok=True)
+
+        self._stop.clear()
+        scanner = threading.Thread(target=self._scan_loop, name='folder-watcher', daemon=True)
+        self._threads = [scanner]
+        for i in range(self.max_workers):
+            self._threads.append(threading.Thread(
+                target=self._worker_loop, name=f'ingest-worker-{i}', daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=None):
+        """Stop scanning; workers finish the job they are running"""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def is_running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def scan_once(self):
+        """Scan the drop folder once and queue files whose writes have settled"""
+        now = time.monotonic()
+        present = set()
+
+        try:
+            entries = list(os.scandir(self.watch_dir))
+        except FileNotFoundError:
+            return 0
+
+        queued = 0
+        for entry in entries:
+            name = entry.name
+            if not entry.is_file() or name.startswith(('~$', '.')):
+                continue
+            if not name.lower().endswith(self.SUPPORTED_EXTS):
+                continue
+
+            path = entry.path
+            present.add(path)
+            if path in self._queued:
+                continue
+
+            stat = entry.stat()
+            state = (stat.st_size, stat.st_mtime)
+            previous = self._seen.get(path)
+            if previous is None or previous[:2] != state:
+                # New file or still being written - restart the debounce window
+                self._seen[path] = state + (now,)
+                continue
+            if stat.st_size == 0 or now - previous[2] < self.settle_time:
+                continue
+
+            self._queued.add(path)
+            try:
+                self.pending.put_nowait(path)
+            except queue.Full:
+                # Back-pressure: leave the rest for a later scan
+                self._queued.discard(path)
+                break
+            del self._seen[path]
+            queued += 1
+
+        # Forget files that disappeared before they settled
+        for path in list(self._seen):
+            if path not in present:
+                del self._seen[path]
+
+        return queued
+
+    def _scan_loop(self):
+        while not self._stop.is_set():
+            self.scan_once()
+            self._stop.wait(self.poll_interval)
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                path = self.pending.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            try:
+                self.results.put(self._ingest(path))
+            finally:
+                self._queued.discard(path)
+                self.pending.task_done()
+
+    @staticmethod
+    def _move(path, target):
+        """Move a feed together with its row-offset sidecar (moving keeps the mtime it checks)"""
+        shutil.move(path, target)
+        sidecar = RowOffsetIndex.sidecar_path(path)
+        if os.path.exists(sidecar):
+            shutil.move(sidecar, RowOffsetIndex.sidecar_path(target))
+
+    def _ingest(self, path):
+        """Back up one feed, compare it with the database and file it away"""
+        name = os.path.basename(path)
+        # Microseconds keep same-named feeds filed within one second apart
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        try:
+            # Same-named feeds with different contents each keep their own backup
+            digest, _ = self.blob_store.put(path)
+            self.blob_store.backup(digest, path, self.backup_dir)
+
+            # One comparator per job: workers run in parallel and it keeps per-run state
+            comparator = DataComparator()
+            success, msg, report = comparator.db_compare(self.db_file, path)
+            report_path = None
+            if success:
+                report_path = comparator._generate_report(
+                    report, 'db', tag=os.path.splitext(name)[0])
+
+            target_dir = self.processed_dir if success else self.failed_dir
+            self._move(path, os.path.join(target_dir, f"{timestamp}_{name}"))
+            return {'file': name, 'success': success, 'message': msg,
+                    'report': report, 'report_path': report_path}
+        except Exception as e:
+            try:
+                self._move(path, os.path.join(self.failed_dir, f"{timestamp}_{name}"))
+            except OSError:
+                pass
+            return {'file': name, 'success': False, 'message': str(e),
+                    'report': None, 'report_path': None}
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import uuid
+import smtplib
+import threading
+from email.mime.text import MIMEText
+
+
+class NotificationOutbox:
+    """Persistent e-mail outbox drained by a background sender
+
+    enqueue() only writes a small JSON file to outbox/pending and returns, so
+    the GUI thread never waits on SMTP. The sender thread delivers due
+    messages in batches over one reused connection and retries failures with
+    exponential backoff; messages that keep failing are moved to outbox/failed.
+    Messages enqueued with secret=True (e.g. verification codes) are never
+    written to disk: they wait in memory, are dropped once they expire, and
+    only their headers and error are recorded in outbox/failed.
+    SMTP settings default to the SMTP_* environment variables.
+    """
+
+    def __init__(self, outbox_dir=os.path.join('data', 'outbox'),
+                 host=None, port=None, username=None, password=None, starttls=None,
+                 batch_size=20, max_retries=5, base_delay=2.0, max_delay=600.0,
+                 poll_interval=5.0, idle_timeout=60.0, timeout=10.0):
+        self.pending_dir = os.path.join(outbox_dir, 'pending')
+        self.failed_dir = os.path.join(outbox_dir, 'failed')
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        env = os.environ
+        self.host = host or env.get('SMTP_HOST', 'smtp.example.com')
+        self.port = int(port or env.get('SMTP_PORT', 587))
+        self.username = username if username is not None else env.get('SMTP_USER', 'username')
+        self.password = password if password is not None else env.get('SMTP_PASSWORD', 'password')
+        if starttls is None:
+            starttls = env.get('SMTP_STARTTLS', '1') not in ('0', 'false', 'no')
+        self.starttls = starttls
+
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._server = None
+        self._last_used = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._secret = {}  # message id -> message, for secret messages only
+
+    def enqueue(self, to_addr, subject, body, from_addr='system@datacompare.com',
+                secret=False, expires_in=None):
+        """Persist a message and wake the sender; never blocks on the network
+
+        secret=True keeps the message in memory only, so it is lost if the
+        program exits before delivery. A message still undelivered expires_in
+        seconds after enqueueing is not sent any more.
+        """
+        message = {
+            'id': f"{time.time_ns()}_{uuid.uuid4().hex[:8]}",
+            'to': to_addr,
+            'from': from_addr,
+            'subject': subject,
+            'body': body,
+            'attempts': 0,
+            'next_attempt': 0,
+            'last_error': None,
+            'expires_at': time.time() + expires_in if expires_in is not None else None,
+            'secret': secret
+        }
+        if secret:
+            with self._lock:
+                self._secret[message['id']] = message
+        else:
+            self._write(os.path.join(self.pending_dir, f"{message['id']}.json"), message)
+        self.start()
+        self._wake.set()
+        return message['id']
+
+    @staticmethod
+    def _write(path, message):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(message, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def purge(self, subject):
+        """Delete stored messages (pending and failed) with this subject, returns how many
+
+        For secrets written to disk before secret=True existed.
+        """
+        removed = 0
+        for folder in (self.pending_dir, self.failed_dir):
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        stored = json.load(f).get('subject')
+                except (OSError, ValueError):
+                    continue
+                if stored == subject:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+    def pending_count(self):
+        with self._lock:
+            secret = len(self._secret)
+        return secret + len([f for f in os.listdir(self.pending_dir) if f.endswith('.json')])
+
+    def start(self):
+        """Start the background sender if it is not running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='notification-outbox', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._close()
+
+    def flush(self, timeout=30.0):
+        """Wait until nothing due is left in the outbox (used at shutdown and in tests)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self._due_messages(limit=1):
+                return True
+            self._wake.set()
+            time.sleep(0.05)
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            while self.send_batch():
+                if self._stop.is_set():
+                    break
+            if self._server and time.monotonic() - self._last_used > self.idle_timeout:
+                self._close()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        self._close()
+
+    def _due_messages(self, limit):
+        """Up to limit due or expired (path, message) pairs; path is None for secret messages
+
+        Secret messages come first: they carry short-lived codes.
+        """
+        now = time.time()
+        with self._lock:
+            secret = sorted(self._secret.values(), key=lambda m: m['id'])
+        due = [(None, m) for m in secret if self._due(m, now)][:limit]
+        for name in sorted(os.listdir(self.pending_dir)):
+            if len(due) >= limit:
+                break
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.pending_dir, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    message = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if self._due(message, now):
+                due.append((path, message))
+        return due
+
+    @staticmethod
+    def _expired(message, now):
+        return message.get('expires_at') is not None and message['expires_at'] <= now
+
+    @classmethod
+    def _due(cls, message, now):
+        return message['next_attempt'] <= now or cls._expired(message, now)
+
+    def send_batch(self):
+        """Send up to batch_size due messages over one connection, returns the number sent"""
+        due = self._due_messages(self.batch_size)
+        sent = 0
+        server = None
+        now = time.time()
+        for path, message in due:
+            if self._expired(message, now):
+                message['last_error'] = "expired before delivery"
+                self._fail(path, message)
+                continue
+            try:
+                if server is None:
+                    server = self._connection()
+                msg = MIMEText(message['body'])
+                msg['Subject'] = message['subject']
+                msg['From'] = message['from']
+                msg['To'] = message['to']
+                server.send_message(msg)
+                self._remove(path, message)
+                sent += 1
+            except Exception as e:
+                # Drop the connection so the next attempt reconnects cleanly
+                self._close()
+                self._reschedule(path, message, e)
+                break
+        return sent
+
+    def _reschedule(self, path, message, error):
+        message['attempts'] += 1
+        message['last_error'] = str(error)
+        if message['attempts'] >= self.max_retries:
+            self._fail(path, message)
+            return
+        delay = min(self.base_delay * (2 ** (message['attempts'] - 1)), self.max_delay)
+        message['next_attempt'] = time.time() + delay
+        if path is not None:
+            self._write(path, message)
+
+    def _remove(self, path, message):
+        if path is None:
+            with self._lock:
+                self._secret.pop(message['id'], None)
+        else:
+            os.remove(path)
+
+    def _fail(self, path, message):
+        """Record a message in outbox/failed, without the body of a secret one"""
+        record = dict(message, body=None) if message.get('secret') else message
+        self._write(os.path.join(self.failed_dir, f"{message['id']}.json"), record)
+        self._remove(path, message)
+
+    def _connection(self):
+        """Reuse the open SMTP connection when it is still alive"""
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    self._last_used = time.monotonic()
+                    return self._server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close()
+
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        self._server = server
+        self._last_used = time.monotonic()
+        return server
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from utils.table_reader import read_table
+
+
+class TablePrefetcher:
+    """Parse selected files in the background before a comparison asks for them
+
+    prefetch() starts a full parse of a file on a worker thread as soon as it
+    is selected; get() hands the comparison the finished (or still running)
+    parse instead of reading the file again. Entries are keyed by path, size
+    and mtime, so a file edited after it was selected is simply parsed again
+    by the caller. At most max_entries parsed tables are kept. row_index=True
+    also builds the CSV row-offset sidecar of each file it parses.
+    """
+
+    def __init__(self, max_workers=2, max_entries=4, row_index=False):
+        self.max_entries = max_entries
+        self.row_index = row_index
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(file_path):
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime_ns
+
+    def prefetch(self, file_path, callback=None):
+        """Start parsing file_path, returns its Future
+
+        callback(file_path, future) runs on the worker thread when the parse
+        finishes (successfully or not).
+        """
+        signature = self._signature(file_path)
+        with self._lock:
+            entry = self._futures.get(file_path)
+            if entry and entry[0] == signature:
+                self._futures.move_to_end(file_path)
+                future = entry[1]
+            else:
+                future = self._pool.submit(read_table, file_path, None, None, self.row_index)
+                self._futures[file_path] = (signature, future)
+                while len(self._futures) > self.max_entries:
+                    _, (_, old) = self._futures.popitem(last=False)
+                    old.cancel()
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(file_path, f))
+        return future
+
+    def get(self, file_path, usecols=None):
+        """The prefetched table (a copy, projected to usecols), or None
+
+        Waits for a parse that is still running. Returns None when the file
+        was never prefetched, has changed since, or failed to parse; the
+        caller then reads it itself.
+        """
+        with self._lock:
+            entry = self._futures.get(file_path)
+        if entry is None or entry[0] != self._signature(file_path):
+            return None
+        try:
+            df = entry[1].result()
+        except Exception:
+            return None
+        if usecols is not None:
+            if not all(c in df.columns for c in usecols):
+                return None
+            return df[list(usecols)].copy()
+        return df.copy()
+
+    def put(self, file_path, df):
+        """Register a table already in memory as the parse of file_path as it is now
+
+        Used after writing a file, so the next reader gets the written frame
+        instead of parsing the file back.
+        """
+        future = Future()
+        future.set_result(df)
+        with self._lock:
+            self._futures[file_path] = (self._signature(file_path), future)
+            self._futures.move_to_end(file_path)
+            while len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)
+
+    def discard(self, file_path):
+        with self._lock:
+            entry = self._futures.pop(file_path, None)
+        if entry:
+            entry[1].cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
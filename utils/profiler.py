@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+
+ENV_VAR = 'PRODUCTLOGGER_PROFILE'
+MODES = ('pstats', 'collapsed')
+
+_active = threading.local()
+
+
+def env_mode():
+    """Profiling mode requested through PRODUCTLOGGER_PROFILE, or None
+
+    "1"/"pstats" selects the deterministic profiler, "collapsed" the sampler.
+    """
+    value = os.environ.get(ENV_VAR, '').strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return None
+    return 'collapsed' if value == 'collapsed' else 'pstats'
+
+
+class RunProfiler:
+    """Profile one comparison run and write the result to results/profiles
+
+    mode='pstats' wraps the run in cProfile and dumps a .pstats file (open it
+    with pstats or snakeviz). mode='collapsed' samples the calling thread's
+    stack every `interval` seconds and writes one "frame;frame;... count" line
+    per stack, the input format of flamegraph.pl and speedscope. mode=None
+    disables profiling. Nested runs on the same thread are not profiled again.
+    """
+
+    def __init__(self, name, mode='pstats', output_dir=os.path.join('results', 'profiles'), interval=0.005):
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.name = name
+        self.mode = mode
+        self.output_dir = output_dir
+        self.interval = interval
+        self.output_path = None
+        self._profile = None
+        self._sampler = None
+        self._stop = threading.Event()
+        self._stacks = Counter()
+        self._owner = False
+
+    @classmethod
+    def from_env(cls, name):
+        return cls(name, env_mode())
+
+    def __enter__(self):
+        if self.mode is None or getattr(_active, 'running', False):
+            return self
+        _active.running = True
+        self._owner = True
+        self._started = time.perf_counter()
+        if self.mode == 'pstats':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            target = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, args=(target,),
+                                             name='run-profiler', daemon=True)
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._owner:
+            return False
+        try:
+            if self._profile is not None:
+                self._profile.disable()
+            if self._sampler is not None:
+                self._stop.set()
+                self._sampler.join()
+            self._write()
+        finally:
+            _active.running = False
+        return False
+
+    def _sample(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    def _write(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        base = os.path.join(self.output_dir, f"{self.name}_{timestamp}")
+        if self._profile is not None:
+            self.output_path = base + '.pstats'
+            self._profile.dump_stats(self.output_path)
+        else:
+            self.output_path = base + '.collapsed'
+            with open(self.output_path, 'w', encoding='utf-8') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        self.elapsed = time.perf_counter() - self._started
@@ -0,0 +1,120 @@
+import os
+import mmap
+
+import numpy as np
+
+
+SCAN_CHUNK = 64 * 1024 * 1024
+NEWLINE = ord('\n')
+QUOTE = ord('"')
+BLANK = np.array([ord(c) for c in ' \t\r\n'], dtype=np.uint8)
+
+
+class RowOffsetIndex:
+    """Sidecar byte-offset index of the rows of a CSV file
+
+    <file>.rowidx.npy holds the format version, file size and mtime followed
+    by the byte offset where every row starts (row 1 is the header), so any
+    row and its neighbours can be read straight from an mmap of the file.
+    Newlines inside quoted fields do not start a row, and blank lines are not
+    rows, as they are skipped by the CSV readers: row n + 2 of the file is
+    row n of the parsed frame. The sidecar is rebuilt whenever the CSV
+    changes.
+    """
+
+    SUFFIX = '.rowidx.npy'
+    VERSION = 2
+    # Encodings in which '\n' and '"' bytes never occur inside a multibyte character
+    BYTE_SAFE = ('utf-8', 'utf-8-sig', 'gb18030', 'gbk', 'latin-1', 'ascii')
+
+    def __init__(self, file_path, offsets, encoding='utf-8'):
+        self.file_path = file_path
+        self.offsets = offsets
+        self.encoding = encoding
+
+    @classmethod
+    def sidecar_path(cls, file_path):
+        return file_path + cls.SUFFIX
+
+    @staticmethod
+    def _signature(file_path):
+        st = os.stat(file_path)
+        return st.st_size, st.st_mtime_ns
+
+    @classmethod
+    def load(cls, file_path, encoding='utf-8'):
+        """Open an up-to-date sidecar (memory mapped), or None"""
+        path = cls.sidecar_path(file_path)
+        if not os.path.exists(path):
+            return None
+        data = np.load(path, mmap_mode='r')
+        if len(data) < 3 or tuple(int(v) for v in data[:3]) != (cls.VERSION,) + cls._signature(file_path):
+            return None
+        return cls(file_path, data[3:], encoding)
+
+    @classmethod
+    def ensure(cls, file_path, encoding='utf-8'):
+        """Load the sidecar, building it first when missing or stale
+
+        Returns None for encodings the byte scan cannot handle (e.g. UTF-16).
+        """
+        if encoding.lower() not in cls.BYTE_SAFE:
+            return None
+        return cls.load(file_path, encoding) or cls.build(file_path, encoding)
+
+    @classmethod
+    def build(cls, file_path, encoding='utf-8'):
+        """Scan the file once in chunks and write the sidecar"""
+        signature = cls._signature(file_path)
+        size = signature[0]
+        # Row starts, and the number of non-blank bytes before each of them
+        parts = [np.zeros(1, dtype=np.int64)]
+        filled = [np.zeros(1, dtype=np.int64)]
+        quotes_before = filled_before = 0
+        if size:
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start in range(0, size, SCAN_CHUNK):
+                    chunk = np.frombuffer(mm[start:start + SCAN_CHUNK], dtype=np.uint8)
+                    newlines = np.flatnonzero(chunk == NEWLINE)
+                    quotes = np.flatnonzero(chunk == QUOTE)
+                    # A newline ends a row only outside quotes: an even number of quotes precede it
+                    outside = (quotes_before + np.searchsorted(quotes, newlines)) % 2 == 0
+                    parts.append(newlines[outside].astype(np.int64) + start + 1)
+                    counts = np.cumsum(~np.isin(chunk, BLANK), dtype=np.int64)
+                    filled.append(counts[newlines[outside]] + filled_before)
+                    quotes_before += len(quotes)
+                    filled_before += int(counts[-1])
+
+        offsets = np.concatenate(parts)
+        filled = np.append(np.concatenate(filled), filled_before)
+        # Blank and whitespace-only lines (and the empty row after the final newline) are skipped
+        offsets = offsets[np.diff(filled) > 0]
+
+        path = cls.sidecar_path(file_path)
+        temp_path = path + '.tmp.npy'
+        header = np.array((cls.VERSION,) + signature, dtype=np.int64)
+        np.save(temp_path, np.concatenate([header, offsets]))
+        os.replace(temp_path, path)
+        return cls(file_path, offsets, encoding)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def lines(self, row, context=2):
+        """Raw text of file row `row` (1-based, header is row 1) and its neighbours
+
+        Returns [(row number, text)].
+        """
+        first = max(1, row - context)
+        last = min(len(self.offsets), row + context)
+        if first > last:
+            return []
+        size = os.path.getsize(self.file_path)
+        with open(self.file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            result = []
+            for r in range(first, last + 1):
+                lo = int(self.offsets[r - 1])
+                hi = int(self.offsets[r]) if r < len(self.offsets) else size
+                text = mm[lo:hi].decode(self.encoding, errors='replace')
+                result.append((r, text.rstrip(' \t\r\n')))  # with any blank lines after it
+        return result
@@ -0,0 +1,244 @@
+import os
+import uuid
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from logic.product_index import normalize_key
+
+
+KEY_COLUMN = '_product_key'
+# Prefix of the synthetic keys of blank-ID rows; normalize_key strips it, so no real ID has it
+BLANK_KEY_PREFIX = '\x1f'
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sql_value(value):
+    """Convert pandas/numpy scalars into values sqlite3 can bind"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.isoformat(sep=' ')
+    if value is pd.NaT:
+        return None
+    return value
+
+
+def _restore_dtypes(df, like):
+    """Give rows read back from SQLite the dtypes of the frame they are compared with
+
+    SQLite returns dates as the ISO text they were stored as and missing
+    values as None; the feed has Timestamps and NaN.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col not in like.columns:
+            continue
+        dtype = like[col].dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif pd.api.types.is_bool_dtype(dtype) and df[col].notna().all():
+            df[col] = df[col].astype(bool)
+        elif pd.api.types.is_numeric_dtype(dtype):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def product_key(value):
+    """Text form of a product ID used for the unique index (None for blank IDs)"""
+    return normalize_key(value)
+
+
+def _row_key(value):
+    """Index key of a stored row: blank IDs get a unique synthetic key"""
+    key = product_key(value)
+    return key if key is not None else BLANK_KEY_PREFIX + uuid.uuid4().hex
+
+
+class SQLiteProductStore:
+    """Product table in SQLite (WAL mode) shared by several app instances
+
+    Every product is one row keyed by a unique index on the text form of
+    column B. Rows with a blank ID cannot be matched: like the file DB, the
+    store adds each of them as a new product (under a synthetic key). Updates are bulk executemany upserts inside short IMMEDIATE
+    transactions, so concurrent clerks only lock the DB for the batch they
+    are writing and never rewrite rows they did not touch.
+    """
+
+    REPORT_PREFIX = '比对报告'
+
+    def __init__(self, db_path=os.path.join('data', 'products.sqlite'), timeout=30.0, batch_size=1000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(f'PRAGMA busy_timeout={int(timeout * 1000)}')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS store_meta (name TEXT PRIMARY KEY, value TEXT)')
+
+    def close(self):
+        self.conn.close()
+
+    def columns(self):
+        """Product columns in file order, or None before the first import"""
+        row = self.conn.execute("SELECT value FROM store_meta WHERE name = 'columns'").fetchone()
+        return row[0].split('\x1f') if row else None
+
+    def is_empty(self):
+        if self.columns() is None:
+            return True
+        return self.conn.execute('SELECT 1 FROM products LIMIT 1').fetchone() is None
+
+    def _ensure_table(self, columns):
+        existing = self.columns()
+        if existing is not None:
+            if existing != columns:
+                raise ValueError("Columns do not match the product store")
+            return
+        col_defs = ', '.join(_quote(c) for c in columns)
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS products ({_quote(KEY_COLUMN)} TEXT NOT NULL, '
+                              f'{col_defs}, _updated_at TEXT)')
+            self.conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS products_key ON products ({_quote(KEY_COLUMN)})')
+            self.conn.execute("INSERT OR REPLACE INTO store_meta VALUES ('columns', ?)", ('\x1f'.join(columns),))
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    @classmethod
+    def _product_columns(cls, df):
+        return [str(c) for c in df.columns if not str(c).startswith(cls.REPORT_PREFIX)]
+
+    def import_dataframe(self, df):
+        """Load (or merge) a whole table into the store"""
+        columns = self._product_columns(df)
+        self._ensure_table(columns)
+        self.upsert(df[columns])
+        return len(df)
+
+    def upsert(self, df):
+        """Insert or update rows by product ID in batches of short transactions"""
+        for start in range(0, len(df), self.batch_size):
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._upsert_in_transaction(df.iloc[start:start + self.batch_size])
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return len(df)
+
+    def fetch(self, product_ids, columns=None):
+        """Rows for the given product IDs (only the requested columns)"""
+        columns = columns or self.columns()
+        keys = list(dict.fromkeys(k for k in map(product_key, product_ids) if k is not None))
+        select = ', '.join(_quote(c) for c in [KEY_COLUMN] + list(columns))
+        frames = []
+        # Stay below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            sql = (f"SELECT {select} FROM products WHERE {_quote(KEY_COLUMN)} "
+                   f"IN ({', '.join('?' for _ in chunk)})")
+            frames.append(pd.read_sql_query(sql, self.conn, params=chunk))
+        if not frames:
+            return pd.DataFrame(columns=[KEY_COLUMN] + list(columns))
+        return pd.concat(frames, ignore_index=True)
+
+    def to_dataframe(self):
+        """Export the whole store in the original column layout"""
+        columns = self.columns() or []
+        select = ', '.join(_quote(c) for c in columns)
+        return pd.read_sql_query(f'SELECT {select} FROM products ORDER BY rowid', self.conn)
+
+    def count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def apply_feed(self, input_df, compiled, columns=None, stats=None):
+        """Compare a feed with the store and upsert only new and changed rows
+
+        Each batch is read and written inside one IMMEDIATE transaction, so a
+        concurrent instance can never update the same products in between.
+        Returns (new rows, [(product_id, diff columns, old row, new row)], unchanged count);
+        rows with a blank ID are always new.
+        stats (a DiffStats) is fed with each batch's difference mask.
+        """
+        store_columns = self.columns()
+        columns = list(columns or store_columns)
+        key = store_columns[1]
+        new_rows = []
+        changed = []
+        unchanged = 0
+
+        for start in range(0, len(input_df), self.batch_size):
+            batch = input_df.iloc[start:start + self.batch_size]
+            batch_keys = batch.iloc[:, 1].map(product_key)
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                current = self.fetch(batch.iloc[:, 1].tolist(), store_columns)
+                current = current.drop_duplicates(KEY_COLUMN).set_index(KEY_COLUMN)
+                current = _restore_dtypes(current, batch)
+                aligned = current.reindex(batch_keys.to_numpy())
+                found = batch_keys.isin(current.index).to_numpy()
+                aligned[key] = batch.iloc[:, 1].to_numpy()
+
+                mask = compiled.differs(aligned[compiled.columns], batch[compiled.columns]).to_numpy()
+                mask[~found] = False
+                if stats is not None:
+                    stats.add(aligned, batch, pd.DataFrame(mask, columns=compiled.columns))
+                to_write = []
+                for i in range(len(batch)):
+                    row = batch.iloc[i]
+                    if not found[i]:
+                        new_rows.append(row)
+                        to_write.append(i)
+                    elif mask[i].any():
+                        diff_cols = [c for c, d in zip(compiled.columns, mask[i]) if d]
+                        changed.append((row.iloc[1], diff_cols, aligned.iloc[i], row))
+                        to_write.append(i)
+                    else:
+                        unchanged += 1
+
+                if to_write:
+                    new_pos = [i for i in to_write if not found[i]]
+                    changed_pos = [i for i in to_write if found[i]]
+                    if new_pos:
+                        self._upsert_in_transaction(batch.iloc[new_pos][store_columns])
+                    if changed_pos:
+                        # Unselected columns keep their stored values
+                        merged = aligned.iloc[changed_pos][store_columns].copy()
+                        for c in columns:
+                            merged[c] = batch.iloc[changed_pos][c].to_numpy()
+                        self._upsert_in_transaction(merged)
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+
+        return new_rows, changed, unchanged
+
+    def _upsert_in_transaction(self, df):
+        """One executemany upsert; the caller owns the transaction"""
+        columns = [str(c) for c in df.columns]
+        names = [KEY_COLUMN] + columns + ['_updated_at']
+        updates = ', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in columns + ['_updated_at'])
+        sql = (f"INSERT INTO products ({', '.join(_quote(c) for c in names)}) "
+               f"VALUES ({', '.join('?' for _ in names)}) "
+               f"ON CONFLICT({_quote(KEY_COLUMN)}) DO UPDATE SET {updates}")
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.conn.executemany(sql, [[_row_key(r[1])] + [_sql_value(v) for v in r] + [now]
+                                    for r in df.itertuples(index=False, name=None)])
@@ -0,0 +1,406 @@
+import io
+import os
+import csv
+import codecs
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.row_index import RowOffsetIndex
+
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_BYTES = 64 * 1024
+DELIMITERS = ',\t;|'
+
+
+def _pyarrow_csv():
+    """pyarrow's multithreaded CSV reader, or None when pyarrow is not installed"""
+    try:
+        from pyarrow import csv as pa_csv
+    except ImportError:
+        return None
+    return pa_csv
+
+
+def _decodes(sample, encoding):
+    # A sample cut mid-character must not count as a decoding failure
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def sniff_csv(file_path):
+    """Detect (encoding, delimiter) of a CSV file from a sampled prefix
+
+    BOMs are honoured; otherwise UTF-8 is tried first and GB18030 (a superset
+    of the GBK our ERP exports) second. The delimiter is sniffed from the
+    first decoded lines.
+    """
+    with open(file_path, 'rb') as f:
+        return sniff_sample(f.read(SAMPLE_BYTES))
+
+
+def sniff_sample(sample):
+    """(encoding, delimiter) of CSV data from its first SAMPLE_BYTES bytes"""
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = 'utf-16'
+    elif _decodes(sample, 'utf-8'):
+        encoding = 'utf-8'
+    elif _decodes(sample, 'gb18030'):
+        encoding = 'gb18030'
+    else:
+        encoding = 'latin-1'
+
+    text = sample.decode(encoding, errors='ignore')
+    lines = text.splitlines()[:20]
+    if len(sample) == SAMPLE_BYTES and len(lines) > 1:
+        lines = lines[:-1]  # the last sampled line may be cut off
+    try:
+        delimiter = csv.Sniffer().sniff('\n'.join(lines), delimiters=DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+    return encoding, delimiter
+
+
+def read_csv(file_path, usecols=None, nrows=None, row_index=False):
+    """Parse a CSV file with the detected encoding and delimiter
+
+    Uses pyarrow's multithreaded reader when it is installed (falling back to
+    pandas for anything it rejects) and pd.read_csv otherwise. Both return
+    the same frame: the same missing values, dates and times left as text.
+    row_index=True also builds the RowOffsetIndex sidecar if it is missing;
+    the file is still read when the sidecar cannot be written or loaded
+    (e.g. a read-only folder or a truncated sidecar).
+    """
+    encoding, delimiter = sniff_csv(file_path)
+    if row_index:
+        try:
+            RowOffsetIndex.ensure(file_path, encoding)
+        except (OSError, ValueError) as e:
+            logger.warning("Row index for %s not available, reading without it: %s", file_path, e)
+    pa_csv = _pyarrow_csv()
+    if pa_csv is not None and nrows is None:
+        try:
+            return _read_csv_arrow(pa_csv, file_path, encoding, delimiter, usecols)
+        except Exception:
+            pass
+    return pd.read_csv(file_path, usecols=usecols, nrows=nrows, encoding=encoding, sep=delimiter)
+
+
+def _read_csv_arrow(pa_csv, file_path, encoding, delimiter, usecols=None):
+    """read_csv through pyarrow, converted to what pd.read_csv returns"""
+    import pyarrow as pa
+    from pandas._libs.parsers import STR_NA_VALUES
+
+    def read(column_types):
+        return pa_csv.read_csv(
+            file_path,
+            read_options=pa_csv.ReadOptions(use_threads=True, encoding=encoding),
+            parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=list(usecols) if usecols is not None else None,
+                column_types=column_types,
+                null_values=sorted(STR_NA_VALUES),
+                true_values=['True', 'TRUE', 'true'],
+                false_values=['False', 'FALSE', 'false'],
+                strings_can_be_null=True,
+                timestamp_parsers=[]))
+
+    table = read({})
+    # pyarrow infers ISO dates and times whatever the timestamp parsers;
+    # pd.read_csv keeps them as text, so those columns are read again as strings
+    temporal = {field.name: pa.string() for field in table.schema if pa.types.is_temporal(field.type)}
+    if temporal:
+        table = read(temporal)
+    # Columns without any value are float NaN in pandas
+    for i, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.float64()))
+    df = table.to_pandas()
+    # Missing text cells come back as None; pd.read_csv has NaN there
+    for col in df.columns[(df.dtypes == object).to_numpy()]:
+        df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def read_buffer(buffer, usecols=None):
+    """Parse an xlsx/csv table from bytes or a binary file-like object
+
+    The format is told from the content (xlsx files are zip archives), so
+    nothing needs a file name or touches the disk.
+    """
+    data = buffer if isinstance(buffer, (bytes, bytearray)) else buffer.read()
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if data[:4] == b'PK\x03\x04':
+        return pd.read_excel(io.BytesIO(data), usecols=usecols)
+    encoding, delimiter = sniff_sample(data[:SAMPLE_BYTES])
+    return pd.read_csv(io.BytesIO(data), usecols=usecols, encoding=encoding, sep=delimiter)
+
+
+def _open_workbook(file_path):
+    from openpyxl import load_workbook
+    return load_workbook(file_path, read_only=True, data_only=True)
+
+
+def _worksheet(wb, sheet_name):
+    return wb.worksheets[0] if sheet_name is None else wb[sheet_name]
+
+
+def sheet_names(file_path):
+    """Sheet names of an xlsx file (a csv file is one unnamed sheet)"""
+    if not file_path.endswith('.xlsx'):
+        return [None]
+    wb = _open_workbook(file_path)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def read_header(file_path, sheet_name=None):
+    """Read only the header row of an xlsx/csv file"""
+    if file_path.endswith('.xlsx'):
+        wb = _open_workbook(file_path)
+        try:
+            return _sheet_header(_worksheet(wb, sheet_name))
+        finally:
+            wb.close()
+    return list(read_csv(file_path, nrows=0).columns)
+
+
+def _sheet_header(ws):
+    for row in ws.iter_rows(min_row=1, max_row=1, values_only=True):
+        return _trim_trailing_none(row)
+    return []
+
+
+def _trim_trailing_none(row):
+    row = list(row)
+    while row and row[-1] is None:
+        row.pop()
+    return row
+
+
+def projection(header, key_index=1, columns=None, exclude_prefix=None, strict=True):
+    """Key column (column B by default) plus the compared columns, in file order
+
+    The columns before the key are always kept too, so the key stays at
+    key_index in the projected frame (the comparison code finds it by
+    position). With strict=False selected columns missing from this header
+    are skipped instead of raising (used for workbooks whose sheets differ in
+    layout).
+    """
+    key = header[key_index]
+    leading = set(header[:key_index + 1])
+    if columns:
+        wanted = set(columns) | leading
+        missing = [c for c in columns if c not in header]
+        if missing and strict:
+            raise ValueError(f"Columns not found: {', '.join(map(str, missing))}")
+    else:
+        wanted = set(header)
+    if exclude_prefix:
+        wanted = {c for c in wanted if c in leading or not str(c).startswith(exclude_prefix)}
+    return [c for c in header if c in wanted]
+
+
+def read_table(file_path, usecols=None, sheet_name=None, row_index=False):
+    """Load an xlsx/csv file, parsing only the requested columns
+
+    row_index=True builds the CSV row-offset sidecar (ignored for xlsx).
+    """
+    if not file_path.endswith('.xlsx'):
+        return read_csv(file_path, usecols=usecols, row_index=row_index)
+    return read_xlsx(file_path, usecols, sheet_name)
+
+
+class UnsupportedSheet(Exception):
+    """An xlsx engine cannot reproduce pd.read_excel for this sheet; try the next one"""
+
+
+def _check_header(header):
+    # pd.read_excel renames blank and duplicate headers; leave those sheets to it
+    if any(c is None for c in header) or len(set(header)) != len(header):
+        raise UnsupportedSheet("blank or duplicate column names")
+
+
+def _read_xlsx_calamine(file_path, usecols, sheet_name):
+    """Rust calamine reader (pip install python-calamine)"""
+    from python_calamine import CalamineWorkbook
+    wb = CalamineWorkbook.from_path(file_path)
+    name = wb.sheet_names[0] if sheet_name is None else sheet_name
+    rows = wb.get_sheet_by_name(name).to_python(skip_empty_area=False)
+    if not rows:
+        return pd.DataFrame(columns=list(usecols or []))
+    # calamine returns '' for empty cells and floats for every number
+    rows = [[None if v == '' else int(v) if isinstance(v, float) and v.is_integer() else v
+             for v in row] for row in rows]
+    header = _trim_trailing_none(rows[0])
+    if usecols is None:
+        _check_header(header)
+    return _frame_from_rows(header, rows[1:], list(usecols or header))
+
+
+def _read_xlsx_openpyxl(file_path, usecols, sheet_name):
+    """openpyxl read-only streaming straight into column lists"""
+    wb = _open_workbook(file_path)
+    try:
+        ws = _worksheet(wb, sheet_name)
+        if usecols is None:
+            header = _sheet_header(ws)
+            _check_header(header)
+            usecols = header
+        return _read_sheet_columns(ws, usecols)
+    finally:
+        wb.close()
+
+
+def _read_xlsx_pandas(file_path, usecols, sheet_name):
+    """pd.read_excel, the reference behaviour"""
+    return pd.read_excel(file_path, sheet_name=sheet_name or 0,
+                         usecols=list(usecols) if usecols is not None else None)
+
+
+# Tried in order; an engine that is not installed or raises is skipped
+XLSX_ENGINES = {
+    'calamine': _read_xlsx_calamine,
+    'openpyxl': _read_xlsx_openpyxl,
+    'pandas': _read_xlsx_pandas,
+}
+XLSX_ENGINE_ENV = 'PRODUCTLOGGER_XLSX_ENGINE'
+
+
+def register_xlsx_engine(name, reader, first=True):
+    """Add an xlsx engine reader(file_path, usecols, sheet_name) -> DataFrame"""
+    global XLSX_ENGINES
+    engines = {k: v for k, v in XLSX_ENGINES.items() if k != name}
+    XLSX_ENGINES = {name: reader, **engines} if first else {**engines, name: reader}
+
+
+def xlsx_engines():
+    """Engine names in the order they are tried
+
+    PRODUCTLOGGER_XLSX_ENGINE (comma separated) overrides the default order;
+    pandas always stays last as the fallback.
+    """
+    wanted = [e.strip() for e in os.environ.get(XLSX_ENGINE_ENV, '').split(',') if e.strip()]
+    order = [e for e in wanted if e in XLSX_ENGINES] or list(XLSX_ENGINES)
+    return order if 'pandas' in order else order + ['pandas']
+
+
+def read_xlsx(file_path, usecols=None, sheet_name=None, engines=None):
+    """Read one sheet with the first engine that can handle it"""
+    error = None
+    engines = engines or xlsx_engines()
+    for name in engines:
+        try:
+            return XLSX_ENGINES[name](file_path, usecols, sheet_name)
+        except ImportError:
+            continue
+        except Exception as e:
+            error = e
+    raise error or ImportError(f"No xlsx engine installed among: {', '.join(engines)}")
+
+
+def source_lines(file_path, row, context=2):
+    """Raw lines around file row `row` of a CSV, via its row-offset index
+
+    Returns [(row number, text)], or None when the file is not a CSV or its
+    encoding cannot be indexed.
+    """
+    if file_path.endswith('.xlsx'):
+        return None
+    index = RowOffsetIndex.ensure(file_path, sniff_csv(file_path)[0])
+    return index.lines(row, context) if index is not None else None
+
+
+def read_workbook(file_path, columns=None):
+    """Load every sheet of a workbook in one pass over the file
+
+    Returns {sheet name: DataFrame}. With a column selection each sheet is
+    projected to its key column plus the selected columns it contains.
+    """
+    if not file_path.endswith('.xlsx'):
+        return {None: read_table(file_path, projection(read_header(file_path), columns=columns)
+                                 if columns else None)}
+    wb = _open_workbook(file_path)
+    try:
+        frames = {}
+        for ws in wb.worksheets:
+            header = _sheet_header(ws)
+            if not columns:
+                try:
+                    _check_header(header)
+                    frames[ws.title] = _read_sheet_columns(ws, header)
+                except UnsupportedSheet:
+                    frames[ws.title] = pd.read_excel(file_path, sheet_name=ws.title)
+                continue
+            if len(header) < 2:
+                frames[ws.title] = pd.DataFrame(columns=header)
+                continue
+            frames[ws.title] = _read_sheet_columns(ws, projection(header, columns=columns, strict=False))
+        return frames
+    finally:
+        wb.close()
+
+
+def _read_sheet_columns(ws, usecols):
+    """Stream a read-only worksheet and keep only the wanted columns
+
+    Cells outside the min/max wanted column are never materialized, and the
+    rest are dropped while streaming, so memory grows with the projection
+    rather than the full sheet width.
+    """
+    usecols = list(usecols)
+    header = _sheet_header(ws)
+    positions = [header.index(c) for c in usecols]
+    if not positions:
+        return pd.DataFrame(columns=usecols)
+    min_col, max_col = min(positions), max(positions)
+    rows = ws.iter_rows(min_row=2, min_col=min_col + 1, max_col=max_col + 1, values_only=True)
+    if sorted(positions) == list(range(min_col, max_col + 1)):
+        # Contiguous block (e.g. the whole sheet): keep row tuples as they are
+        return _frame_from_rows(header[min_col:max_col + 1], rows, usecols)
+
+    offsets = [p - min_col for p in positions]
+    picked = ([row[o] if o < len(row) else None for o in offsets] for row in rows)
+    return _frame_from_rows(usecols, picked, usecols)
+
+
+def _frame_from_rows(header, rows, usecols):
+    """DataFrame of the usecols of row sequences laid out like header"""
+    rows = [tuple(row) for row in rows]
+    # Trailing blank rows are formatting leftovers, pd.read_excel drops them too
+    last = len(rows)
+    while last and all(v is None for v in rows[last - 1]):
+        last -= 1
+    width = len(header)
+    rows = [row[:width] if len(row) >= width else row + (None,) * (width - len(row)) for row in rows[:last]]
+    df = pd.DataFrame.from_records(rows, columns=header, coerce_float=False) if rows \
+        else pd.DataFrame(columns=header)
+    return _infer_like_read_excel(df[usecols])
+
+
+def _infer_like_read_excel(df):
+    """Apply the dtype conversion pd.read_excel's text parser performs
+
+    Columns whose values are all numbers or numeric text become numeric
+    (so "003" reads as 3, as in pandas), other object columns get NaN for
+    empty cells instead of None.
+    """
+    df = df.infer_objects()
+    for col in df.columns[df.dtypes.to_numpy() == object]:
+        values = df[col]
+        try:
+            df[col] = pd.to_numeric(values)
+        except (ValueError, TypeError):
+            df[col] = values.where(values.notna(), np.nan)
+    return df